@@ -0,0 +1,480 @@
+"""ACME (RFC 8555) accounts, orders and challenges issuing through Ca, the HTTP side is in core.views.acme"""
+import base64
+import datetime
+import hashlib
+import ipaddress
+import json
+import logging
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.x509.oid import NameOID
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from core import crl
+from core import crt_metadata
+from core import models
+from core.issuance import CaError
+from core.utils import Ca
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_ALGORITHMS = {
+    'RS256': (rsa.RSAPublicKey, hashes.SHA256),
+    'ES256': (ec.EllipticCurvePublicKey, hashes.SHA256),
+    'ES384': (ec.EllipticCurvePublicKey, hashes.SHA384),
+    'EdDSA': (ed25519.Ed25519PublicKey, None),
+}
+JWK_CURVES = {
+    'P-256': ec.SECP256R1,
+    'P-384': ec.SECP384R1,
+}
+# members of the RFC 7638 thumbprint by key type
+THUMBPRINT_MEMBERS = {
+    'RSA': ('e', 'kty', 'n'),
+    'EC': ('crv', 'kty', 'x', 'y'),
+    'OKP': ('crv', 'kty', 'x'),
+}
+# RFC 5280 CRLReason codes of revokeCert requests
+REVOCATION_REASONS = {
+    0: models.Revocation.UNSPECIFIED,
+    1: models.Revocation.KEY_COMPROMISE,
+    2: models.Revocation.CA_COMPROMISE,
+    3: models.Revocation.AFFILIATION_CHANGED,
+    4: models.Revocation.SUPERSEDED,
+    5: models.Revocation.CESSATION_OF_OPERATION,
+    6: models.Revocation.CERTIFICATE_HOLD,
+    9: models.Revocation.PRIVILEGE_WITHDRAWN,
+}
+
+_lock = threading.Lock()
+_cleaned = 0
+
+
+class AcmeError(Exception):
+    """Problem document of an ACME error, type is the part after urn:ietf:params:acme:error:"""
+
+    def __init__(self, type, detail, status=400):
+        super().__init__(detail)
+        self.type = type
+        self.detail = detail
+        self.status = status
+
+
+class Jws:
+
+    def __init__(self, protected, payload, jwk, account=None):
+        self.protected = protected
+        self.payload = payload
+        self.jwk = jwk
+        self.account = account
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64decode(value):
+    if not isinstance(value, str):
+        raise ValueError('base64url value must be a string')
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def new_nonce():
+    _delete_expired_nonces()
+    value = b64encode(secrets.token_bytes(16))
+    models.AcmeNonce.objects.create(value=value)
+    return value
+
+
+def use_nonce(value):
+    """Consume a nonce, False if it is unknown, already used or older than ACME_NONCE_TIMEOUT"""
+    if not isinstance(value, str):
+        return False
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.ACME_NONCE_TIMEOUT)
+    deleted, _ = models.AcmeNonce.objects.filter(value=value, date_created__gt=cutoff).delete()
+    return deleted == 1
+
+
+def parse(body, url):
+    """Verify a flattened JWS request sent to url and return its Jws
+
+    The nonce is consumed first, so a replayed request fails even with a valid signature. Requests
+    signed with a "kid" are checked against the stored key of that account, those with a "jwk"
+    (newAccount, revokeCert) against the key they carry.
+    """
+    try:
+        jws = json.loads(body)
+        protected = json.loads(b64decode(jws['protected']))
+        payload = jws['payload']
+        signature = b64decode(jws['signature'])
+        if not isinstance(protected, dict) or not isinstance(payload, str):
+            raise ValueError('protected must be an object and payload a string')
+    except (ValueError, KeyError, TypeError):
+        raise AcmeError('malformed', 'Request is not a flattened JWS')
+
+    if not use_nonce(protected.get('nonce')):
+        raise AcmeError('badNonce', 'Nonce is missing, used or expired')
+    if protected.get('url') != url:
+        raise AcmeError('unauthorized', 'JWS url does not match the request URL', 401)
+    alg = protected.get('alg')
+    if alg not in SIGNATURE_ALGORITHMS:
+        raise AcmeError('badSignatureAlgorithm', 'Supported algorithms are {}'.format(', '.join(SIGNATURE_ALGORITHMS)))
+    if ('jwk' in protected) == ('kid' in protected):
+        raise AcmeError('malformed', 'JWS must carry exactly one of jwk and kid')
+
+    account = None
+    if 'kid' in protected:
+        account = account_by_url(protected['kid'])
+        jwk = account.jwk
+    else:
+        jwk = protected['jwk']
+    _verify(load_jwk(jwk), alg, signature, '{}.{}'.format(jws['protected'], payload).encode())
+
+    try:
+        payload = json.loads(b64decode(payload)) if payload else None
+    except ValueError:
+        raise AcmeError('malformed', 'Payload is not JSON')
+    if payload is not None and not isinstance(payload, dict):
+        raise AcmeError('malformed', 'Payload must be an object')
+    return Jws(protected, payload, jwk, account)
+
+
+def account_by_url(url):
+    try:
+        match = resolve(urlparse(url).path)
+    except (Resolver404, ValueError, AttributeError):
+        match = None
+    if match is None or match.url_name != 'acme_account':
+        raise AcmeError('accountDoesNotExist', 'Unknown account {}'.format(url))
+    account = models.AcmeAccount.objects.filter(pk=match.kwargs['pk']).first()
+    if account is None:
+        raise AcmeError('accountDoesNotExist', 'Unknown account {}'.format(url))
+    if account.status != models.AcmeAccount.VALID:
+        raise AcmeError('unauthorized', 'Account is deactivated', 401)
+    return account
+
+
+def load_jwk(jwk):
+    try:
+        if jwk['kty'] == 'RSA':
+            key = rsa.RSAPublicNumbers(_int(jwk['e']), _int(jwk['n'])).public_key()
+            if key.key_size < 2048:
+                raise AcmeError('badPublicKey', 'RSA keys must have at least 2048 bits')
+            return key
+        if jwk['kty'] == 'EC':
+            return ec.EllipticCurvePublicNumbers(_int(jwk['x']), _int(jwk['y']), JWK_CURVES[jwk['crv']]()).public_key()
+        if jwk['kty'] == 'OKP' and jwk['crv'] == 'Ed25519':
+            return ed25519.Ed25519PublicKey.from_public_bytes(b64decode(jwk['x']))
+    except (KeyError, TypeError, ValueError):
+        pass
+    raise AcmeError('badPublicKey', 'Unsupported or invalid JWK')
+
+
+def thumbprint(jwk):
+    members = {name: jwk[name] for name in THUMBPRINT_MEMBERS[jwk['kty']]}
+    return b64encode(hashlib.sha256(json.dumps(members, sort_keys=True, separators=(',', ':')).encode()).digest())
+
+
+def new_account(jws):
+    """Return (AcmeAccount, created) for the key of a newAccount request"""
+    payload = jws.payload or {}
+    if jws.account is not None:
+        raise AcmeError('malformed', 'newAccount must be signed with a jwk')
+    account = models.AcmeAccount.objects.filter(thumbprint=thumbprint(jws.jwk)).first()
+    if account is not None:
+        return account, False
+    if payload.get('onlyReturnExisting'):
+        raise AcmeError('accountDoesNotExist', 'No account for this key')
+
+    try:
+        with transaction.atomic():
+            return models.AcmeAccount.objects.create(
+                thumbprint=thumbprint(jws.jwk), jwk=jws.jwk, contact=_contact(payload)), True
+    except IntegrityError:
+        # a concurrent newAccount with the same key won
+        return models.AcmeAccount.objects.get(thumbprint=thumbprint(jws.jwk)), False
+
+
+def update_account(account, payload):
+    if not payload:
+        return account
+    if 'contact' in payload:
+        account.contact = _contact(payload)
+    if payload.get('status') == models.AcmeAccount.DEACTIVATED:
+        account.status = models.AcmeAccount.DEACTIVATED
+    account.save()
+    return account
+
+
+def new_order(account, payload):
+    """Create an order with an authorization per identifier, reusing valid ones of the account"""
+    identifiers = _identifiers((payload or {}).get('identifiers'))
+    now = timezone.now()
+    with transaction.atomic():
+        order = models.AcmeOrder.objects.create(
+            account=account,
+            identifiers=identifiers,
+            expires=now + datetime.timedelta(seconds=settings.ACME_ORDER_TIMEOUT),
+        )
+        for identifier in identifiers:
+            authorization = account.authorizations.filter(
+                identifier_type=identifier['type'], identifier=identifier['value'],
+                status=models.AcmeAuthorization.VALID, expires__gt=now).order_by('-expires').first()
+            if authorization is None:
+                authorization = account.authorizations.create(
+                    identifier_type=identifier['type'],
+                    identifier=identifier['value'],
+                    token=b64encode(secrets.token_bytes(32)),
+                    expires=now + datetime.timedelta(seconds=settings.ACME_AUTHORIZATION_TIMEOUT),
+                )
+            order.authorizations.add(authorization)
+        _update_order(order)
+    return order
+
+
+def respond_challenge(authorization, jwk, remote_addr):
+    """Validate the http-01 challenge of a pending authorization
+
+    With ACME_CHALLENGE = 'auto' a client in ACME_TRUSTED_NETWORKS is approved without a fetch,
+    otherwise the key authorization is fetched from the identifier on ACME_HTTP01_PORT.
+    """
+    if authorization.status != models.AcmeAuthorization.PENDING:
+        return authorization
+    key_authorization = '{}.{}'.format(authorization.token, thumbprint(jwk))
+
+    if settings.ACME_CHALLENGE == 'auto':
+        error = None if _is_trusted(remote_addr) else 'Client {} is not in a trusted network'.format(remote_addr)
+    else:
+        error = _check_http01(authorization, key_authorization)
+
+    authorization.status = models.AcmeAuthorization.INVALID if error else models.AcmeAuthorization.VALID
+    authorization.error = error or ''
+    authorization.date_validated = timezone.now()
+    authorization.save()
+    for order in authorization.orders.filter(status=models.AcmeOrder.PENDING):
+        _update_order(order)
+    return authorization
+
+
+def finalize(order, payload):
+    """Sign the CSR of a ready order, which must name exactly the identifiers of the order"""
+    expire(order)
+    if order.status != models.AcmeOrder.READY:
+        raise AcmeError('orderNotReady', 'Order is {}'.format(order.status), 403)
+    try:
+        csr = x509.load_der_x509_csr(b64decode((payload or {})['csr']))
+    except (KeyError, ValueError):
+        raise AcmeError('badCSR', 'csr must be a base64url DER certificate signing request')
+    identifiers = {identifier['value'] for identifier in order.identifiers}
+    if _csr_names(csr) != identifiers:
+        raise AcmeError('badCSR', 'CSR names must be {}'.format(', '.join(sorted(identifiers))))
+    cn = order.identifiers[0]['value']
+    pk = _replaceable_site_crt(order.account, cn)
+    if pk is None:
+        order.status = models.AcmeOrder.INVALID
+        order.error = 'A certificate for {} is managed outside this account'.format(cn)
+        order.save()
+        raise AcmeError('rejectedIdentifier', order.error, 403)
+
+    # only one finalize request of an order signs
+    if not models.AcmeOrder.objects.filter(pk=order.pk, status=models.AcmeOrder.READY) \
+            .update(status=models.AcmeOrder.PROCESSING):
+        raise AcmeError('orderNotReady', 'Order is already being finalized', 403)
+
+    validity_period = datetime.date.today() + datetime.timedelta(days=settings.ACME_VALIDITY_PERIOD)
+    try:
+        site_crt = Ca().sign_csr(csr.public_bytes(serialization.Encoding.PEM), validity_period,
+                                 cn=cn, pk=pk, alt_names=sorted(identifiers))
+    except CaError as e:
+        _fail(order, str(e))
+        raise AcmeError('badCSR', str(e))
+    except Exception:
+        logger.exception('Finalizing ACME order %s failed', order.pk)
+        _fail(order, 'Certificate could not be issued')
+        raise AcmeError('serverInternal', order.error, 500)
+
+    order.site_crt = site_crt
+    order.crt = site_crt.crt + models.RootCrt.objects.get().crt
+    order.status = models.AcmeOrder.VALID
+    order.save()
+    return order
+
+
+def _fail(order, error):
+    order.status = models.AcmeOrder.INVALID
+    order.error = error
+    order.save()
+
+
+def _replaceable_site_crt(account, cn):
+    """pk of the SiteCrt a new order of account for cn replaces, 0 when there is none and None when cn is taken
+
+    Only a certificate without a stored key that was issued to an order of the same account is replaced,
+    keys generated here and certificates of other accounts are left alone.
+    """
+    site_crt = models.SiteCrt.objects.filter(cn=cn).only('pk', 'key').first()
+    if site_crt is None:
+        return 0
+    if site_crt.key is None and site_crt.acme_orders.filter(account=account).exists():
+        return site_crt.pk
+    return None
+
+
+def revoke(jws):
+    """Revoke a certificate issued to the account signing the request or signed with the certificate key"""
+    payload = jws.payload or {}
+    try:
+        crt = x509.load_der_x509_certificate(b64decode(payload['certificate']))
+    except (KeyError, ValueError):
+        raise AcmeError('malformed', 'certificate must be a base64url DER certificate')
+    reason = payload.get('reason', 0)
+    if not isinstance(reason, int) or reason not in REVOCATION_REASONS:
+        raise AcmeError('badRevocationReason', 'Unsupported revocation reason {}'.format(reason))
+
+    # the serial alone is chosen by whoever made the certificate, the stored one has to match as a whole
+    site_crt = models.SiteCrt.objects.filter(serial=format(crt.serial_number, 'X')).first()
+    if site_crt is None or site_crt.crt_der != crt.public_bytes(serialization.Encoding.DER):
+        raise AcmeError('malformed', 'Certificate was not issued by this server', 404)
+    if jws.account is not None:
+        authorized = site_crt.acme_orders.filter(account=jws.account).exists()
+    else:
+        authorized = crt_metadata.public_key_bytes(load_jwk(jws.jwk)) == crt_metadata.public_key_bytes(crt.public_key())
+    if not authorized:
+        raise AcmeError('unauthorized', 'Not authorized to revoke this certificate', 403)
+
+    try:
+        crl.revoke(site_crt, REVOCATION_REASONS[reason])
+    except CaError as e:
+        raise AcmeError('alreadyRevoked', str(e))
+
+
+def expire(obj):
+    """Mark a pending or ready order, or a pending authorization, invalid once past its expires"""
+    if obj.status in (models.AcmeOrder.PENDING, models.AcmeOrder.READY) and obj.expires <= timezone.now():
+        obj.status = models.AcmeOrder.INVALID
+        obj.save(update_fields=['status'])
+    return obj
+
+
+def _update_order(order):
+    statuses = set(order.authorizations.values_list('status', flat=True))
+    if models.AcmeAuthorization.INVALID in statuses:
+        order.status = models.AcmeOrder.INVALID
+    elif statuses == {models.AcmeAuthorization.VALID}:
+        order.status = models.AcmeOrder.READY
+    order.save(update_fields=['status'])
+
+
+def _identifiers(identifiers):
+    if not isinstance(identifiers, list) or not identifiers:
+        raise AcmeError('malformed', 'Order must have identifiers')
+    if len(identifiers) > settings.SITE_CRT_MAX_ALT_NAMES:
+        raise AcmeError('rejectedIdentifier', 'No more than {} identifiers per order'.format(
+            settings.SITE_CRT_MAX_ALT_NAMES))
+
+    result = []
+    for identifier in identifiers:
+        if not isinstance(identifier, dict) or not isinstance(identifier.get('value'), str):
+            raise AcmeError('malformed', 'Identifier must be an object with a type and a value')
+        if identifier.get('type') not in ('dns', 'ip'):
+            raise AcmeError('unsupportedIdentifier', 'Identifier type must be dns or ip')
+        try:
+            kind, value = crt_metadata.alt_name(identifier['value']).split(':', 1)
+        except ValueError as e:
+            raise AcmeError('rejectedIdentifier', str(e))
+        # http-01 cannot prove control of a wildcard
+        if kind.lower() != identifier['type'] or '*' in value:
+            raise AcmeError('rejectedIdentifier', 'Invalid {} identifier {}'.format(identifier['type'], value))
+        if {'type': identifier['type'], 'value': value} not in result:
+            result.append({'type': identifier['type'], 'value': value})
+    return result
+
+
+def _contact(payload):
+    contact = payload.get('contact', [])
+    if not isinstance(contact, list) or not all(isinstance(c, str) and c.startswith('mailto:') for c in contact):
+        raise AcmeError('invalidContact', 'contact must be a list of mailto: URLs')
+    return contact
+
+
+def _csr_names(csr):
+    names = {attribute.value.lower() for attribute in csr.subject.get_attributes_for_oid(NameOID.COMMON_NAME)}
+    try:
+        san = csr.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return names
+    names.update(name.lower() for name in san.get_values_for_type(x509.DNSName))
+    names.update(str(address) for address in san.get_values_for_type(x509.IPAddress))
+    return names
+
+
+def _verify(key, alg, signature, data):
+    key_class, hash_class = SIGNATURE_ALGORITHMS[alg]
+    if not isinstance(key, key_class):
+        raise AcmeError('badSignatureAlgorithm', '{} does not match the key type'.format(alg))
+    try:
+        if isinstance(key, rsa.RSAPublicKey):
+            key.verify(signature, data, padding.PKCS1v15(), hash_class())
+        elif isinstance(key, ec.EllipticCurvePublicKey):
+            size = (key.curve.key_size + 7) // 8
+            if len(signature) != 2 * size:
+                raise InvalidSignature()
+            r, s = int.from_bytes(signature[:size], 'big'), int.from_bytes(signature[size:], 'big')
+            key.verify(encode_dss_signature(r, s), data, ec.ECDSA(hash_class()))
+        else:
+            key.verify(signature, data)
+    except InvalidSignature:
+        raise AcmeError('malformed', 'JWS signature is invalid')
+
+
+def _check_http01(authorization, key_authorization):
+    if authorization.identifier_type == 'ip' and ':' in authorization.identifier:
+        host = '[{}]'.format(authorization.identifier)
+    else:
+        host = authorization.identifier
+    url = 'http://{}:{}/.well-known/acme-challenge/{}'.format(host, settings.ACME_HTTP01_PORT, authorization.token)
+    try:
+        with urllib.request.urlopen(url, timeout=settings.ACME_HTTP01_TIMEOUT) as response:
+            body = response.read(1024).decode(errors='replace').strip()
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return 'Fetching {} failed: {}'.format(url, e)
+    if body != key_authorization:
+        return 'Unexpected key authorization at {}'.format(url)
+    return None
+
+
+def _is_trusted(remote_addr):
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.ACME_TRUSTED_NETWORKS)
+
+
+def _delete_expired_nonces():
+    """Delete expired nonces, at most once per ACME_NONCE_TIMEOUT in a process"""
+    global _cleaned
+    with _lock:
+        if time.monotonic() - _cleaned < settings.ACME_NONCE_TIMEOUT:
+            return
+        _cleaned = time.monotonic()
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.ACME_NONCE_TIMEOUT)
+    models.AcmeNonce.objects.filter(date_created__lte=cutoff).delete()
+
+
+def _int(value):
+    return int.from_bytes(b64decode(value), 'big')
@@ -0,0 +1,169 @@
+import base64
+import datetime
+import itertools
+import timeit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import NameOID
+
+from django.conf import settings
+from django.test import RequestFactory
+from swutils.encrypt import encrypt as legacy_encrypt, decrypt as legacy_decrypt
+
+from core import crt_metadata
+from core import encryption
+from core import models
+from core import ocsp as ocsp_responses
+from core import root_cache
+from core.crt_metadata import KEY_ALGORITHMS
+from core.issuance import CaError, OpensslBackend, CryptographyBackend
+from core.utils import Ca
+from core.views.ocsp import Responder
+
+BENCHMARKS = {}
+
+
+def register(name):
+    """Register a benchmark: a function returning {label: callable} cases to time"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def run(name, iterations):
+    """Return (label, seconds per call) for every case of the benchmark"""
+    cases = BENCHMARKS[name]()
+    result = []
+    for label, call in cases.items():
+        call()
+        result.append((label, timeit.timeit(call, number=iterations) / iterations))
+    return result
+
+
+def self_signed(private_key):
+    """Return (crt, key) PEMs of a throwaway self-signed certificate"""
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'benchmark')])
+    now = datetime.datetime.utcnow()
+    algorithm = None if isinstance(private_key, ed25519.Ed25519PrivateKey) else hashes.SHA256()
+    crt = x509.CertificateBuilder() \
+        .subject_name(name) \
+        .issuer_name(name) \
+        .public_key(private_key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now) \
+        .not_valid_after(now + datetime.timedelta(days=1)) \
+        .sign(private_key=private_key, algorithm=algorithm)
+    key = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    return crt.public_bytes(serialization.Encoding.PEM).decode(), key.decode()
+
+
+@register('check_crt_and_key')
+def check_crt_and_key():
+    rsa_crt, rsa_key = self_signed(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    ec_crt, ec_key = self_signed(ec.generate_private_key(ec.SECP256R1()))
+    ed25519_crt, ed25519_key = self_signed(ed25519.Ed25519PrivateKey.generate())
+    openssl = OpensslBackend()
+    return {
+        'openssl subprocess, rsa2048': lambda: openssl.check_crt_and_key(rsa_crt, rsa_key),
+        'native, rsa2048': lambda: Ca.check_crt_and_key(rsa_crt, rsa_key),
+        'native, ec256': lambda: Ca.check_crt_and_key(ec_crt, ec_key),
+        'native, ed25519': lambda: Ca.check_crt_and_key(ed25519_crt, ed25519_key),
+    }
+
+
+@register('issuance')
+def issuance():
+    """Key generation plus signing of one site certificate per key algorithm, with an in-memory root"""
+    backend = CryptographyBackend()
+    root_crt, root_key = self_signed(ec.generate_private_key(ec.SECP256R1()))
+    root = root_cache.RootCa(root_key, root_crt)
+    subj = {'CN': 'benchmark.example.com'}
+    alt_names = ['DNS:benchmark.example.com']
+
+    def issue(algorithm):
+        return lambda: backend.create_site_crt(backend.generate_key(algorithm), subj, alt_names, 365, root)
+    return {'cryptography, {}'.format(algorithm): issue(algorithm) for algorithm in KEY_ALGORITHMS}
+
+
+@register('ocsp')
+def ocsp_responder():
+    """OCSP responses from the warm cache, through the view and signed, needs a site certificate of the root"""
+    root = root_cache.get()
+    site_crt = models.SiteCrt.objects.filter(issuer_hash=root.subject_hash).first()
+    if site_crt is None:
+        raise CaError('The ocsp benchmark needs a site certificate issued by the root certificate')
+
+    request_der = ocsp.OCSPRequestBuilder().add_certificate(
+        x509.load_der_x509_certificate(site_crt.crt_der), root.certificate, hashes.SHA1()
+    ).build().public_bytes(serialization.Encoding.DER)
+    encoded = base64.b64encode(request_der).decode()
+    factory = RequestFactory()
+    view = Responder.as_view()
+    return {
+        'respond, cached': lambda: ocsp_responses.respond(request_der),
+        'view GET, cached': lambda: view(factory.get('/ocsp/' + encoded), encoded=encoded),
+        'view POST, cached': lambda: view(factory.post('/ocsp/', request_der, content_type='application/ocsp-request')),
+        'sign': lambda: ocsp_responses.sign(site_crt, root=root),
+    }
+
+
+@register('encrypted_fields')
+def encrypted_fields():
+    """Per-row cost of an encrypted key column in a list page: loaded and never read, or read once"""
+    _, key = self_signed(ec.generate_private_key(ec.SECP256R1()))
+    secret = settings.SECRET_KEY.encode('utf-8')
+    legacy = legacy_encrypt(key, secret)
+    current = encryption.encrypt(key)
+    field = models.SiteCrt._meta.get_field('key')
+    return {
+        'swutils decrypt on load (before)': lambda: legacy_decrypt(legacy, secret),
+        'load, not read': lambda: field.from_db_value(current, None, None),
+        'load and read, legacy row': lambda: field.from_db_value(legacy, None, None).decrypt(),
+        'load and read, AES-GCM': lambda: field.from_db_value(current, None, None).decrypt(),
+        'encrypt, AES-GCM': lambda: encryption.encrypt(key),
+    }
+
+
+@register('crt_storage')
+def crt_storage():
+    """Column size of a 100k certificate fixture and per-row read cost, as PEM text or DER
+
+    100k certificates with one to three alternative names and four key algorithms are signed in memory; the
+    sizes are their summed value lengths, not measured on a database table, so page and index overhead is left out.
+    """
+    rows = 100000
+    backend = CryptographyBackend()
+    root_crt, root_key = self_signed(ec.generate_private_key(ec.SECP256R1()))
+    root = root_cache.RootCa(root_key, root_crt)
+    keys = [backend.generate_key(algorithm) for algorithm in ('rsa2048', 'ec256', 'ec384', 'ed25519')]
+    pems = []
+    for i in range(rows):
+        cn = 'host{}.benchmark.example.com'.format(i)
+        alt_names = ['DNS:' + cn] + ['DNS:alias{}.{}'.format(j, cn) for j in range(i % 3)]
+        pems.append(backend.create_site_crt(keys[i % len(keys)], {'CN': cn}, alt_names, 365, root))
+    ders = [crt_metadata.pem_to_der(pem) for pem in pems]
+    encrypted = [encryption.encrypt(pem) for pem in pems]
+
+    def size(values):
+        return '{:.1f} MB per {}k rows'.format(sum(len(value) for value in values) / 1e6, rows // 1000)
+
+    def each(values, func):
+        values = itertools.cycle(values)
+        return lambda: func(next(values))
+
+    return {
+        'encrypted PEM text, {}, decrypt and load'.format(size(encrypted)): each(
+            encrypted, lambda value: x509.load_pem_x509_certificate(encryption.decrypt(value).encode())),
+        'PEM text, {}, load'.format(size(pems)): each(
+            pems, lambda value: x509.load_pem_x509_certificate(value.encode())),
+        'DER binary, {}, load'.format(size(ders)): each(ders, x509.load_der_x509_certificate),
+        'DER binary, render PEM': each(ders, crt_metadata.der_to_pem),
+    }
@@ -0,0 +1,124 @@
+"""Download formats of site certificates
+
+Public formats are cached per process and validated against the certificate and root fingerprints,
+which are read from unencrypted columns, so conditional requests are answered without decryption.
+PKCS#12 holds the private key and is built on every request.
+"""
+import threading
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from core import models
+from core import root_cache
+from core.issuance import CaError
+
+# format: (content type, file name)
+FORMATS = {
+    'crt.pem': ('application/x-pem-file', '{cn}.crt'),
+    'fullchain.pem': ('application/pem-certificate-chain', '{cn}.fullchain.pem'),
+    'crt.der': ('application/pkix-cert', '{cn}.der'),
+}
+
+_lock = threading.Lock()
+_cached = {}
+
+
+class Bundle:
+    """Public formats of one certificate version, rendered on first use"""
+
+    def __init__(self, pk, cn, fingerprint, date_start, root):
+        self.pk = pk
+        self.cn = cn
+        self.fingerprint = fingerprint
+        self.root_fingerprint = root.fingerprint
+        self.last_modified = int(date_start.timestamp())
+        self.root = root
+        self.contents = {}
+
+    def is_current(self, fingerprint, root):
+        return self.fingerprint == fingerprint and self.root_fingerprint == root.fingerprint
+
+    def etag(self, format):
+        return '"{}-{}-{}"'.format(self.fingerprint[:16], self.root_fingerprint[:8], format)
+
+    def content(self, format):
+        if not self.contents:
+            obj = models.SiteCrt.objects.only('crt').get(pk=self.pk)
+            der = obj.crt_der
+            self.contents = {
+                'crt.pem': obj.crt,
+                'fullchain.pem': obj.crt + self.root.certificate.public_bytes(serialization.Encoding.PEM).decode(),
+                'crt.der': der,
+            }
+        return self.contents[format]
+
+
+def get(pk):
+    """Return the Bundle of a site certificate, raise SiteCrt.DoesNotExist"""
+    pk = int(pk)
+    root = root_cache.get()
+    row = models.SiteCrt.objects.filter(pk=pk).values('cn', 'fingerprint', 'date_start').get()
+    if row['fingerprint'] is None:
+        # parsed for the validators only, "manage.py backfill_crt_metadata" stores it
+        crt = models.SiteCrt.objects.only('crt').get(pk=pk).crt
+        row['fingerprint'] = models.SiteCrt.crt_metadata(crt)['fingerprint']
+
+    bundle = _cached.get(pk)
+    if bundle is not None and bundle.is_current(row['fingerprint'], root):
+        return bundle
+    bundle = Bundle(pk, row['cn'], row['fingerprint'], row['date_start'], root)
+    with _lock:
+        if len(_cached) >= settings.BUNDLE_CACHE_SIZE:
+            _cached.clear()
+        _cached[pk] = bundle
+    return bundle
+
+
+def invalidate():
+    _cached.clear()
+
+
+def discard(pks):
+    with _lock:
+        for pk in pks:
+            _cached.pop(int(pk), None)
+
+
+def response(request, pk, format):
+    """Download response of a public format, 304 when the client has the current version"""
+    bundle = get(pk)
+    etag = bundle.etag(format)
+    response = get_conditional_response(request, etag=etag, last_modified=bundle.last_modified)
+    if response is None:
+        content_type, filename = FORMATS[format]
+        response = HttpResponse(bundle.content(format), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename={}'.format(filename.format(cn=bundle.cn))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(bundle.last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def pkcs12_response(site_crt, passphrase):
+    """PKCS#12 of the key, certificate and root encrypted with passphrase, raise CaError without a key"""
+    if not site_crt.key:
+        raise CaError('Certificate was issued from a signing request, its key is kept by the client')
+    root = root_cache.get()
+    data = pkcs12.serialize_key_and_certificates(
+        name=site_crt.cn.encode(),
+        key=serialization.load_pem_private_key(site_crt.key.encode(), password=None),
+        cert=x509.load_der_x509_certificate(site_crt.crt_der),
+        cas=[root.certificate],
+        encryption_algorithm=serialization.BestAvailableEncryption(passphrase.encode()),
+    )
+    response = HttpResponse(data, content_type='application/x-pkcs12')
+    response['Content-Disposition'] = 'attachment; filename={}.p12'.format(site_crt.cn)
+    patch_cache_control(response, no_store=True)
+    return response
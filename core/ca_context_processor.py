@@ -1,10 +1,12 @@
 from django.core.exceptions import ObjectDoesNotExist
 
-from core import models
+from core import root_cache
 
 
 def ca_context_processor(request):
+    if not root_cache.exists():
+        return {}
     try:
-        return {'root_crt': models.RootCrt.objects.get()}
+        return {'root_crt': root_cache.get().obj}
     except ObjectDoesNotExist:
         return {}
@@ -0,0 +1,166 @@
+import datetime
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from core import models
+from core import ocsp
+from core import root_cache
+from core.issuance import CaError, signature_hash, authority_key_identifier, crl_url, distribution_points
+
+_lock = threading.Lock()
+_cached = {}
+
+
+class PublishedCrl:
+    """Signed CRL of a Crl row in both encodings, with its HTTP validators"""
+
+    def __init__(self, obj):
+        self.number = obj.number
+        self.der = bytes(obj.der)
+        self.pem = x509.load_der_x509_crl(self.der).public_bytes(serialization.Encoding.PEM)
+        self.etag = '"{}-{}"'.format(obj.issuer_hash[:16], obj.number)
+        self.last_modified = obj.this_update
+        self.next_update = obj.next_update
+        self.loaded = time.monotonic()
+
+    def is_expired(self):
+        return time.monotonic() - self.loaded > settings.CRL_CACHE_TIMEOUT
+
+
+def revoke(site_crt, reason=models.Revocation.UNSPECIFIED):
+    """Record the revocation of a site certificate and publish a CRL listing it"""
+    if not site_crt.has_crt_metadata():
+        site_crt.set_crt_metadata()
+        site_crt.save()
+    try:
+        with transaction.atomic():
+            revocation = models.Revocation.objects.create(
+                serial=site_crt.serial, issuer_hash=site_crt.issuer_hash, site_crt=site_crt, reason=reason)
+    except IntegrityError:
+        raise CaError('Certificate {} is already revoked'.format(site_crt.serial))
+    publish()
+    ocsp.revoked(site_crt)
+    return revocation
+
+
+def get(delta=False):
+    """Return the cached PublishedCrl of the root certificate, None if none was published
+
+    Never signs: a missing or outdated CRL is left to publish(), which runs on revocation and
+    in "manage.py publish_crl --loop".
+    """
+    published = _cached.get(delta)
+    if published is not None and not published.is_expired():
+        return published
+
+    with _lock:
+        published = _cached.get(delta)
+        if published is None or published.is_expired():
+            obj = latest(root_cache.get().subject_hash, delta)
+            published = _cached[delta] = PublishedCrl(obj) if obj else None
+    return published
+
+
+def invalidate():
+    _cached.clear()
+
+
+def latest(issuer, delta=False):
+    return models.Crl.objects.filter(issuer_hash=issuer, base_number__isnull=not delta).order_by('-number').first()
+
+
+def publish(force=False):
+    """Sign a new full or delta CRL if revocations changed or the latest one is half way to nextUpdate
+
+    A delta CRL lists the revocations added after its base full CRL. A full CRL is signed instead
+    when revocations were removed, the delta grew over CRL_DELTA_MAX_ENTRIES or the base went stale,
+    followed by an empty delta against it. Returns the list of signed Crl rows.
+    """
+    root = root_cache.get()
+    issuer = root.subject_hash
+    revocations = models.Revocation.objects.filter(issuer_hash=issuer)
+    state = revocations.aggregate(count=Count('pk'), through=Max('pk'))
+    state = (state['count'], state['through'] or 0)
+
+    base = latest(issuer)
+    delta = latest(issuer, delta=True)
+    if delta is not None and (base is None or delta.base_number != base.number):
+        delta = None
+    current = delta or base
+
+    signed = []
+    try:
+        with transaction.atomic():
+            if force or base is None or _is_stale(base) or not _is_delta_of(base, revocations, state):
+                base = _sign(root, issuer, revocations, state)
+                signed.append(base)
+                signed.append(_sign(root, issuer, revocations.none(), state, base))
+            elif (current.revocations, current.revoked_through) != state or delta is None or _is_stale(delta):
+                signed.append(_sign(root, issuer, revocations.filter(pk__gt=base.revoked_through), state, base))
+    except IntegrityError:
+        # another process signed the same CRL number first, its CRL is as recent as ours
+        return []
+
+    if signed:
+        invalidate()
+    return signed
+
+
+def _is_stale(obj):
+    return timezone.now() > obj.this_update + (obj.next_update - obj.this_update) / 2
+
+
+def _is_delta_of(base, revocations, state):
+    added = state[0] - base.revocations
+    return state[1] >= base.revoked_through and added <= settings.CRL_DELTA_MAX_ENTRIES and \
+        revocations.filter(pk__gt=base.revoked_through).count() == added
+
+
+def _sign(root, issuer, revocations, state, base=None):
+    now = timezone.now()
+    next_update = now + datetime.timedelta(
+        seconds=settings.CRL_DELTA_NEXT_UPDATE if base else settings.CRL_NEXT_UPDATE)
+    number = (models.Crl.objects.aggregate(number=Max('number'))['number'] or 0) + 1
+
+    builder = x509.CertificateRevocationListBuilder() \
+        .issuer_name(root.certificate.subject) \
+        .last_update(now) \
+        .next_update(next_update) \
+        .add_extension(x509.CRLNumber(number), critical=False) \
+        .add_extension(authority_key_identifier(root.certificate), critical=False)
+    if base:
+        builder = builder.add_extension(x509.DeltaCRLIndicator(base.number), critical=True)
+    elif settings.CA_PUBLIC_URL:
+        builder = builder.add_extension(x509.FreshestCRL(distribution_points(crl_url(delta=True))), critical=False)
+
+    for revocation in revocations.order_by('pk').iterator():
+        builder = builder.add_revoked_certificate(_revoked_certificate(revocation))
+
+    crl = builder.sign(private_key=root.private_key, algorithm=signature_hash(root.private_key))
+    return models.Crl.objects.create(
+        number=number,
+        base_number=base.number if base else None,
+        issuer_hash=issuer,
+        der=crl.public_bytes(serialization.Encoding.DER),
+        revocations=state[0],
+        revoked_through=state[1],
+        this_update=now,
+        next_update=next_update,
+    )
+
+
+def _revoked_certificate(revocation):
+    builder = x509.RevokedCertificateBuilder() \
+        .serial_number(int(revocation.serial, 16)) \
+        .revocation_date(revocation.date_revoked)
+    if revocation.reason != models.Revocation.UNSPECIFIED:
+        builder = builder.add_extension(x509.CRLReason(x509.ReasonFlags(revocation.reason)), critical=False)
+    return builder.build()
@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import ipaddress
+import re
+from datetime import timezone
+
+from OpenSSL import crypto
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519, ed448, dsa
+from cryptography.x509.oid import NameOID
+
+NAME_OIDS = {
+    'C': NameOID.COUNTRY_NAME,
+    'ST': NameOID.STATE_OR_PROVINCE_NAME,
+    'L': NameOID.LOCALITY_NAME,
+    'O': NameOID.ORGANIZATION_NAME,
+    'OU': NameOID.ORGANIZATIONAL_UNIT_NAME,
+    'CN': NameOID.COMMON_NAME,
+    'emailAddress': NameOID.EMAIL_ADDRESS,
+}
+
+# host name with an optional wildcard as the whole leftmost label
+DNS_NAME = re.compile(r'^(?=.{1,253}$)(\*\.)?([a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?\.)*[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?$')
+
+# a certificate column holds PEM text when it starts with PEM_BEGIN and DER otherwise
+PEM_BEGIN = b'-----BEGIN'
+PEM_CRT_BEGIN = b'-----BEGIN CERTIFICATE-----'
+
+KEY_ALGORITHMS = {
+    'rsa2048': ('RSA', 2048),
+    'rsa3072': ('RSA', 3072),
+    'rsa4096': ('RSA', 4096),
+    'ec256': ('EC', 256),
+    'ec384': ('EC', 384),
+    'ed25519': ('Ed25519', 256),
+}
+KEY_ALGORITHM_CHOICES = (
+    ('rsa2048', 'RSA 2048'),
+    ('rsa3072', 'RSA 3072'),
+    ('rsa4096', 'RSA 4096'),
+    ('ec256', 'ECDSA P-256'),
+    ('ec384', 'ECDSA P-384'),
+    ('ed25519', 'Ed25519'),
+)
+
+
+def parse(crt):
+    """Return the plaintext metadata columns of a PEM certificate"""
+    if isinstance(crt, str):
+        crt = crt.encode()
+    certificate = x509.load_pem_x509_certificate(crt)
+    key_type, key_size = public_key_info(certificate.public_key())
+    return {
+        'serial': format(certificate.serial_number, 'X'),
+        'subject': name_dict(certificate.subject),
+        'issuer_hash': hashlib.sha256(certificate.issuer.public_bytes()).hexdigest(),
+        'not_before': certificate.not_valid_before.replace(tzinfo=timezone.utc),
+        'not_after': certificate.not_valid_after.replace(tzinfo=timezone.utc),
+        'fingerprint': certificate.fingerprint(hashes.SHA256()).hex(),
+        'key_type': key_type,
+        'key_size': key_size,
+        'san': subject_alt_names(certificate),
+    }
+
+
+def der_to_pem(der):
+    """PEM text of a DER certificate, encoded without parsing it"""
+    encoded = base64.b64encode(der).decode('ascii')
+    lines = [encoded[i:i + 64] for i in range(0, len(encoded), 64)]
+    return '-----BEGIN CERTIFICATE-----\n{}\n-----END CERTIFICATE-----\n'.format('\n'.join(lines))
+
+
+def pem_to_der(pem):
+    """DER of the certificate in PEM text, raise ValueError unless it holds exactly one"""
+    if isinstance(pem, str):
+        pem = pem.encode()
+    count = pem.count(PEM_CRT_BEGIN)
+    if count > 1:
+        raise ValueError('Expected a single certificate, found {}'.format(count))
+    return x509.load_pem_x509_certificate(pem).public_bytes(serialization.Encoding.DER)
+
+
+def stored_to_pem(value):
+    """PEM text of a certificate column value, which holds either PEM text or DER"""
+    value = bytes(value)
+    if value.startswith(PEM_BEGIN):
+        return value.decode()
+    return der_to_pem(value)
+
+
+def stored_to_der(value):
+    """DER of a certificate column value, which holds either PEM text or DER"""
+    value = bytes(value)
+    if value.startswith(PEM_BEGIN):
+        return pem_to_der(value)
+    return value
+
+
+def crt_matches_key(crt, key):
+    """Check that a PEM certificate and a PEM private key share one public key
+
+    Compares the DER SubjectPublicKeyInfo of both, so RSA, EC and Ed25519 keys are supported.
+    The key is loaded with pyOpenSSL, which unlike cryptography skips the costly RSA consistency check.
+    Raises OpenSSL.crypto.Error on invalid or encrypted PEM data.
+    """
+    certificate = crypto.load_certificate(crypto.FILETYPE_PEM, crt)
+    private_key = crypto.load_privatekey(crypto.FILETYPE_PEM, key)
+    return crypto.dump_publickey(crypto.FILETYPE_ASN1, certificate.get_pubkey()) == \
+        crypto.dump_publickey(crypto.FILETYPE_ASN1, private_key)
+
+
+def public_key_bytes(public_key):
+    return public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def name_dict(name):
+    result = {}
+    for short_name, oid in NAME_OIDS.items():
+        attributes = name.get_attributes_for_oid(oid)
+        if attributes:
+            result[short_name] = attributes[0].value
+    return result
+
+
+def key_algorithm(key_type, key_size):
+    """Return the KEY_ALGORITHMS name of a key type and size, None if it is not supported"""
+    for name, algorithm in KEY_ALGORITHMS.items():
+        if algorithm == (key_type, key_size):
+            return name
+
+
+def public_key_info(public_key):
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return 'RSA', public_key.key_size
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return 'EC', public_key.curve.key_size
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return 'Ed25519', 256
+    if isinstance(public_key, ed448.Ed448PublicKey):
+        return 'Ed448', 456
+    if isinstance(public_key, dsa.DSAPublicKey):
+        return 'DSA', public_key.key_size
+    return None, None
+
+
+def subject_alt_names(certificate):
+    try:
+        san = certificate.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return []
+    result = ['DNS:' + value.lower() for value in san.get_values_for_type(x509.DNSName)]
+    result += ['IP:' + str(value) for value in san.get_values_for_type(x509.IPAddress)]
+    return result
+
+
+def alt_name(value):
+    """Normalize a host name, IP address, "DNS:name" or "IP:address" to "DNS:name" or "IP:address"
+
+    Names are lowercased and IP addresses written in their compressed form. Raises ValueError.
+    """
+    value = value.strip()
+    kind, separator, name = value.partition(':')
+    if separator and kind in ('DNS', 'IP'):
+        value = name
+    try:
+        return 'IP:' + str(ipaddress.ip_address(value))
+    except ValueError:
+        if separator and kind == 'IP':
+            raise ValueError('Invalid IP address {}'.format(value))
+    if not DNS_NAME.match(value.lower()):
+        raise ValueError('Invalid host name {}'.format(value))
+    return 'DNS:' + value.lower()
+
+
+def reversed_domain(name):
+    """Labels of a "DNS:" or "CN:" name from the top level down, "DNS:www.example.com" gives "com.example.www"
+
+    Suffix queries such as *.example.com become prefix matches on it. Empty for IP addresses.
+    """
+    kind, _, value = name.partition(':')
+    if kind == 'IP':
+        return ''
+    return '.'.join(reversed(value.split('.')))
+
+
+def lookup_names(host):
+    """Normalized names that cover host: itself and, for a host name, the wildcard of its parent"""
+    name = alt_name(host)
+    if name.startswith('DNS:') and '.' in name and '*' not in name:
+        return [name, 'DNS:*.' + name[4:].split('.', 1)[1]]
+    return [name]
+
@@ -0,0 +1,70 @@
+"""Encryption of EncryptedTextField columns
+
+Values are written as PREFIX + base64(nonce + AES-256-GCM ciphertext) with a key derived from SECRET_KEY.
+Rows written before carry base64 of AES-128-ECB under sha1(SECRET_KEY)[:16] (swutils.encrypt) and are still
+read; reencrypt_fields rewrites them. The derived key and cipher are kept per process, per SECRET_KEY.
+"""
+import base64
+import os
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from swutils.encrypt import decrypt as legacy_decrypt
+
+from django.conf import settings
+
+PREFIX = 'v1:'
+NONCE_SIZE = 12
+
+_ciphers = {}
+
+
+def _get_cipher():
+    secret = settings.SECRET_KEY
+    cipher = _ciphers.get(secret)
+    if cipher is None:
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'core.EncryptedTextField') \
+            .derive(secret.encode('utf-8'))
+        cipher = AESGCM(key)
+        _ciphers.clear()
+        _ciphers[secret] = cipher
+    return cipher
+
+
+def encrypt(value):
+    aead = _get_cipher()
+    nonce = os.urandom(NONCE_SIZE)
+    return PREFIX + base64.b64encode(nonce + aead.encrypt(nonce, value.encode('utf-8'), None)).decode('ascii')
+
+
+def decrypt(value):
+    """Plaintext of a stored value in the current or the legacy format, raise ValueError when it does not decrypt"""
+    if isinstance(value, bytes):
+        value = value.decode('ascii')
+    if not value.startswith(PREFIX):
+        return legacy_decrypt(value, settings.SECRET_KEY.encode('utf-8'))
+
+    data = base64.b64decode(value[len(PREFIX):])
+    try:
+        return _get_cipher().decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None).decode('utf-8')
+    except InvalidTag:
+        raise ValueError('Encrypted value does not match SECRET_KEY or was modified')
+
+
+class Ciphertext:
+    """Stored value of an EncryptedTextField, decrypted on first access to the model attribute"""
+    __slots__ = ('value', )
+
+    def __init__(self, value):
+        self.value = value
+
+    def decrypt(self):
+        return decrypt(self.value)
+
+    def __str__(self):
+        return self.decrypt()
+
+    def __repr__(self):
+        return '<Ciphertext>'
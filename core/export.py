@@ -0,0 +1,83 @@
+import io
+import tarfile
+import time
+import zipfile
+
+from core import models
+from core import root_cache
+
+FORMATS = {
+    'tar.gz': 'application/gzip',
+    'zip': 'application/zip',
+}
+
+
+class _Pipe:
+    """Write-only file object whose written bytes are taken out after every archive member"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def member_name(obj):
+    """Directory and file name of a certificate in the archive, the pk stands in for a cn that is not a safe name"""
+    cn = obj.cn
+    if not cn or cn in ('.', '..') or '/' in cn or '\\' in cn or not cn.isprintable():
+        return 'pk-{}'.format(obj.pk)
+    return cn
+
+
+def files(queryset, include_keys=False, include_root=False):
+    """Yield (archive name, content) of the certificates, reading rows in chunks"""
+    if include_root:
+        yield 'rootCA.crt', root_cache.get().crt
+
+    fields = ['cn', 'crt', 'key'] if include_keys else ['cn', 'crt']
+    for obj in queryset.only(*fields).order_by('pk').iterator(chunk_size=500):
+        name = member_name(obj)
+        yield '{name}/{name}.crt'.format(name=name), obj.crt
+        if include_keys and obj.key:
+            yield '{name}/{name}.key'.format(name=name), obj.key
+
+
+def stream(queryset, archive_format='tar.gz', include_keys=False, include_root=False):
+    """Yield a compressed archive of the certificates chunk by chunk, memory stays flat for any queryset size"""
+    pipe = _Pipe()
+    entries = files(queryset, include_keys, include_root)
+
+    if archive_format == 'zip':
+        with zipfile.ZipFile(pipe, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, content in entries:
+                archive.writestr(name, content)
+                yield pipe.take()
+    else:
+        with tarfile.open(fileobj=pipe, mode='w|gz') as archive:
+            for name, content in entries:
+                data = content.encode()
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = time.time()
+                archive.addfile(info, io.BytesIO(data))
+                yield pipe.take()
+    yield pipe.take()
+
+
+def filter_queryset(ids=None, cn=None):
+    queryset = models.SiteCrt.objects.all()
+    if ids:
+        queryset = queryset.filter(pk__in=ids)
+    if cn:
+        queryset = queryset.filter(cn__icontains=cn)
+    return queryset
@@ -1,3 +1,5 @@
+import re
+
 from OpenSSL import crypto
 
 from django import forms
@@ -5,7 +7,19 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import ValidationError
 
 from core import models
+from core import crt_metadata
 from core.utils import Ca
+from core.issuance import CaError, load_csr, csr_common_name
+
+
+KEY_ALGORITHM_CHOICES = (('', 'Default'),) + crt_metadata.KEY_ALGORITHM_CHOICES
+
+
+def check_key_algorithm(crt):
+    public_key = crt.get_pubkey().to_cryptography_key()
+    if not crt_metadata.key_algorithm(*crt_metadata.public_key_info(public_key)):
+        raise ValidationError('Unsupported key algorithm, use one of: {}'.format(
+            ', '.join(label for _, label in crt_metadata.KEY_ALGORITHM_CHOICES)))
 
 
 class RootCrt(forms.Form):
@@ -19,14 +33,16 @@ class RootCrt(forms.Form):
         cleaned_data.get('crt').seek(0)
         cleaned_data.get('key').seek(0)
         try:
-            cert = crypto.load_certificate(crypto.FILETYPE_PEM, cert_data).get_subject()
+            crt = crypto.load_certificate(crypto.FILETYPE_PEM, cert_data)
+            cert = crt.get_subject()
             ca = Ca()
             if not ca.check_crt_and_key(cert_data.decode(), key_data.decode()):
                 raise ValidationError('You upload a different key and certificate')
+            check_key_algorithm(crt)
             if not cert.C or not cert.ST or not cert.L or not cert.O:
                 msg = 'Please enter required field in certificate: Country, State, Location, Organization'
                 self.add_error('crt', msg)
-        except crypto.Error:
+        except (crypto.Error, CaError):
             raise ValidationError('Please load valid certificate and key')
 
         return cleaned_data
@@ -41,6 +57,7 @@ class ConfigRootCrt(forms.Form):
     common_name = forms.CharField(required=False, label='Common name')
     email = forms.EmailField(required=False, label='Email')
     validity_period = forms.DateField(label='Certificate expiration date')
+    key_algorithm = forms.ChoiceField(choices=KEY_ALGORITHM_CHOICES, required=False, label='Key algorithm')
 
     def clean_common_name(self):
         common_name = self.cleaned_data.get('common_name')
@@ -53,12 +70,15 @@ class ConfigRootCrt(forms.Form):
 
 class ViewCrtText(forms.Form):
     crt = forms.CharField(widget=forms.Textarea(attrs={'rows': '8'}))
-    key = forms.CharField(widget=forms.Textarea(attrs={'rows': '8'}))
+    key = forms.CharField(widget=forms.Textarea(attrs={'rows': '8'}), required=False)
 
 
 class CertificatesCreate(forms.Form):
     cn = forms.CharField(required=False, label='Common name')
     validity_period = forms.DateField(label='Certificate expiration date')
+    key_algorithm = forms.ChoiceField(choices=KEY_ALGORITHM_CHOICES, required=False, label='Key algorithm')
+    alt_names = forms.CharField(widget=forms.Textarea(attrs={'rows': '3'}), required=False,
+                                label='Alternative names', help_text='Host names and IP addresses, one per line')
 
     def clean_cn(self):
         cn = self.cleaned_data.get('cn')
@@ -77,11 +97,36 @@ class CertificatesCreate(forms.Form):
             self.add_error('cn', msg)
         except ObjectDoesNotExist:
             pass
+        if data is not None:
+            alt_names = [name for name in re.split(r'[\s,]+', cleaned_data.get('alt_names', '')) if name]
+            try:
+                cleaned_data['alt_names'] = Ca.subject_alt_names(data, alt_names)[1:]
+            except CaError as e:
+                self.add_error('alt_names', str(e))
         return cleaned_data
 
 
+class CertificatesSignCsr(forms.Form):
+    csr = forms.CharField(widget=forms.Textarea(attrs={'rows': '8'}), label='Certificate signing request')
+    validity_period = forms.DateField(label='Certificate expiration date')
+
+    def clean_csr(self):
+        csr = self.cleaned_data.get('csr')
+        try:
+            cn = csr_common_name(load_csr(csr))
+        except CaError as e:
+            raise ValidationError(str(e))
+
+        if '_' in cn:
+            raise ValidationError('Illegal character "_"')
+        if models.SiteCrt.objects.filter(cn=cn).exists():
+            raise ValidationError('Common name {} not unique'.format(cn))
+        return csr
+
+
 class CertificatesSearch(forms.Form):
-    cn = forms.CharField(required=False, label='Common name')
+    cn = forms.CharField(required=False, label='Name', widget=forms.TextInput(
+        attrs={'placeholder': 'Name, address, prefix* or *.domain'}))
 
 
 class CertificatesUploadExisting(forms.Form):
@@ -110,10 +155,15 @@ class CertificatesUploadExisting(forms.Form):
         else:
             crt = crt_text
             key = key_text
-        crypto.load_certificate(crypto.FILETYPE_PEM, crt)
+        certificate = crypto.load_certificate(crypto.FILETYPE_PEM, crt)
         ca = Ca()
-        if not ca.check_crt_and_key(crt, key):
+        try:
+            match = ca.check_crt_and_key(crt, key)
+        except CaError:
+            raise ValidationError('Please load valid certificate and key')
+        if not match:
             raise ValidationError('You upload a different key and certificate')
+        check_key_algorithm(certificate)
 
         return cleaned_data
 
@@ -152,5 +202,13 @@ class CertificatesUploadExisting(forms.Form):
         return crt_text
 
 
+class RevokeCrt(forms.Form):
+    reason = forms.ChoiceField(choices=models.Revocation.REASONS, label='Reason')
+
+
+class DownloadPkcs12(forms.Form):
+    passphrase = forms.CharField(label='Passphrase', min_length=4, widget=forms.PasswordInput)
+
+
 class RecreationCrt(forms.Form):
     validity_period = forms.DateField(label='Certificate expiration date')
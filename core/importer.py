@@ -0,0 +1,160 @@
+import hashlib
+import os
+import re
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from OpenSSL import crypto
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from core import crt_metadata
+from core import models
+from core.forms import check_key_algorithm
+
+CRT = 'crt'
+KEY = 'key'
+
+PEM_BLOCK = re.compile(rb'-----BEGIN ([A-Z0-9 ]+)-----.*?-----END \1-----', re.DOTALL)
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+
+    def error(self, name, message):
+        self.errors.append((name, message))
+
+
+def read_files(path):
+    """Yield (name, content) of every file in a directory, tar or zip archive"""
+    if os.path.isdir(path):
+        for directory, _, names in os.walk(path):
+            for name in sorted(names):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    yield os.path.relpath(os.path.join(directory, name), path), f.read()
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, archive.read(info)
+    else:
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member).read()
+
+
+def parse_file(item):
+    """Parse every PEM block of a (name, content) file into a list of (kind, name, pem, public key hash, metadata)
+
+    A file may hold a certificate and its key. Unrecognized blocks are skipped, invalid ones and a file
+    without any certificate or key give (None, name, error, None, None).
+    """
+    name, content = item
+    entries = [entry for entry in (parse_block(name, match) for match in PEM_BLOCK.finditer(content)) if entry]
+    return entries or [(None, name, 'No certificate or key found', None, None)]
+
+
+def parse_block(name, match):
+    label, block = match.group(1), match.group(0)
+    try:
+        if label == b'CERTIFICATE':
+            crt = x509.load_pem_x509_certificate(block)
+            check_key_algorithm(crypto.X509.from_cryptography(crt))
+            pem = crt.public_bytes(serialization.Encoding.PEM).decode()
+            metadata = models.SiteCrt.crt_metadata(pem)
+            return CRT, name, pem, public_key_hash(crt.public_key()), metadata
+        if label.endswith(b'PRIVATE KEY'):
+            key = serialization.load_pem_private_key(block, password=None)
+            return KEY, name, block.decode() + '\n', public_key_hash(key.public_key()), None
+    except ValidationError as e:
+        return None, name, e.messages[0], None, None
+    except (ValueError, TypeError) as e:
+        return None, name, str(e) or 'Invalid PEM', None, None
+    return None
+
+
+def public_key_hash(public_key):
+    return hashlib.sha256(crt_metadata.public_key_bytes(public_key)).digest()
+
+
+def import_files(files, progress=None, batch_size=500):
+    """Create SiteCrt rows from certificate and key files, pairing them by public key
+
+    Files are parsed in the IMPORT_WORKERS process pool, then certificates are checked against the
+    existing common names and inserted with bulk_create, one query of each per batch.
+    """
+    result = ImportResult()
+    crts = []
+    keys = {}
+
+    if settings.IMPORT_WORKERS == 0:
+        executor = None
+        parsed = map(parse_file, files)
+    else:
+        executor = ProcessPoolExecutor(max_workers=settings.IMPORT_WORKERS)
+        parsed = executor.map(parse_file, files, chunksize=100)
+    try:
+        for entries in parsed:
+            for kind, name, pem, key_hash, metadata in entries:
+                if kind == CRT:
+                    crts.append((name, pem, key_hash, metadata))
+                elif kind == KEY:
+                    keys[key_hash] = pem
+                else:
+                    result.error(name, pem)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    imported = set()
+    for start in range(0, len(crts), batch_size):
+        chunk = crts[start:start + batch_size]
+        cns = [metadata['subject'].get('CN') for _, _, _, metadata in chunk]
+        existing = set(models.SiteCrt.objects.filter(cn__in=[cn for cn in cns if cn]).values_list('cn', flat=True))
+        batch = []
+        for (name, crt, key_hash, metadata), cn in zip(chunk, cns):
+            if not cn:
+                result.error(name, 'Certificate has no common name')
+            elif cn in existing or cn in imported:
+                result.error(name, 'Certificate with Common name {} already exists'.format(cn))
+            elif key_hash not in keys:
+                result.error(name, 'No private key matches the certificate')
+            else:
+                imported.add(cn)
+                batch.append((name, models.SiteCrt(key=keys[key_hash], crt=crt, cn=cn, **metadata)))
+        _insert(batch, result)
+        if progress:
+            progress(start + len(chunk), len(crts))
+    return result
+
+
+def _insert(batch, result):
+    """Insert (name, SiteCrt) pairs at once, row by row when that breaks a constraint, e.g. a concurrent import"""
+    if not batch:
+        return
+    try:
+        with transaction.atomic():
+            _create([obj for _, obj in batch], result)
+        return
+    except IntegrityError:
+        pass
+    for name, obj in batch:
+        try:
+            with transaction.atomic():
+                _create([obj], result)
+        except IntegrityError as e:
+            result.error(name, 'Certificate could not be saved: {}'.format(e))
+
+
+def _create(site_crts, result):
+    models.SiteCrt.objects.bulk_create(site_crts)
+    models.site_crts_saved.send(sender=models.SiteCrt, site_crts=site_crts, created=True)
+    result.imported += len(site_crts)
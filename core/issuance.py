@@ -0,0 +1,378 @@
+import datetime
+import functools
+import ipaddress
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from core import root_cache
+from core.crt_metadata import NAME_OIDS, KEY_ALGORITHMS, KEY_ALGORITHM_CHOICES, key_algorithm, public_key_info
+
+
+class CaError(Exception):
+    """Error create certificate"""
+
+
+def get_backend():
+    return import_string(settings.CA_ISSUANCE_BACKEND)()
+
+
+EC_CURVES = {256: ec.SECP256R1, 384: ec.SECP384R1}
+
+_executor = None
+_worker_roots = {}
+
+
+def sign_site_crts(tasks, root):
+    """Sign (key, algorithm, subj, alt_names, validity_period) tasks in the BULK_ISSUANCE_WORKERS process pool
+
+    A task without a key gets a fresh one of the algorithm generated in the worker. Returns a list of
+    ((key, crt), None) or (None, error message) in the order of tasks.
+    """
+    global _executor
+    args = [tuple(task) + (root.key, root.crt) for task in tasks]
+    if settings.BULK_ISSUANCE_WORKERS == 0:
+        calls = [functools.partial(_sign_site_crt, *a) for a in args]
+    else:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.BULK_ISSUANCE_WORKERS)
+        calls = [_executor.submit(_sign_site_crt, *a).result for a in args]
+
+    results = []
+    for call in calls:
+        try:
+            results.append((call(), None))
+        except CaError as e:
+            results.append((None, str(e)))
+        except BrokenProcessPool:
+            _executor = None
+            raise CaError('Issuance worker pool is broken')
+    return results
+
+
+def _sign_site_crt(key, algorithm, subj, alt_names, validity_period, root_key, root_crt):
+    backend = get_backend()
+    if key is None:
+        key = backend.generate_key(algorithm)
+    if root_crt not in _worker_roots:
+        _worker_roots.clear()
+        _worker_roots[root_crt] = root_cache.RootCa(root_key, root_crt)
+    return key, backend.create_site_crt(key, subj, alt_names, validity_period, _worker_roots[root_crt])
+
+
+def signature_hash(key):
+    """Hash algorithm to sign with a private key, Ed25519 keys take none"""
+    return None if isinstance(key, ed25519.Ed25519PrivateKey) else hashes.SHA256()
+
+
+def crl_url(delta=False):
+    """Absolute URL of the DER CRL served here, None unless CA_PUBLIC_URL is set"""
+    if not settings.CA_PUBLIC_URL:
+        return None
+    return settings.CA_PUBLIC_URL.rstrip('/') + reverse('crl_delta' if delta else 'crl', kwargs={'encoding': 'der'})
+
+
+def distribution_points(url):
+    return [x509.DistributionPoint(full_name=[x509.UniformResourceIdentifier(url)], relative_name=None,
+                                   reasons=None, crl_issuer=None)]
+
+
+def authority_key_identifier(root_crt):
+    try:
+        ski = root_crt.extensions.get_extension_for_class(x509.SubjectKeyIdentifier)
+        return x509.AuthorityKeyIdentifier.from_issuer_subject_key_identifier(ski.value)
+    except x509.ExtensionNotFound:
+        return x509.AuthorityKeyIdentifier(
+            key_identifier=None,
+            authority_cert_issuer=[x509.DirectoryName(root_crt.issuer)],
+            authority_cert_serial_number=root_crt.serial_number,
+        )
+
+
+def _key_algorithm(algorithm):
+    try:
+        return KEY_ALGORITHMS[algorithm]
+    except KeyError:
+        raise CaError('Unsupported key algorithm: {}'.format(algorithm))
+
+
+def load_csr(csr):
+    """Parse a PEM certificate signing request, raise CaError unless it is well formed, self-signed
+    and for a key of KEY_ALGORITHMS"""
+    if isinstance(csr, str):
+        csr = csr.encode()
+    try:
+        csr = x509.load_pem_x509_csr(csr)
+    except ValueError as e:
+        raise CaError('Invalid certificate signing request: {}'.format(e))
+    if not csr.is_signature_valid:
+        raise CaError('Certificate signing request signature is invalid')
+    if not key_algorithm(*public_key_info(csr.public_key())):
+        raise CaError('Unsupported key algorithm, use one of: {}'.format(
+            ', '.join(label for _, label in KEY_ALGORITHM_CHOICES)))
+    return csr
+
+
+def csr_common_name(csr):
+    attributes = csr.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    if not attributes:
+        raise CaError('Certificate signing request has no common name')
+    return attributes[0].value
+
+
+class OpensslBackend:
+    """Issue keys and certificates with the openssl command line tool"""
+
+    GENPKEY_OPTIONS = {
+        'RSA': '-algorithm RSA -pkeyopt rsa_keygen_bits:{size}',
+        'EC': '-algorithm EC -pkeyopt ec_paramgen_curve:P-{size}',
+        'Ed25519': '-algorithm ED25519',
+    }
+
+    def generate_key(self, algorithm='rsa2048'):
+        key_type, key_size = _key_algorithm(algorithm)
+        directory = tempfile.mkdtemp()
+        path_key = os.path.join(directory, 'crt.key')
+
+        self._run('openssl genpkey {options} -out {path}'.format(
+            options=self.GENPKEY_OPTIONS[key_type].format(size=key_size), path=path_key), directory)
+
+        key = self._read(path_key)
+        shutil.rmtree(directory)
+        return key
+
+    def create_root_crt(self, key, subj, validity_period):
+        directory = tempfile.mkdtemp()
+        path_key = os.path.join(directory, 'rootCA.key')
+        path_crt = os.path.join(directory, 'rootCA.crt')
+        self._write(path_key, key)
+
+        command_generate_root_crt = 'openssl req -x509 -new -key {path_key} -days {validity_period} -out {path_crt}'.format(
+            path_key=path_key, path_crt=path_crt, validity_period=validity_period)
+
+        command_subj_root_crt = ' -subj "'
+        for key, value in subj.items():
+            if value not in ['', None] and key != 'validity_period':
+                command_subj_root_crt += '/{key}={value}'.format(key=key, value=value)
+        command_subj_root_crt += '"'
+
+        self._run(command_generate_root_crt + command_subj_root_crt, directory)
+
+        crt = self._read(path_crt)
+        shutil.rmtree(directory)
+        return crt
+
+    def create_site_crt(self, key, subj, alt_names, validity_period, root):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'crt')
+        self._write(path + '.key', key)
+        self._write(path + '.cnf', ''.join(self._config_crt(subj)))
+
+        command_generate_req = '/bin/bash -c "openssl req -new -key {path_key} -out {path_csr} -config <( cat {path_config} )"'.format(
+            path_key=path + '.key', path_csr=path + '.csr', path_config=path + '.cnf')
+        self._run(command_generate_req, directory)
+
+        return self._sign_csr(directory, path, alt_names, validity_period, root)
+
+    def sign_csr(self, csr, subj, alt_names, validity_period, root):
+        """Sign a PEM certificate signing request, the subject of the request is replaced by subj"""
+        load_csr(csr)
+        subject = ''.join('/{}={}'.format(key, value.replace('\\', '\\\\').replace('/', '\\/'))
+                          for key, value in subj.items() if value not in ['', None] and key != 'validity_period')
+        options = ' -subj ' + shlex.quote(subject)
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'crt')
+        self._write(path + '.csr', csr if isinstance(csr, str) else csr.decode())
+        return self._sign_csr(directory, path, alt_names, validity_period, root, options)
+
+    def _sign_csr(self, directory, path, alt_names, validity_period, root, options=''):
+        path_root_key = os.path.join(directory, 'rootCA.key')
+        path_root_crt = os.path.join(directory, 'rootCA.crt')
+        self._write(path_root_key, root.key)
+        self._write(path_root_crt, root.crt)
+        self._write(path + '.ext', ''.join(self._extfile_crt(alt_names)))
+
+        command_generate_crt = 'openssl x509 -req -in {path_csr} -CA {path_root_crt} -CAkey {path_root_key}' \
+                               ' -CAcreateserial -out {path_crt} -days {validity_period} -extfile {path_ext}'.format(
+            path_csr=path + '.csr', path_root_crt=path_root_crt, path_root_key=path_root_key, path_crt=path + '.crt',
+            validity_period=validity_period, path_ext=path + '.ext')
+        self._run(command_generate_crt + options, directory)
+
+        crt = self._read(path + '.crt')
+        shutil.rmtree(directory)
+        return crt
+
+    def check_crt_and_key(self, crt, key):
+        """Compare RSA moduli printed by openssl, kept as a baseline for the native Ca.check_crt_and_key"""
+        directory = tempfile.mkdtemp()
+        self._write(os.path.join(directory, 'crt.crt'), crt)
+        self._write(os.path.join(directory, 'key.key'), key)
+
+        modulus_crt = self._run('openssl x509 -noout -modulus -in {}'.format(os.path.join(directory, 'crt.crt')),
+                                directory)
+        modulus_key = self._run('openssl rsa -noout -modulus -in {}'.format(os.path.join(directory, 'key.key')),
+                                directory)
+        shutil.rmtree(directory)
+        return modulus_crt == modulus_key
+
+    @staticmethod
+    def _extfile_crt(alt_names):
+        extfile = ['authorityKeyIdentifier=keyid,issuer\n', 'basicConstraints=CA:FALSE\n',
+                   'keyUsage = digitalSignature, nonRepudiation, keyEncipherment, dataEncipherment\n',
+                   'extendedKeyUsage = serverAuth, clientAuth\n']
+        url = crl_url()
+        if url:
+            extfile.append('crlDistributionPoints = URI:{}\n'.format(url))
+        extfile += ['subjectAltName = @alt_names\n', '\n', '[alt_names]\n']
+        for index, name in enumerate(alt_names, 1):
+            kind, value = name.split(':', 1)
+            extfile.append('{kind}.{index} = {value}\n'.format(kind=kind, index=index, value=value))
+        return extfile
+
+    @staticmethod
+    def _config_crt(subj):
+        config = ['[req]\n', 'prompt = no\n', 'default_md = sha256\n',
+                  'distinguished_name = dn\n', '\n', '[dn]\n']
+        for key, value in subj.items():
+            if value not in ['', None] and key != 'validity_period':
+                config.append('{key}={value}\n'.format(key=key, value=value))
+        return config
+
+    @staticmethod
+    def _run(command, directory):
+        p = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           universal_newlines=True)
+        if p.returncode:
+            shutil.rmtree(directory)
+            raise CaError('Command:\n' + p.args + '\n' + 'Output:\n' + p.stderr)
+        return p.stdout
+
+    @staticmethod
+    def _read(path):
+        with open(path) as f:
+            return f.read()
+
+    @staticmethod
+    def _write(path, data):
+        with open(path, 'w+') as f:
+            f.write(data)
+
+
+class CryptographyBackend:
+    """Issue keys and certificates in process with the cryptography library
+
+    Produces the same subject and extensions as OpensslBackend without temporary files and subprocesses.
+    """
+
+    def generate_key(self, algorithm='rsa2048'):
+        key_type, key_size = _key_algorithm(algorithm)
+        if key_type == 'RSA':
+            key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+        elif key_type == 'EC':
+            key = ec.generate_private_key(EC_CURVES[key_size]())
+        else:
+            key = ed25519.Ed25519PrivateKey.generate()
+        return self._dump_key(key)
+
+    def create_root_crt(self, key, subj, validity_period):
+        key = self._load_key(key)
+        name = self._name(subj)
+        builder = self._builder(name, name, key.public_key(), validity_period)
+        builder = builder.add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        builder = builder.add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(key.public_key()), critical=False)
+        builder = builder.add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        return self._sign(builder, key)
+
+    def create_site_crt(self, key, subj, alt_names, validity_period, root):
+        key = self._load_key(key)
+        return self._site_crt(self._name(subj), key.public_key(), alt_names, validity_period, root)
+
+    def sign_csr(self, csr, subj, alt_names, validity_period, root):
+        """Sign a PEM certificate signing request with the site certificate subject subj and extensions"""
+        csr = load_csr(csr)
+        return self._site_crt(self._name(subj), csr.public_key(), alt_names, validity_period, root)
+
+    def _site_crt(self, subject, public_key, alt_names, validity_period, root):
+        root_crt = root.certificate
+        builder = self._builder(subject, root_crt.subject, public_key, validity_period)
+        builder = builder.add_extension(authority_key_identifier(root_crt), critical=False)
+        builder = builder.add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=False)
+        builder = builder.add_extension(x509.KeyUsage(
+            digital_signature=True, content_commitment=True, key_encipherment=True, data_encipherment=True,
+            key_agreement=False, key_cert_sign=False, crl_sign=False, encipher_only=False, decipher_only=False,
+        ), critical=False)
+        builder = builder.add_extension(x509.ExtendedKeyUsage([
+            ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH,
+        ]), critical=False)
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([self._general_name(name) for name in alt_names]), critical=False)
+        url = crl_url()
+        if url:
+            builder = builder.add_extension(x509.CRLDistributionPoints(distribution_points(url)), critical=False)
+        return self._sign(builder, root.private_key)
+
+    @staticmethod
+    def _builder(subject, issuer, public_key, validity_period):
+        now = datetime.datetime.utcnow()
+        try:
+            return x509.CertificateBuilder() \
+                .subject_name(subject) \
+                .issuer_name(issuer) \
+                .public_key(public_key) \
+                .serial_number(x509.random_serial_number()) \
+                .not_valid_before(now) \
+                .not_valid_after(now + datetime.timedelta(days=validity_period))
+        except ValueError as e:
+            raise CaError(str(e))
+
+    @staticmethod
+    def _general_name(name):
+        kind, value = name.split(':', 1)
+        if kind == 'IP':
+            return x509.IPAddress(ipaddress.ip_address(value))
+        return x509.DNSName(value)
+
+    @staticmethod
+    def _name(subj):
+        attributes = []
+        try:
+            for key, value in subj.items():
+                if value not in ['', None] and key != 'validity_period':
+                    attributes.append(x509.NameAttribute(NAME_OIDS[key], value))
+        except ValueError as e:
+            raise CaError(str(e))
+        return x509.Name(attributes)
+
+    @staticmethod
+    def _sign(builder, key):
+        crt = builder.sign(private_key=key, algorithm=signature_hash(key))
+        return crt.public_bytes(serialization.Encoding.PEM).decode()
+
+    @staticmethod
+    def _load_key(key):
+        try:
+            return serialization.load_pem_private_key(key.encode(), password=None)
+        except ValueError as e:
+            raise CaError(str(e))
+
+    @staticmethod
+    def _dump_key(key):
+        return key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        ).decode()
@@ -0,0 +1,101 @@
+import contextlib
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import models
+from core.utils import Ca
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(kind, **params):
+    return models.IssuanceJob.objects.create(kind=kind, params=params)
+
+
+def claim():
+    """Mark the oldest pending job as running and return it, None if the queue is empty
+
+    A running job without a heartbeat for ISSUANCE_JOB_TIMEOUT lost its worker and is claimed again,
+    after ISSUANCE_JOB_ATTEMPTS claims it is failed instead.
+    The status is switched with a conditional update, so concurrent workers never run one job twice.
+    """
+    now = timezone.now()
+    stale = Q(status=models.IssuanceJob.RUNNING,
+              date_heartbeat__lt=now - datetime.timedelta(seconds=settings.ISSUANCE_JOB_TIMEOUT))
+    models.IssuanceJob.objects.filter(stale, attempts__gte=settings.ISSUANCE_JOB_ATTEMPTS).update(
+        status=models.IssuanceJob.FAILED, error='Worker did not finish the job', date_finished=now)
+
+    queryset = models.IssuanceJob.objects.filter(Q(status=models.IssuanceJob.PENDING) | stale)
+    for job in queryset.order_by('pk')[:10]:
+        claimed = models.IssuanceJob.objects.filter(pk=job.pk, status=job.status, date_started=job.date_started) \
+            .update(status=models.IssuanceJob.RUNNING, date_started=now, date_heartbeat=now,
+                    attempts=F('attempts') + 1)
+        if claimed:
+            job.status = models.IssuanceJob.RUNNING
+            job.date_started = job.date_heartbeat = now
+            job.attempts += 1
+            return job
+
+
+def beat(job):
+    """Refresh the heartbeat of a job, False once it finished or was claimed again"""
+    return bool(models.IssuanceJob.objects.filter(pk=job.pk, status=models.IssuanceJob.RUNNING, attempts=job.attempts)
+                .update(date_heartbeat=timezone.now()))
+
+
+@contextlib.contextmanager
+def heartbeat(job):
+    """Keep a job claimed while the block runs, beating every ISSUANCE_JOB_HEARTBEAT seconds in a thread"""
+    stop = threading.Event()
+
+    def loop():
+        try:
+            while not stop.wait(settings.ISSUANCE_JOB_HEARTBEAT) and beat(job):
+                pass
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(job):
+    with heartbeat(job):
+        return _run(job)
+
+
+def _run(job):
+    params = dict(job.params)
+    params['validity_period'] = datetime.date.fromisoformat(params['validity_period'])
+    ca = Ca()
+    try:
+        if job.kind == models.IssuanceJob.SITE_CRT:
+            job.site_crt = ca.generate_site_crt(params['cn'], params['validity_period'],
+                                               alt_names=params.get('alt_names') or [],
+                                               algorithm=params.get('key_algorithm'))
+        elif job.kind == models.IssuanceJob.SITE_CRT_RECREATE:
+            ca.generate_site_crt(params['cn'], params['validity_period'], params['pk'])
+            job.site_crt_id = params['pk']
+        elif job.kind == models.IssuanceJob.ROOT_CRT:
+            ca.generate_root_crt(params)
+        elif job.kind == models.IssuanceJob.ROOT_CRT_RECREATE:
+            ca.generate_root_crt(params, recreation=True)
+        job.status = models.IssuanceJob.DONE
+    except Exception as e:
+        logger.exception('Issuance job %s failed', job.pk)
+        job.status = models.IssuanceJob.FAILED
+        job.error = str(e)
+    job.date_finished = timezone.now()
+    job.save()
+    return job
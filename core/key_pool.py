@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import models
+
+
+def take(backend, algorithm=None, generate=True):
+    """Return a pre-generated key from the pool or generate a new one if the pool ran dry
+
+    Every candidate row is claimed by deleting it, so one key is never handed out twice
+    even when several web and worker processes take keys concurrently. With generate=False
+    a dry pool returns None and the caller generates the key itself.
+    """
+    algorithm = algorithm or settings.DEFAULT_KEY_ALGORITHM
+    for pooled in models.PooledKey.objects.filter(algorithm=algorithm).order_by('pk')[:5]:
+        deleted, _ = models.PooledKey.objects.filter(pk=pooled.pk).delete()
+        if deleted:
+            _count(algorithm, taken=F('taken') + 1)
+            return pooled.key
+
+    _count(algorithm, misses=F('misses') + 1)
+    if generate:
+        return backend.generate_key(algorithm)
+
+
+def take_many(algorithm, count):
+    """Return count pre-generated keys of one algorithm in a few queries, None in place of each missing one
+
+    The rows are locked and deleted together. If another process deleted some of them first, none
+    are handed out here and the caller generates all keys itself.
+    """
+    with transaction.atomic():
+        pooled = list(models.PooledKey.objects.select_for_update(skip_locked=True)
+                      .filter(algorithm=algorithm).order_by('pk')[:count])
+        deleted, _ = models.PooledKey.objects.filter(pk__in=[obj.pk for obj in pooled]).delete()
+    keys = [obj.key for obj in pooled] if deleted == len(pooled) else []
+
+    _count(algorithm, taken=F('taken') + len(keys), misses=F('misses') + (count - len(keys)))
+    return keys + [None] * (count - len(keys))
+
+
+def depth(algorithm=None):
+    algorithm = algorithm or settings.DEFAULT_KEY_ALGORITHM
+    return models.PooledKey.objects.filter(algorithm=algorithm).count()
+
+
+def refill(backend, algorithm=None, size=None):
+    algorithm = algorithm or settings.DEFAULT_KEY_ALGORITHM
+    if size is None:
+        size = settings.KEY_POOL_SIZE.get(algorithm, 0)
+
+    start = time.monotonic()
+    keys = [models.PooledKey(algorithm=algorithm, key=backend.generate_key(algorithm))
+            for _ in range(max(size - depth(algorithm), 0))]
+    models.PooledKey.objects.bulk_create(keys)
+
+    if keys:
+        _count(
+            algorithm,
+            refilled=F('refilled') + len(keys),
+            last_refill_count=len(keys),
+            last_refill_seconds=time.monotonic() - start,
+            date_refilled=timezone.now(),
+        )
+    return len(keys)
+
+
+def stats():
+    result = []
+    for obj in models.KeyPoolStats.objects.order_by('algorithm'):
+        result.append({
+            'algorithm': obj.algorithm,
+            'depth': depth(obj.algorithm),
+            'size': settings.KEY_POOL_SIZE.get(obj.algorithm, 0),
+            'taken': obj.taken,
+            'misses': obj.misses,
+            'refilled': obj.refilled,
+            'refill_rate': obj.last_refill_count / obj.last_refill_seconds if obj.last_refill_seconds else None,
+            'date_refilled': obj.date_refilled,
+        })
+    return result
+
+
+def _count(algorithm, **counters):
+    models.KeyPoolStats.objects.get_or_create(algorithm=algorithm)
+    models.KeyPoolStats.objects.filter(algorithm=algorithm).update(**counters)
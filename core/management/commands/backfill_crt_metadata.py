@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from core import models
+
+
+class Command(BaseCommand):
+    help = 'Fill plaintext metadata columns of certificates written before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Refresh rows that already have metadata')
+
+    def handle(self, *args, **options):
+        for model in (models.RootCrt, models.SiteCrt):
+            self.backfill(model, options['batch_size'], options['all'])
+
+    def backfill(self, model, batch_size, refresh_all):
+        fields = ['pk', 'cn', 'crt'] if model is models.SiteCrt else ['pk', 'crt']
+        queryset = model.objects.only(*fields).order_by('pk')
+        if not refresh_all:
+            queryset = queryset.filter(fingerprint__isnull=True)
+
+        count = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for obj in batch:
+                obj.set_crt_metadata()
+            model.objects.bulk_update(batch, model.METADATA_FIELDS)
+            if model is models.SiteCrt:
+                models.SubjectAltName.index(batch)
+            last_pk = batch[-1].pk
+            count += len(batch)
+            self.stdout.write('{}: {} rows'.format(model.__name__, count))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+from core import models
+from core.issuance import CaError
+
+
+class Command(BaseCommand):
+    help = 'Time hot code paths, run without arguments to list the benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*')
+        parser.add_argument('--iterations', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if not options['names']:
+            for name in sorted(benchmarks.BENCHMARKS):
+                self.stdout.write(name)
+            return
+
+        for name in options['names']:
+            if name not in benchmarks.BENCHMARKS:
+                raise CommandError('Unknown benchmark: {}'.format(name))
+            self.stdout.write(name)
+            try:
+                result = benchmarks.run(name, options['iterations'])
+            except (CaError, models.RootCrt.DoesNotExist) as e:
+                raise CommandError('{}: {}'.format(name, e))
+            for label, seconds in result:
+                self.stdout.write('  {label}: {us:.1f} us/call, {rate:.1f} calls/s'.format(
+                    label=label, us=seconds * 1e6, rate=1 / seconds))
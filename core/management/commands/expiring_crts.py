@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import models
+
+
+class Command(BaseCommand):
+    help = 'List certificates expiring within the given number of days, soonest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--limit', type=int, default=settings.EXPIRING_LIMIT)
+        parser.add_argument('--expired', action='store_true', help='Include certificates that already expired')
+
+    def handle(self, *args, **options):
+        rows = models.SiteCrt.objects.expiring(options['days'], options['expired']) \
+            .values_list('date_end', 'cn', 'serial')[:options['limit']]
+        for date_end, cn, serial in rows.iterator():
+            self.stdout.write('{}\t{}\t{}'.format(date_end.isoformat(), cn, serial or ''))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import export
+
+
+class Command(BaseCommand):
+    help = 'Write an archive of certificates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive file to write')
+        parser.add_argument('--format', choices=list(export.FORMATS), default='tar.gz')
+        parser.add_argument('--id', type=int, action='append', dest='ids', help='Certificate id, repeatable')
+        parser.add_argument('--cn', help='Export certificates whose common name contains this value')
+        parser.add_argument('--keys', action='store_true', help='Include private keys')
+        parser.add_argument('--root', action='store_true', help='Include the root certificate')
+
+    def handle(self, *args, **options):
+        queryset = export.filter_queryset(options['ids'], options['cn'])
+        try:
+            with open(options['path'], 'wb') as f:
+                for chunk in export.stream(queryset, options['format'], options['keys'], options['root']):
+                    f.write(chunk)
+        except OSError as e:
+            raise CommandError(e)
@@ -0,0 +1,28 @@
+import tarfile
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importer
+
+
+class Command(BaseCommand):
+    help = 'Import certificates with their private keys from a directory, tar or zip archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            result = importer.import_files(importer.read_files(options['path']), progress=self.progress,
+                                           batch_size=options['batch_size'])
+        except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+            raise CommandError(e)
+
+        for name, error in result.errors:
+            self.stderr.write('{}: {}'.format(name, error))
+        self.stdout.write('Imported {} certificates, {} errors'.format(result.imported, len(result.errors)))
+
+    def progress(self, done, total):
+        self.stdout.write('{}/{} certificates processed'.format(done, total))
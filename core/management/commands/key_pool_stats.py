@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core import key_pool
+
+
+class Command(BaseCommand):
+    help = 'Show depth, refill rate and dry runs of the private key pool'
+
+    def handle(self, *args, **options):
+        for row in key_pool.stats():
+            refill_rate = '{:.1f} keys/s'.format(row['refill_rate']) if row['refill_rate'] else '-'
+            self.stdout.write(
+                '{algorithm}: depth {depth}/{size}, taken {taken}, ran dry {misses}, '
+                'refilled {refilled}, refill rate {refill_rate}, last refill {date_refilled}'.format(
+                    refill_rate=refill_rate, **{k: v for k, v in row.items() if k != 'refill_rate'}))
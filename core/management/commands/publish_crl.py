@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import crl
+from core import models
+
+
+class Command(BaseCommand):
+    help = 'Sign a new CRL when revocations changed or the published one is half way to nextUpdate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Sign a new full CRL unconditionally')
+        parser.add_argument('--loop', action='store_true', help='Keep publishing until interrupted')
+        parser.add_argument('--interval', type=float, default=settings.CRL_PUBLISH_INTERVAL,
+                            help='Seconds between checks in loop mode')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        while True:
+            try:
+                signed = crl.publish(force=force)
+            except models.RootCrt.DoesNotExist:
+                signed = []
+            for obj in signed:
+                if obj.is_delta():
+                    self.stdout.write('delta CRL {} of CRL {}'.format(obj.number, obj.base_number))
+                else:
+                    self.stdout.write('CRL {}, {} revocations'.format(obj.number, obj.revocations))
+            force = False
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core import encryption
+from core import models
+
+
+class Command(BaseCommand):
+    help = 'Rewrite encrypted columns still in the legacy format, safe to interrupt and run again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in apps.get_app_config('core').get_models():
+            for field in model._meta.fields:
+                if isinstance(field, models.EncryptedTextField):
+                    self.reencrypt(model, field.name, options['batch_size'])
+
+    def reencrypt(self, model, field, batch_size):
+        queryset = model.objects.only('pk', field).exclude(**{field + '__isnull': True}) \
+            .exclude(**{field + '__startswith': encryption.PREFIX}).order_by('pk')
+
+        count = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            model.objects.bulk_update(batch, [field])
+            last_pk = batch[-1].pk
+            count += len(batch)
+            self.stdout.write('{}.{}: {} rows'.format(model.__name__, field, count))
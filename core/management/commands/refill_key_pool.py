@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import key_pool
+from core.issuance import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Fill the pool of pre-generated private keys up to KEY_POOL_SIZE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep refilling the pool until interrupted')
+        parser.add_argument('--interval', type=float, default=settings.KEY_POOL_REFILL_INTERVAL,
+                            help='Seconds between refills in loop mode')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        while True:
+            for algorithm, size in settings.KEY_POOL_SIZE.items():
+                count = key_pool.refill(backend, algorithm, size)
+                if count:
+                    self.stdout.write('{}: added {} keys'.format(algorithm, count))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import models
+from core import ocsp
+
+
+class Command(BaseCommand):
+    help = 'Pre-sign OCSP responses that are missing or close to nextUpdate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing until interrupted')
+        parser.add_argument('--interval', type=float, default=settings.OCSP_REFRESH_INTERVAL,
+                            help='Seconds between refreshes in loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                count = ocsp.refresh(options['batch_size'])
+            except models.RootCrt.DoesNotExist:
+                count = 0
+            if count:
+                self.stdout.write('signed {} OCSP responses'.format(count))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import models
+from core import renewal
+
+
+class Command(BaseCommand):
+    help = 'Renew certificates within RENEWAL_WINDOW of expiry in rate limited batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.RENEWAL_BATCH_SIZE)
+        parser.add_argument('--rate', type=float, default=settings.RENEWAL_RATE,
+                            help='Most certificates renewed per minute')
+        parser.add_argument('--loop', action='store_true', help='Keep renewing until interrupted')
+        parser.add_argument('--interval', type=float, default=settings.RENEWAL_INTERVAL,
+                            help='Seconds between checks for due certificates in loop mode')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the certificates that are due')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for obj in renewal.due(options['batch_size']):
+                self.stdout.write('{}\t{}'.format(obj.date_end.isoformat(), obj.cn))
+            return
+
+        while True:
+            started = time.monotonic()
+            site_crts = renewal.due(options['batch_size'])
+            if site_crts:
+                renewals = renewal.renew(site_crts)
+                failed = [r for r in renewals if r.status == models.Renewal.FAILED]
+                self.stdout.write('renewed {}, failed {}'.format(len(renewals) - len(failed), len(failed)))
+                for r in failed:
+                    self.stderr.write('{}: {}'.format(r.site_crt.cn, r.error))
+                time.sleep(max(len(site_crts) * 60 / options['rate'] - (time.monotonic() - started), 0))
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
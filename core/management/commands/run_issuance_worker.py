@@ -0,0 +1,47 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued certificate issuance jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.ISSUANCE_WORKER_CONCURRENCY,
+                            help='Number of jobs run at the same time')
+        parser.add_argument('--interval', type=float, default=settings.ISSUANCE_WORKER_INTERVAL,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] == 1:
+            return self.work(options['interval'], options['once'])
+
+        threads = [threading.Thread(target=self.work_thread, args=(options['interval'], options['once']), daemon=True)
+                   for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def work(self, interval, once):
+        while True:
+            job = jobs.claim()
+            if job:
+                jobs.run(job)
+                self.stdout.write('job {}: {} {}'.format(job.pk, job.kind, job.status))
+            elif once:
+                break
+            else:
+                time.sleep(interval)
+
+    def work_thread(self, interval, once):
+        try:
+            self.work(interval, once)
+        finally:
+            connection.close()
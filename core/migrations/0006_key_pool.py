@@ -0,0 +1,36 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:08
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_auto_20170628_1141'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyPoolStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.CharField(max_length=16, unique=True)),
+                ('taken', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=0)),
+                ('refilled', models.PositiveIntegerField(default=0)),
+                ('last_refill_count', models.PositiveIntegerField(default=0)),
+                ('last_refill_seconds', models.FloatField(default=0)),
+                ('date_refilled', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PooledKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.CharField(db_index=True, max_length=16)),
+                ('key', core.models.EncryptedTextField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:12
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_key_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssuanceJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('site_crt', 'Create certificate'), ('site_crt_recreate', 'Recreate certificate'), ('root_crt', 'Generate root certificate'), ('root_crt_recreate', 'Recreate root certificate')], max_length=32)),
+                ('params', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_started', models.DateTimeField(blank=True, null=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+                ('site_crt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.sitecrt')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_crt_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitecrt',
+            name='date_end',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
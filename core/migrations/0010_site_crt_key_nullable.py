@@ -0,0 +1,19 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:19
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_site_crt_date_end_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitecrt',
+            name='key',
+            field=core.models.EncryptedTextField(blank=True, null=True),
+        ),
+    ]
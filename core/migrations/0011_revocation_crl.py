@@ -0,0 +1,40 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_site_crt_key_nullable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Crl',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(unique=True)),
+                ('base_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('issuer_hash', models.CharField(db_index=True, max_length=64)),
+                ('der', models.BinaryField()),
+                ('revoked_through', models.PositiveIntegerField(default=0)),
+                ('revocations', models.PositiveIntegerField(default=0)),
+                ('this_update', models.DateTimeField()),
+                ('next_update', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Revocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial', models.CharField(max_length=64, unique=True)),
+                ('issuer_hash', models.CharField(db_index=True, max_length=64)),
+                ('reason', models.CharField(choices=[('unspecified', 'Unspecified'), ('keyCompromise', 'Key compromise'), ('cACompromise', 'CA compromise'), ('affiliationChanged', 'Affiliation changed'), ('superseded', 'Superseded'), ('cessationOfOperation', 'Cessation of operation'), ('certificateHold', 'Certificate hold'), ('privilegeWithdrawn', 'Privilege withdrawn')], default='unspecified', max_length=32)),
+                ('date_revoked', models.DateTimeField(default=django.utils.timezone.now)),
+                ('site_crt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revocations', to='core.sitecrt')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_revocation_crl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcspResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial', models.CharField(max_length=64)),
+                ('algorithm', models.CharField(max_length=16)),
+                ('issuer_hash', models.CharField(db_index=True, max_length=64)),
+                ('der', models.BinaryField()),
+                ('this_update', models.DateTimeField()),
+                ('next_update', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'unique_together': {('serial', 'algorithm')},
+            },
+        ),
+    ]
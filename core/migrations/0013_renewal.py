@@ -0,0 +1,28 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ocsp_response'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Renewal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('done', 'Done'), ('failed', 'Failed')], max_length=16)),
+                ('old_serial', models.CharField(blank=True, max_length=64, null=True)),
+                ('new_serial', models.CharField(blank=True, max_length=64, null=True)),
+                ('old_date_end', models.DateTimeField()),
+                ('new_date_end', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('site_crt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renewals', to='core.sitecrt')),
+            ],
+        ),
+    ]
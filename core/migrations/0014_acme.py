@@ -0,0 +1,65 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_renewal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcmeAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thumbprint', models.CharField(max_length=64, unique=True)),
+                ('jwk', models.JSONField()),
+                ('contact', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('valid', 'Valid'), ('deactivated', 'Deactivated')], default='valid', max_length=16)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AcmeAuthorization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier_type', models.CharField(max_length=8)),
+                ('identifier', models.CharField(max_length=256)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('valid', 'Valid'), ('invalid', 'Invalid')], default='pending', max_length=16)),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('error', models.TextField(blank=True)),
+                ('expires', models.DateTimeField()),
+                ('date_validated', models.DateTimeField(blank=True, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='authorizations', to='core.acmeaccount')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AcmeNonce',
+            fields=[
+                ('value', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AcmeOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('processing', 'Processing'), ('valid', 'Valid'), ('invalid', 'Invalid')], default='pending', max_length=16)),
+                ('identifiers', models.JSONField()),
+                ('crt', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('expires', models.DateTimeField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='core.acmeaccount')),
+                ('authorizations', models.ManyToManyField(related_name='orders', to='core.AcmeAuthorization')),
+                ('site_crt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='acme_orders', to='core.sitecrt')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='acmeauthorization',
+            index=models.Index(fields=['account', 'identifier', 'status'], name='core_acmeau_account_5b4dfd_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_alt_names(apps, schema_editor):
+    SiteCrt = apps.get_model('core', 'SiteCrt')
+    SubjectAltName = apps.get_model('core', 'SubjectAltName')
+
+    last_pk = 0
+    while True:
+        batch = list(SiteCrt.objects.filter(pk__gt=last_pk, san__isnull=False).order_by('pk')
+                     .values_list('pk', 'san')[:1000])
+        if not batch:
+            break
+        SubjectAltName.objects.bulk_create([
+            SubjectAltName(site_crt_id=pk, name=name) for pk, san in batch for name in set(san)
+        ])
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_acme'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectAltName',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=260)),
+                ('site_crt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alt_names', to='core.sitecrt')),
+            ],
+            options={
+                'unique_together': {('site_crt', 'name')},
+            },
+        ),
+        migrations.RunPython(index_alt_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:48
+
+from django.db import migrations, models, transaction
+
+from core import encryption
+
+BATCH_SIZE = 500
+PEM_PREFIX = '-----BEGIN'
+
+
+def convert(apps, model_name, pending, transform):
+    """Rewrite crt of the rows selected by pending in committed batches, so an interrupted run resumes"""
+    model = apps.get_model('core', model_name)
+    last_pk = 0
+    while True:
+        batch = list(pending(model.objects.filter(pk__gt=last_pk)).only('pk', 'crt').order_by('pk')[:BATCH_SIZE])
+        if not batch:
+            break
+        for obj in batch:
+            obj.crt = transform(obj.crt)
+        with transaction.atomic():
+            model.objects.bulk_update(batch, ['crt'])
+        last_pk = batch[-1].pk
+
+
+def decrypt_crt(apps, schema_editor):
+    for model_name in ('RootCrt', 'SiteCrt'):
+        convert(apps, model_name, lambda queryset: queryset.exclude(crt__startswith=PEM_PREFIX), encryption.decrypt)
+
+
+def encrypt_crt(apps, schema_editor):
+    for model_name in ('RootCrt', 'SiteCrt'):
+        convert(apps, model_name, lambda queryset: queryset.filter(crt__startswith=PEM_PREFIX), encryption.encrypt)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_subject_alt_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rootcrt',
+            name='crt',
+            field=models.TextField(),
+        ),
+        migrations.AlterField(
+            model_name='sitecrt',
+            name='crt',
+            field=models.TextField(),
+        ),
+        migrations.RunPython(decrypt_crt, encrypt_crt),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_plain_crt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rootcrt',
+            name='crt_der',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='sitecrt',
+            name='crt_der',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='rootcrt',
+            name='crt',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='sitecrt',
+            name='crt',
+            field=models.TextField(null=True),
+        ),
+    ]
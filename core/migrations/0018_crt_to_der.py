@@ -0,0 +1,73 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:05
+
+from cryptography import x509
+from django.conf import settings
+from django.db import migrations, transaction
+
+from core import crt_metadata
+
+BATCH_SIZE = 500
+
+
+def convert(apps, model_name, source, target, transform, keep):
+    """Fill target from source in committed batches, rows already converted are skipped on a rerun
+
+    A row transform rejects with ValueError is written through keep instead and reported.
+    """
+    model = apps.get_model('core', model_name)
+    queryset = model.objects.filter(**{target + '__isnull': True}).only('pk', source).order_by('pk')
+    last_pk = 0
+    failed = []
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        for obj in batch:
+            value = getattr(obj, source)
+            try:
+                value = transform(value)
+            except ValueError:
+                failed.append(obj.pk)
+                value = keep(value)
+            setattr(obj, target, value)
+        with transaction.atomic():
+            model.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+    if failed:
+        print('\n  {} {} rows not a single certificate, kept as stored: {}'.format(
+            len(failed), model_name, ', '.join(map(str, failed))))
+
+
+def store(pem):
+    der = crt_metadata.pem_to_der(pem)
+    if settings.CRT_STORAGE_FORMAT == 'der':
+        return der
+    return crt_metadata.der_to_pem(der).encode()
+
+
+def load(value):
+    der = crt_metadata.stored_to_der(value)
+    x509.load_der_x509_certificate(der)
+    return crt_metadata.der_to_pem(der)
+
+
+def to_binary(apps, schema_editor):
+    for model_name in ('RootCrt', 'SiteCrt'):
+        convert(apps, model_name, 'crt', 'crt_der', store, str.encode)
+
+
+def to_text(apps, schema_editor):
+    for model_name in ('RootCrt', 'SiteCrt'):
+        convert(apps, model_name, 'crt_der', 'crt', load, lambda value: bytes(value).decode(errors='replace'))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_crt_der_column'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_binary, to_text),
+    ]
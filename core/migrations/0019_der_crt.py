@@ -0,0 +1,43 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:05
+
+from django.db import migrations
+
+import core.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_crt_to_der'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='rootcrt',
+            name='crt',
+        ),
+        migrations.RemoveField(
+            model_name='sitecrt',
+            name='crt',
+        ),
+        migrations.RenameField(
+            model_name='rootcrt',
+            old_name='crt_der',
+            new_name='crt',
+        ),
+        migrations.RenameField(
+            model_name='sitecrt',
+            old_name='crt_der',
+            new_name='crt',
+        ),
+        migrations.AlterField(
+            model_name='rootcrt',
+            name='crt',
+            field=core.models.CertificateField(),
+        ),
+        migrations.AlterField(
+            model_name='sitecrt',
+            name='crt',
+            field=core.models.CertificateField(),
+        ),
+    ]
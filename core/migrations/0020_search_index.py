@@ -0,0 +1,38 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+from core import crt_metadata
+
+
+def reindex(apps, schema_editor):
+    SiteCrt = apps.get_model('core', 'SiteCrt')
+    SubjectAltName = apps.get_model('core', 'SubjectAltName')
+
+    last_pk = 0
+    while True:
+        batch = list(SiteCrt.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'cn', 'san')[:1000])
+        if not batch:
+            break
+        SubjectAltName.objects.filter(site_crt__in=[pk for pk, cn, san in batch]).delete()
+        SubjectAltName.objects.bulk_create([
+            SubjectAltName(site_crt_id=pk, name=name, reversed_name=crt_metadata.reversed_domain(name))
+            for pk, cn, san in batch for name in set(san or []) | {'CN:' + cn.lower()}
+        ])
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_der_crt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subjectaltname',
+            name='reversed_name',
+            field=models.CharField(blank=True, db_index=True, max_length=260),
+        ),
+        migrations.RunPython(reindex, migrations.RunPython.noop),
+    ]
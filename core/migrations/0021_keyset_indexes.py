@@ -0,0 +1,26 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitecrt',
+            name='date_end',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='sitecrt',
+            index=models.Index(fields=['date_start', 'id'], name='core_sitecr_date_st_221cf5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sitecrt',
+            index=models.Index(fields=['date_end', 'id'], name='core_sitecr_date_en_e7db52_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issuancejob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+def start_heartbeats(apps, schema_editor):
+    # jobs running during the upgrade time out from their start, as before
+    model = apps.get_model('core', 'IssuanceJob')
+    model.objects.filter(status='running').update(date_heartbeat=models.F('date_started'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_big_auto_field_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issuancejob',
+            name='date_heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
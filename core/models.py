@@ -1,11 +1,17 @@
-from swutils.encrypt import decrypt,encrypt
+import datetime
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
+from core import crt_metadata
+from core import encryption
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
@@ -13,17 +19,146 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
         Token.objects.create(user=instance)
 
 
+class DecryptedAttribute(DeferredAttribute):
+    """Decrypt the loaded value on first access and keep the plaintext on the instance"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, encryption.Ciphertext):
+            value = instance.__dict__[self.field.attname] = value.decrypt()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
 class EncryptedTextField(models.TextField):
+    """Text stored encrypted with SECRET_KEY, see core.encryption
+
+    Loaded rows keep the ciphertext until the attribute is read, and an unread value is saved back as is.
+    """
+    descriptor_class = DecryptedAttribute
 
     def from_db_value(self, value, expression, connection, context=None):
         if value is None:
             return value
-        return decrypt(value, settings.SECRET_KEY.encode('utf-8'))
+        return encryption.Ciphertext(value)
 
     def to_python(self, value):
+        if isinstance(value, encryption.Ciphertext):
+            return value.decrypt()
+        return super().to_python(value)
+
+    def pre_save(self, model_instance, add):
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
         if value is None:
             return value
-        return encrypt(value, settings.SECRET_KEY.encode('utf-8'))
+        if isinstance(value, encryption.Ciphertext):
+            return value.value
+        return encryption.encrypt(super().get_prep_value(value))
+
+
+class PemAttribute(DeferredAttribute):
+    """Render the loaded value as PEM on first access and keep the text on the instance"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = instance.__dict__[self.field.attname] = crt_metadata.stored_to_pem(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CertificateField(models.BinaryField):
+    """Certificate read and assigned as PEM text, stored as PEM or DER per CRT_STORAGE_FORMAT
+
+    Rows in either format are read, DER bytes may be assigned as well. An unread value is saved back as loaded,
+    without a PEM round trip.
+    """
+    descriptor_class = PemAttribute
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            del kwargs['editable']
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection, context=None):
+        if value is None:
+            return value
+        return bytes(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return crt_metadata.stored_to_pem(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, memoryview)):
+            return value
+        der = crt_metadata.pem_to_der(value)
+        if settings.CRT_STORAGE_FORMAT == 'der':
+            return der
+        return crt_metadata.der_to_pem(der).encode()
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+class CrtMetadata(models.Model):
+    """Plaintext columns extracted from crt on every write, so pages and the API need not parse it"""
+    serial = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    subject = models.JSONField(blank=True, null=True)
+    issuer_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    not_before = models.DateTimeField(blank=True, null=True)
+    not_after = models.DateTimeField(blank=True, null=True, db_index=True)
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    key_type = models.CharField(max_length=16, blank=True, null=True)
+    key_size = models.PositiveIntegerField(blank=True, null=True)
+    san = models.JSONField(blank=True, null=True)
+
+    METADATA_FIELDS = ['serial', 'subject', 'issuer_hash', 'not_before', 'not_after', 'fingerprint', 'key_type',
+                       'key_size', 'san']
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def crt_metadata(crt):
+        return crt_metadata.parse(crt)
+
+    @property
+    def key_algorithm(self):
+        return crt_metadata.key_algorithm(self.key_type, self.key_size)
+
+    def set_crt_metadata(self):
+        for field, value in self.crt_metadata(self.crt).items():
+            setattr(self, field, value)
+
+    def has_crt_metadata(self):
+        return self.fingerprint is not None
+
+    @property
+    def crt_der(self):
+        value = self.__dict__.get('crt')
+        if isinstance(value, bytes):
+            return crt_metadata.stored_to_der(value)
+        return crt_metadata.pem_to_der(self.crt)
 
 
 def directory_path_root_key(instance, filename):
@@ -34,9 +169,9 @@ def directory_path_root_crt(instance, filename):
     return settings.ROOT_CRT_PATH + '/rootCA.crt'
 
 
-class RootCrt(models.Model):
+class RootCrt(CrtMetadata):
     key = EncryptedTextField()
-    crt = EncryptedTextField()
+    crt = CertificateField()
     country = models.CharField(max_length=2)
     state = models.CharField(max_length=32)
     location = models.CharField(max_length=128)
@@ -45,6 +180,23 @@ class RootCrt(models.Model):
     email = models.EmailField(blank=True, null=True, max_length=128)
 
 
+@receiver(post_save, sender=RootCrt)
+@receiver(post_delete, sender=RootCrt)
+def invalidate_root_cache(sender, **kwargs):
+    from core import root_cache
+    from core import crl
+    from core import ocsp
+    root_cache.invalidate()
+    crl.invalidate()
+    ocsp.invalidate()
+
+
+@receiver(post_save, sender=RootCrt)
+def publish_crl(sender, **kwargs):
+    from core import crl
+    transaction.on_commit(crl.publish)
+
+
 def directory_path_key(instance, filename):
     return '{cn}/{cn}.key'.format(cn=instance.cn)
 
@@ -53,9 +205,309 @@ def directory_path_crt(instance, filename):
     return '{cn}/{cn}.crt'.format(cn=instance.cn)
 
 
-class SiteCrt(models.Model):
-    key = EncryptedTextField()
-    crt = EncryptedTextField()
+class SiteCrtQuerySet(models.QuerySet):
+    def expiring(self, days, include_expired=False):
+        """Certificates whose notAfter is within days from now, soonest first"""
+        now = timezone.now()
+        queryset = self.filter(date_end__lte=now + datetime.timedelta(days=days))
+        if not include_expired:
+            queryset = queryset.filter(date_end__gt=now)
+        return queryset.order_by('date_end', 'pk')
+
+
+class SiteCrt(CrtMetadata):
+    key = EncryptedTextField(blank=True, null=True)
+    crt = CertificateField()
     cn = models.CharField(max_length=256, unique=True)
     date_start = models.DateTimeField(auto_now_add=True)
     date_end = models.DateTimeField()
+
+    METADATA_FIELDS = CrtMetadata.METADATA_FIELDS + ['date_end']
+
+    objects = SiteCrtQuerySet.as_manager()
+
+    class Meta:
+        # keyset pagination of the certificates list, cn is unique; date_end also serves expiring()
+        indexes = [
+            models.Index(fields=['date_start', 'id']),
+            models.Index(fields=['date_end', 'id']),
+        ]
+
+    def is_revoked(self):
+        return self.serial is not None and self.revocations.filter(serial=self.serial).exists()
+
+    @staticmethod
+    def crt_metadata(crt):
+        metadata = CrtMetadata.crt_metadata(crt)
+        metadata['date_end'] = metadata['not_after']
+        return metadata
+
+
+class SubjectAltName(models.Model):
+    """Normalized alternative name of a site certificate, the index behind host lookups and search
+
+    name is "DNS:host" or "IP:address" as in SiteCrt.san, wildcards as "DNS:*.example.com", plus a "CN:" row
+    with the lowercased common name. reversed_name holds the labels of DNS and CN names top level first.
+    """
+    site_crt = models.ForeignKey(SiteCrt, on_delete=models.CASCADE, related_name='alt_names')
+    name = models.CharField(max_length=260, db_index=True)
+    reversed_name = models.CharField(max_length=260, blank=True, db_index=True)
+
+    class Meta:
+        unique_together = ('site_crt', 'name')
+
+    @classmethod
+    def names(cls, site_crt):
+        return set(site_crt.san or []) | {'CN:' + site_crt.cn.lower()}
+
+    @classmethod
+    def index(cls, site_crts):
+        """Replace the rows of site_crts by their cn and san metadata
+
+        Certificates inserted with bulk_create may lack a primary key, it is looked up by cn.
+        """
+        site_crts = list(site_crts)
+        missing = [obj.cn for obj in site_crts if obj.pk is None]
+        if missing:
+            pks = dict(SiteCrt.objects.filter(cn__in=missing).values_list('cn', 'pk'))
+            for obj in site_crts:
+                if obj.pk is None:
+                    obj.pk = pks.get(obj.cn)
+        with transaction.atomic():
+            cls.objects.filter(site_crt__in=[obj.pk for obj in site_crts]).delete()
+            cls.objects.bulk_create([
+                cls(site_crt_id=obj.pk, name=name, reversed_name=crt_metadata.reversed_domain(name))
+                for obj in site_crts for name in cls.names(obj)
+            ], batch_size=1000)
+
+
+# sent with site_crts and created after SiteCrt rows are written, by save() and by bulk_create, bulk_update and
+# update() callers, which skip post_save
+site_crts_saved = Signal()
+
+
+@receiver(post_save, sender=SiteCrt)
+def send_site_crts_saved(sender, instance, created, **kwargs):
+    site_crts_saved.send(sender=sender, site_crts=[instance], created=created)
+
+
+@receiver(site_crts_saved, sender=SiteCrt)
+def index_alt_names(sender, site_crts, **kwargs):
+    SubjectAltName.index(site_crts)
+
+
+@receiver(site_crts_saved, sender=SiteCrt)
+def invalidate_site_crt_caches(sender, site_crts, created, **kwargs):
+    from core import bundles
+    from core import ocsp
+    from core import pagination
+    if created:
+        pagination.invalidate()
+    else:
+        bundles.discard([obj.pk for obj in site_crts])
+        ocsp.discard([obj.serial for obj in site_crts])
+
+
+@receiver(post_delete, sender=SiteCrt)
+def invalidate_counts(sender, **kwargs):
+    from core import pagination
+    pagination.invalidate()
+
+
+class PooledKey(models.Model):
+    algorithm = models.CharField(max_length=16, db_index=True)
+    key = EncryptedTextField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+
+class KeyPoolStats(models.Model):
+    algorithm = models.CharField(max_length=16, unique=True)
+    taken = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    refilled = models.PositiveIntegerField(default=0)
+    last_refill_count = models.PositiveIntegerField(default=0)
+    last_refill_seconds = models.FloatField(default=0)
+    date_refilled = models.DateTimeField(blank=True, null=True)
+
+
+class IssuanceJob(models.Model):
+    SITE_CRT = 'site_crt'
+    SITE_CRT_RECREATE = 'site_crt_recreate'
+    ROOT_CRT = 'root_crt'
+    ROOT_CRT_RECREATE = 'root_crt_recreate'
+    KIND_CHOICES = (
+        (SITE_CRT, 'Create certificate'),
+        (SITE_CRT_RECREATE, 'Recreate certificate'),
+        (ROOT_CRT, 'Generate root certificate'),
+        (ROOT_CRT_RECREATE, 'Recreate root certificate'),
+    )
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    params = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    site_crt = models.ForeignKey(SiteCrt, blank=True, null=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True, null=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(blank=True, null=True)
+    # refreshed while a worker runs the job, see jobs.heartbeat()
+    date_heartbeat = models.DateTimeField(blank=True, null=True)
+    date_finished = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+class Revocation(models.Model):
+    UNSPECIFIED = 'unspecified'
+    KEY_COMPROMISE = 'keyCompromise'
+    CA_COMPROMISE = 'cACompromise'
+    AFFILIATION_CHANGED = 'affiliationChanged'
+    SUPERSEDED = 'superseded'
+    CESSATION_OF_OPERATION = 'cessationOfOperation'
+    CERTIFICATE_HOLD = 'certificateHold'
+    PRIVILEGE_WITHDRAWN = 'privilegeWithdrawn'
+    REASONS = (
+        (UNSPECIFIED, 'Unspecified'),
+        (KEY_COMPROMISE, 'Key compromise'),
+        (CA_COMPROMISE, 'CA compromise'),
+        (AFFILIATION_CHANGED, 'Affiliation changed'),
+        (SUPERSEDED, 'Superseded'),
+        (CESSATION_OF_OPERATION, 'Cessation of operation'),
+        (CERTIFICATE_HOLD, 'Certificate hold'),
+        (PRIVILEGE_WITHDRAWN, 'Privilege withdrawn'),
+    )
+
+    serial = models.CharField(max_length=64, unique=True)
+    issuer_hash = models.CharField(max_length=64, db_index=True)
+    site_crt = models.ForeignKey(SiteCrt, blank=True, null=True, on_delete=models.SET_NULL,
+                                 related_name='revocations')
+    reason = models.CharField(max_length=32, choices=REASONS, default=UNSPECIFIED)
+    date_revoked = models.DateTimeField(default=timezone.now)
+
+
+class Crl(models.Model):
+    """Signed certificate revocation list, a delta CRL when base_number is set"""
+    number = models.PositiveIntegerField(unique=True)
+    base_number = models.PositiveIntegerField(blank=True, null=True)
+    issuer_hash = models.CharField(max_length=64, db_index=True)
+    der = models.BinaryField()
+    revoked_through = models.PositiveIntegerField(default=0)
+    revocations = models.PositiveIntegerField(default=0)
+    this_update = models.DateTimeField()
+    next_update = models.DateTimeField()
+
+    def is_delta(self):
+        return self.base_number is not None
+
+
+class OcspResponse(models.Model):
+    """Pre-signed OCSP response for one serial and CertID hash algorithm"""
+    serial = models.CharField(max_length=64)
+    algorithm = models.CharField(max_length=16)
+    issuer_hash = models.CharField(max_length=64, db_index=True)
+    der = models.BinaryField()
+    this_update = models.DateTimeField()
+    next_update = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('serial', 'algorithm')
+
+
+class Renewal(models.Model):
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    site_crt = models.ForeignKey(SiteCrt, on_delete=models.CASCADE, related_name='renewals')
+    status = models.CharField(max_length=16, choices=STATUSES)
+    old_serial = models.CharField(max_length=64, blank=True, null=True)
+    new_serial = models.CharField(max_length=64, blank=True, null=True)
+    old_date_end = models.DateTimeField()
+    new_date_end = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class AcmeNonce(models.Model):
+    value = models.CharField(max_length=32, primary_key=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class AcmeAccount(models.Model):
+    VALID = 'valid'
+    DEACTIVATED = 'deactivated'
+    STATUSES = (
+        (VALID, 'Valid'),
+        (DEACTIVATED, 'Deactivated'),
+    )
+
+    thumbprint = models.CharField(max_length=64, unique=True)
+    jwk = models.JSONField()
+    contact = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=STATUSES, default=VALID)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+
+class AcmeAuthorization(models.Model):
+    """Authorization of an account for one identifier, proved by its http-01 challenge"""
+    PENDING = 'pending'
+    VALID = 'valid'
+    INVALID = 'invalid'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (VALID, 'Valid'),
+        (INVALID, 'Invalid'),
+    )
+
+    account = models.ForeignKey(AcmeAccount, on_delete=models.CASCADE, related_name='authorizations')
+    identifier_type = models.CharField(max_length=8)
+    identifier = models.CharField(max_length=256)
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    token = models.CharField(max_length=64, unique=True)
+    error = models.TextField(blank=True)
+    expires = models.DateTimeField()
+    date_validated = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['account', 'identifier', 'status'])]
+
+
+class AcmeOrder(models.Model):
+    PENDING = 'pending'
+    READY = 'ready'
+    PROCESSING = 'processing'
+    VALID = 'valid'
+    INVALID = 'invalid'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (PROCESSING, 'Processing'),
+        (VALID, 'Valid'),
+        (INVALID, 'Invalid'),
+    )
+
+    account = models.ForeignKey(AcmeAccount, on_delete=models.CASCADE, related_name='orders')
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    identifiers = models.JSONField()
+    authorizations = models.ManyToManyField(AcmeAuthorization, related_name='orders')
+    site_crt = models.ForeignKey(SiteCrt, blank=True, null=True, on_delete=models.SET_NULL, related_name='acme_orders')
+    # issued certificate chain, kept apart from site_crt which a later order for the same cn replaces
+    crt = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    expires = models.DateTimeField()
+    date_created = models.DateTimeField(auto_now_add=True)
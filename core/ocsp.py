@@ -0,0 +1,301 @@
+import datetime
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.x509 import ocsp
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from core import models
+from core import root_cache
+from core.issuance import signature_hash
+
+ALGORITHMS = {
+    'sha1': hashes.SHA1,
+    'sha256': hashes.SHA256,
+}
+DEFAULT_ALGORITHM = 'sha1'
+HASH_OIDS = {
+    'sha1': '1.3.14.3.2.26',
+    'sha256': '2.16.840.1.101.3.4.2.1',
+}
+OCSP_BASIC_OID = '1.3.6.1.5.5.7.48.1.1'
+NULL = b'\x05\x00'
+
+_lock = threading.Lock()
+_responses = {}
+_issuers = {}
+_revocations = None
+_checked = 0
+_window = 0
+_window_signs = 0
+
+
+def unsuccessful(status):
+    return ocsp.OCSPResponseBuilder.build_unsuccessful(status).public_bytes(serialization.Encoding.DER)
+
+
+MALFORMED_REQUEST = unsuccessful(ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+UNAUTHORIZED = unsuccessful(ocsp.OCSPResponseStatus.UNAUTHORIZED)
+TRY_LATER = unsuccessful(ocsp.OCSPResponseStatus.TRY_LATER)
+
+
+class CachedResponse:
+
+    def __init__(self, der, next_update):
+        self.der = bytes(der)
+        self.next_update = next_update
+
+    def is_expired(self):
+        return timezone.now() >= self.next_update
+
+
+def respond(request_der):
+    """Return (DER OCSP response, CachedResponse or None) for a DER OCSP request
+
+    Answers from the process cache, then from the pre-signed OcspResponse rows kept fresh by
+    "manage.py refresh_ocsp --loop". A certificate of this CA without a stored response yet, and a serial
+    this CA did not issue (answered unknown, not stored), are signed here; such signatures are bounded by
+    OCSP_SIGN_RATE per process and second, past it clients get tryLater. Requests for other issuers get
+    an unsigned unauthorized response.
+    """
+    try:
+        request = ocsp.load_der_ocsp_request(request_der)
+    except ValueError:
+        return MALFORMED_REQUEST, None
+
+    algorithm = request.hash_algorithm.name
+    if algorithm not in ALGORITHMS:
+        return UNAUTHORIZED, None
+    try:
+        root = root_cache.get()
+    except models.RootCrt.DoesNotExist:
+        return TRY_LATER, None
+    if (request.issuer_name_hash, request.issuer_key_hash) != _issuer_hashes(root, algorithm):
+        return UNAUTHORIZED, None
+
+    serial = format(request.serial_number, 'X')
+    cached = response(serial, algorithm, root)
+    if cached is None:
+        if not _may_sign():
+            return TRY_LATER, None
+        site_crt = models.SiteCrt.objects.filter(serial=serial, issuer_hash=root.subject_hash) \
+            .only('pk', 'crt', 'serial').first()
+        if site_crt is None:
+            return unknown(request.serial_number, algorithm, root), None
+        cached = _cache(sign(site_crt, algorithm, root), serial, algorithm, root)
+    return cached.der, cached
+
+
+def response(serial, algorithm, root):
+    """CachedResponse of a serial from the process cache or a stored OcspResponse, None when neither has one"""
+    _check_revocations()
+    issuer = root.subject_hash
+    cached = _responses.get((issuer, serial, algorithm))
+    if cached is not None and not cached.is_expired():
+        return cached
+
+    obj = models.OcspResponse.objects.filter(
+        serial=serial, algorithm=algorithm, issuer_hash=issuer, next_update__gt=timezone.now()).first()
+    if obj is None:
+        return None
+    return _cache(obj, serial, algorithm, root)
+
+
+def unknown(serial_number, algorithm, root):
+    """Signed DER response with status unknown for a serial number the root did not issue
+
+    The response builder of cryptography 36 takes the CertID from a certificate only, so this response is
+    encoded here from the root's issuer hashes and the requested serial number.
+    """
+    issuer_name_hash, issuer_key_hash = _issuer_hashes(root, algorithm)
+    now = _generalized_time(timezone.now())
+    cert_id = _der(0x30, _der(0x30, _oid(HASH_OIDS[algorithm]), NULL),
+                   _der(0x04, issuer_name_hash), _der(0x04, issuer_key_hash), _integer(serial_number))
+    # certStatus unknown is [2] IMPLICIT NULL, the responder is identified by the SHA-1 hash of the root key
+    single_response = _der(0x30, cert_id, b'\x82\x00', now)
+    tbs = _der(0x30, _der(0xa2, _der(0x04, _issuer_hashes(root, 'sha1')[1])), now, _der(0x30, single_response))
+    signature_oid, signature = _sign(root.private_key, tbs)
+    basic = _der(0x30, tbs, _der(0x30, *signature_oid), _der(0x03, b'\x00' + signature))
+    return _der(0x30, _der(0x0a, b'\x00'), _der(0xa0, _der(0x30, _oid(OCSP_BASIC_OID), _der(0x04, basic))))
+
+
+def _cache(obj, serial, algorithm, root):
+    cached = CachedResponse(obj.der, obj.next_update)
+    if len(_responses) >= settings.OCSP_CACHE_SIZE:
+        _responses.clear()
+    _responses[(root.subject_hash, serial, algorithm)] = cached
+    return cached
+
+
+def _may_sign():
+    """Count a signature against OCSP_SIGN_RATE, False when this second's budget is spent"""
+    global _window, _window_signs
+    with _lock:
+        now = time.monotonic()
+        if now - _window >= 1:
+            _window, _window_signs = now, 0
+        if _window_signs >= settings.OCSP_SIGN_RATE:
+            return False
+        _window_signs += 1
+        return True
+
+
+def sign(site_crt, algorithm=DEFAULT_ALGORITHM, root=None):
+    """Sign and store the OCSP response of a site certificate for a CertID hash algorithm"""
+    root = root or root_cache.get()
+    now = timezone.now()
+    next_update = now + datetime.timedelta(seconds=settings.OCSP_NEXT_UPDATE)
+    revocation = models.Revocation.objects.filter(serial=site_crt.serial).first()
+
+    builder = ocsp.OCSPResponseBuilder().add_response(
+        cert=x509.load_der_x509_certificate(site_crt.crt_der),
+        issuer=root.certificate,
+        algorithm=ALGORITHMS[algorithm](),
+        cert_status=ocsp.OCSPCertStatus.REVOKED if revocation else ocsp.OCSPCertStatus.GOOD,
+        this_update=_naive(now),
+        next_update=_naive(next_update),
+        revocation_time=_naive(revocation.date_revoked) if revocation else None,
+        revocation_reason=_reason(revocation),
+    ).responder_id(ocsp.OCSPResponderEncoding.HASH, root.certificate)
+    der = builder.sign(root.private_key, signature_hash(root.private_key)).public_bytes(serialization.Encoding.DER)
+
+    obj, _ = models.OcspResponse.objects.update_or_create(
+        serial=site_crt.serial, algorithm=algorithm,
+        defaults={'issuer_hash': root.subject_hash, 'der': der, 'this_update': now, 'next_update': next_update},
+    )
+    return obj
+
+
+def revoked(site_crt):
+    """Replace the stored responses of a just revoked certificate and drop them from the process cache"""
+    algorithms = set(models.OcspResponse.objects.filter(serial=site_crt.serial).values_list('algorithm', flat=True))
+    for algorithm in algorithms | {DEFAULT_ALGORITHM}:
+        sign(site_crt, algorithm)
+    discard([site_crt.serial])
+
+
+def refresh(batch_size=500):
+    """Sign responses that are missing or within OCSP_REFRESH_BEFORE of nextUpdate, return their number"""
+    root = root_cache.get()
+    issuer = root.subject_hash
+    now = timezone.now()
+    threshold = now + datetime.timedelta(seconds=settings.OCSP_REFRESH_BEFORE)
+
+    fresh = models.OcspResponse.objects.filter(
+        issuer_hash=issuer, algorithm=DEFAULT_ALGORITHM, next_update__gt=threshold).values('serial')
+    missing = models.SiteCrt.objects.filter(issuer_hash=issuer, not_after__gt=now).exclude(serial__in=fresh)
+    count = 0
+    for site_crt in missing.only('pk', 'crt', 'serial').iterator(chunk_size=batch_size):
+        sign(site_crt, DEFAULT_ALGORITHM, root)
+        count += 1
+
+    stale = models.OcspResponse.objects.filter(issuer_hash=issuer, next_update__lte=threshold) \
+        .exclude(algorithm=DEFAULT_ALGORITHM).values_list('serial', 'algorithm')
+    for serial, algorithm in list(stale):
+        site_crt = models.SiteCrt.objects.filter(serial=serial, issuer_hash=issuer).only('pk', 'crt', 'serial').first()
+        if site_crt is None:
+            models.OcspResponse.objects.filter(serial=serial, algorithm=algorithm).delete()
+        else:
+            sign(site_crt, algorithm, root)
+            count += 1
+    return count
+
+
+def invalidate():
+    global _revocations
+    _responses.clear()
+    _issuers.clear()
+    _revocations = None
+
+
+def discard(serials):
+    """Drop the cached responses of serials, of any issuer and CertID hash algorithm"""
+    serials = set(serials)
+    with _lock:
+        for key in [key for key in _responses if key[1] in serials]:
+            _responses.pop(key, None)
+
+
+def reset_sign_rate():
+    """Start a new OCSP_SIGN_RATE window with its full budget"""
+    global _window, _window_signs
+    with _lock:
+        _window, _window_signs = 0, 0
+
+
+def _check_revocations():
+    """Drop cached responses when another process revoked a certificate, at most every OCSP_CACHE_TIMEOUT"""
+    global _revocations, _checked
+    if time.monotonic() - _checked < settings.OCSP_CACHE_TIMEOUT:
+        return
+    with _lock:
+        state = models.Revocation.objects.aggregate(count=Count('pk'), through=Max('pk'))
+        state = (state['count'], state['through'])
+        if state != _revocations:
+            _responses.clear()
+            _revocations = state
+        _checked = time.monotonic()
+
+
+def _issuer_hashes(root, algorithm):
+    """issuerNameHash and issuerKeyHash of the root certificate, as they appear in requests"""
+    key = (root.crt, algorithm)
+    if key not in _issuers:
+        request = ocsp.OCSPRequestBuilder().add_certificate(
+            root.certificate, root.certificate, ALGORITHMS[algorithm]()).build()
+        _issuers[key] = (request.issuer_name_hash, request.issuer_key_hash)
+    return _issuers[key]
+
+
+def _sign(private_key, data):
+    """(signature algorithm identifier contents, signature) of data, hashed as signature_hash chooses"""
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        return (_oid('1.2.840.113549.1.1.11'), NULL), private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+    if isinstance(private_key, ec.EllipticCurvePrivateKey):
+        return (_oid('1.2.840.10045.4.3.2'),), private_key.sign(data, ec.ECDSA(hashes.SHA256()))
+    return (_oid('1.3.101.112'),), private_key.sign(data)
+
+
+def _der(tag, *contents):
+    content = b''.join(contents)
+    if len(content) < 0x80:
+        return bytes([tag, len(content)]) + content
+    size = (len(content).bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + len(content).to_bytes(size, 'big') + content
+
+
+def _oid(dotted):
+    numbers = [int(number) for number in dotted.split('.')]
+    content = b''
+    for number in [numbers[0] * 40 + numbers[1]] + numbers[2:]:
+        encoded = [number & 0x7f]
+        number >>= 7
+        while number:
+            encoded.insert(0, 0x80 | number & 0x7f)
+            number >>= 7
+        content += bytes(encoded)
+    return _der(0x06, content)
+
+
+def _integer(value):
+    return _der(0x02, value.to_bytes((value + (value < 0)).bit_length() // 8 + 1, 'big', signed=True))
+
+
+def _generalized_time(value):
+    return _der(0x18, _naive(value).strftime('%Y%m%d%H%M%SZ').encode())
+
+
+def _naive(value):
+    return timezone.make_naive(value, datetime.timezone.utc)
+
+
+def _reason(revocation):
+    if revocation is None or revocation.reason == models.Revocation.UNSPECIFIED:
+        return None
+    return x509.ReasonFlags(revocation.reason)
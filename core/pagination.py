@@ -0,0 +1,110 @@
+import base64
+import binascii
+import datetime
+import json
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+
+
+class SiteCrtCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class KeysetPage:
+    """One page of keyset pagination, with opaque cursors of the pages before and after it"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(direction, value, pk):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([direction, value, pk]).encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    """Return (direction, value, pk) of a cursor, raise ValueError if it is malformed"""
+    try:
+        direction, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = field.to_python(value)
+    except (TypeError, binascii.Error, ValidationError) as e:
+        raise ValueError('Invalid cursor: {}'.format(e))
+    if direction not in ('n', 'p') or not isinstance(pk, int) or value is None:
+        raise ValueError('Invalid cursor')
+    return direction, value, pk
+
+
+def keyset_page(queryset, ordering, cursor, page_size):
+    """Page of queryset ordered by ordering, a field name with an optional "-", then by primary key
+
+    Rows after or before the cursor are selected with a range condition on (field, pk), so every page
+    is an index range scan of the composite index of the field, however deep.
+    Raises ValueError for a malformed cursor.
+    """
+    name = ordering.lstrip('-')
+    descending = ordering.startswith('-')
+    forward = True
+    if cursor:
+        direction, value, pk = decode_cursor(cursor, queryset.model._meta.get_field(name))
+        forward = direction == 'n'
+        lookup = 'gt' if forward != descending else 'lt'
+        queryset = queryset.filter(
+            Q(**{name + '__' + lookup + 'e': value}),
+            Q(**{name + '__' + lookup: value}) | Q(**{'pk__' + lookup: pk}))
+
+    backward = descending != (not forward)
+    order = ['-' + name, '-pk'] if backward else [name, 'pk']
+    rows = list(queryset.order_by(*order)[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    # a page reached from a cursor has rows on the side it came from
+    has_next = more if forward else bool(cursor)
+    has_previous = bool(cursor) if forward else more
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor('n', getattr(rows[-1], name), rows[-1].pk)
+    if rows and has_previous:
+        previous_cursor = encode_cursor('p', getattr(rows[0], name), rows[0].pk)
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+_counts = {}
+
+
+def cached_count(queryset, key):
+    """queryset.count(), kept per process under key for CERTIFICATES_COUNT_CACHE_TIMEOUT seconds"""
+    now = time.monotonic()
+    entry = _counts.get(key)
+    if entry is not None and now - entry[1] < settings.CERTIFICATES_COUNT_CACHE_TIMEOUT:
+        return entry[0]
+    count = queryset.count()
+    if len(_counts) >= 1000:
+        _counts.clear()
+    _counts[key] = (count, now)
+    return count
+
+
+def invalidate():
+    _counts.clear()
@@ -0,0 +1,61 @@
+import datetime
+import zlib
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import models
+from core.utils import Ca
+
+
+def offset(pk):
+    """Stable per certificate delay within RENEWAL_SPREAD, so certificates expiring together renew apart"""
+    return datetime.timedelta(seconds=zlib.crc32(str(pk).encode()) % max(int(settings.RENEWAL_SPREAD), 1))
+
+
+def due(limit, now=None):
+    """Return up to limit certificates whose renewal time has come, soonest date_end first
+
+    A certificate is due RENEWAL_WINDOW before date_end plus its offset. Revoked certificates, certificates
+    issued from a signing request (the client holds the key) and those that failed within RENEWAL_RETRY_DELAY
+    are left out.
+    """
+    now = now or timezone.now()
+    window = datetime.timedelta(days=settings.RENEWAL_WINDOW)
+    failed = models.Renewal.objects.filter(
+        status=models.Renewal.FAILED,
+        date_created__gt=now - datetime.timedelta(seconds=settings.RENEWAL_RETRY_DELAY),
+    ).values('site_crt')
+    candidates = models.SiteCrt.objects.expiring(settings.RENEWAL_WINDOW, include_expired=True) \
+        .filter(key__isnull=False) \
+        .exclude(pk__in=failed) \
+        .exclude(serial__in=models.Revocation.objects.values('serial')) \
+        .values_list('pk', 'date_end')
+
+    pks = []
+    for pk, date_end in candidates.iterator():
+        if date_end - window + offset(pk) <= now:
+            pks.append(pk)
+            if len(pks) >= limit:
+                break
+    return list(models.SiteCrt.objects.filter(pk__in=pks).order_by('date_end', 'pk'))
+
+
+def renew(site_crts, validity_period=None):
+    """Renew certificates through the issuance worker pool and record a Renewal for each"""
+    validity_period = validity_period or settings.RENEWAL_VALIDITY_PERIOD
+    old = [(obj.serial, obj.date_end) for obj in site_crts]
+    results = Ca().renew_site_crts(site_crts, validity_period)
+
+    renewals = []
+    for obj, (old_serial, old_date_end), (renewed, error) in zip(site_crts, old, results):
+        renewals.append(models.Renewal(
+            site_crt=obj,
+            status=models.Renewal.FAILED if error else models.Renewal.DONE,
+            old_serial=old_serial,
+            new_serial=renewed.serial if renewed else None,
+            old_date_end=old_date_end,
+            new_date_end=renewed.date_end if renewed else None,
+            error=error or '',
+        ))
+    return models.Renewal.objects.bulk_create(renewals)
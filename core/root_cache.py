@@ -0,0 +1,72 @@
+import hashlib
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+
+from django.conf import settings
+
+from core import models
+
+_lock = threading.Lock()
+_cached = None
+# (whether a root certificate exists, time it was checked)
+_exists = None
+
+
+def _is_expired(loaded):
+    timeout = settings.ROOT_CRT_CACHE_TIMEOUT
+    return timeout is not None and time.monotonic() - loaded > timeout
+
+
+class RootCa:
+    """Decrypted root certificate with its parsed certificate and loaded signing key"""
+
+    def __init__(self, key, crt, obj=None):
+        self.obj = obj
+        self.key = key
+        self.crt = crt
+        self.certificate = x509.load_pem_x509_certificate(self.crt.encode())
+        self.private_key = serialization.load_pem_private_key(self.key.encode(), password=None)
+        # issuer_hash of the certificates it signs
+        self.subject_hash = hashlib.sha256(self.certificate.subject.public_bytes()).hexdigest()
+        self.fingerprint = self.certificate.fingerprint(hashes.SHA256()).hex()
+        self.loaded = time.monotonic()
+
+    def is_expired(self):
+        return _is_expired(self.loaded)
+
+
+def get():
+    """Return the cached RootCa, raise RootCrt.DoesNotExist if there is no root certificate"""
+    global _cached
+    root = _cached
+    if root is not None and not root.is_expired():
+        return root
+
+    with _lock:
+        root = _cached
+        if root is None or root.is_expired():
+            obj = models.RootCrt.objects.get()
+            root = _cached = RootCa(obj.key, obj.crt, obj)
+    return root
+
+
+def exists():
+    """Whether there is a root certificate, without loading it; cached like the root itself"""
+    global _exists
+    root = _cached
+    if root is not None and not root.is_expired():
+        return True
+
+    state = _exists
+    if state is None or _is_expired(state[1]):
+        state = _exists = (models.RootCrt.objects.exists(), time.monotonic())
+    return state[0]
+
+
+def invalidate():
+    global _cached, _exists
+    _cached = None
+    _exists = None
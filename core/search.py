@@ -0,0 +1,43 @@
+"""Certificate search over the SubjectAltName index
+
+A query is matched as a substring of the common name or of an alternative name, case-insensitively.
+Prefix matching is asked for with a trailing "*": "www.*" matches names starting with "www.".
+"*.example.com" or ".example.com" matches every name under example.com through the reversed_name column.
+Prefix and domain queries are matched on indexed columns, substring queries scan the name index, never the
+certificate table.
+"""
+import re
+
+from django.db.models import Q
+
+from core import crt_metadata
+from core import models
+
+NAME_TYPES = ('CN', 'DNS', 'IP')
+
+
+def matching_names(query):
+    """SubjectAltName rows matching query, None for an empty query"""
+    query = query.strip().lower()
+    if not query.strip('*.'):
+        return None
+    if query.startswith(('*.', '.')):
+        suffix = query.lstrip('*').lstrip('.')
+        return models.SubjectAltName.objects.filter(
+            reversed_name__startswith=crt_metadata.reversed_domain('DNS:' + suffix) + '.')
+    if query.endswith('*'):
+        prefix = query.rstrip('*')
+        q = Q()
+        for name_type in NAME_TYPES:
+            q |= Q(name__startswith='{}:{}'.format(name_type, prefix))
+        return models.SubjectAltName.objects.filter(q)
+    return models.SubjectAltName.objects.filter(
+        name__iregex=r'^({}):.*{}'.format('|'.join(NAME_TYPES), re.escape(query)))
+
+
+def search(queryset, query):
+    """Site certificates of queryset that match query"""
+    names = matching_names(query)
+    if names is None:
+        return queryset
+    return queryset.filter(pk__in=names.values('site_crt_id'))
@@ -1,22 +1,80 @@
 from rest_framework import serializers
 
 from core import models
+from core import jobs
+from core.crt_metadata import KEY_ALGORITHM_CHOICES
 from core.utils import Ca
+from core.issuance import CaError, load_csr, csr_common_name
 
 
-class SiteCrtCreate(serializers.ModelSerializer):
+class AltNamesMixin:
+
+    def validate(self, attrs):
+        try:
+            attrs['alt_names'] = Ca.subject_alt_names(attrs['cn'], attrs.get('alt_names'))[1:]
+        except CaError as e:
+            raise serializers.ValidationError({'alt_names': str(e)})
+        return attrs
+
+
+class SiteCrtCreate(AltNamesMixin, serializers.ModelSerializer):
     validity_period = serializers.DateField()
+    key_algorithm = serializers.ChoiceField(choices=KEY_ALGORITHM_CHOICES, required=False)
+    alt_names = serializers.ListField(child=serializers.CharField(max_length=256), required=False)
 
     class Meta:
         model = models.SiteCrt
-        fields = ['cn', 'validity_period']
+        fields = ['cn', 'validity_period', 'key_algorithm', 'alt_names']
+
+    def save(self):
+        Ca().generate_site_crt(self.validated_data['cn'], self.validated_data['validity_period'],
+                               alt_names=self.validated_data['alt_names'],
+                               algorithm=self.validated_data.get('key_algorithm'))
+
+    def enqueue(self):
+        return jobs.enqueue(models.IssuanceJob.SITE_CRT, cn=self.validated_data['cn'],
+                            validity_period=self.validated_data['validity_period'],
+                            alt_names=self.validated_data['alt_names'],
+                            key_algorithm=self.validated_data.get('key_algorithm'))
+
+
+class SiteCrtSignCsr(serializers.Serializer):
+    csr = serializers.CharField()
+    validity_period = serializers.DateField()
+
+    def validate_csr(self, value):
+        try:
+            cn = csr_common_name(load_csr(value))
+        except CaError as e:
+            raise serializers.ValidationError(str(e))
+        if '_' in cn:
+            raise serializers.ValidationError('Illegal character "_"')
+        if models.SiteCrt.objects.filter(cn=cn).exists():
+            raise serializers.ValidationError('Common name {} not unique'.format(cn))
+        return value
 
     def save(self):
-        ca = Ca()
-        if ca.get_type_alt_names(self.validated_data['cn']):
-            ca.generate_site_crt(self.validated_data['cn'], self.validated_data['validity_period'], alt_name='IP')
-        else:
-            ca.generate_site_crt(self.validated_data['cn'], self.validated_data['validity_period'])
+        self.instance = Ca().sign_csr(self.validated_data['csr'], self.validated_data['validity_period'])
+        return self.instance
+
+
+class Revocation(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.Revocation
+        fields = ['serial', 'reason', 'date_revoked', 'site_crt']
+        read_only_fields = ['serial', 'date_revoked', 'site_crt']
+
+
+class Pkcs12(serializers.Serializer):
+    passphrase = serializers.CharField(min_length=4, write_only=True)
+
+
+class SiteCrtBulkItem(AltNamesMixin, serializers.Serializer):
+    cn = serializers.CharField(max_length=256)
+    validity_period = serializers.DateField()
+    key_algorithm = serializers.ChoiceField(choices=KEY_ALGORITHM_CHOICES, required=False)
+    alt_names = serializers.ListField(child=serializers.CharField(max_length=256), required=False)
 
 
 class SiteCrt(serializers.ModelSerializer):
@@ -29,3 +87,18 @@ class SiteCrt(serializers.ModelSerializer):
     @staticmethod
     def get_crt(obj):
         return obj.crt
+
+
+class SiteCrtMeta(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.SiteCrt
+        fields = ['id', 'cn', 'date_start', 'date_end', 'serial', 'not_before', 'not_after', 'fingerprint',
+                  'key_type', 'key_size', 'san', 'issuer_hash']
+
+
+class IssuanceJob(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.IssuanceJob
+        fields = ['id', 'kind', 'status', 'error', 'site_crt', 'date_created', 'date_started', 'date_finished']
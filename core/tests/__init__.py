@@ -0,0 +1,20 @@
+from django import test
+
+from core import root_cache
+from core import bundles
+from core import crl
+from core import ocsp
+from core import pagination
+
+
+class TestCase(test.TestCase):
+    """Start each test with empty process-local caches, rows rolled back after a test send no model signals"""
+
+    def setUp(self):
+        super().setUp()
+        root_cache.invalidate()
+        crl.invalidate()
+        ocsp.invalidate()
+        ocsp.reset_sign_rate()
+        bundles.invalidate()
+        pagination.invalidate()
@@ -0,0 +1,292 @@
+import http.server
+import json
+import threading
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.x509.oid import NameOID
+
+from django.test import override_settings
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core import acme
+from core import models
+
+
+class AcmeClient:
+    """Minimal ES256 ACME client over the Django test client"""
+
+    def __init__(self, client):
+        self.client = client
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        numbers = self.key.public_key().public_numbers()
+        self.jwk = {
+            'kty': 'EC',
+            'crv': 'P-256',
+            'x': acme.b64encode(numbers.x.to_bytes(32, 'big')),
+            'y': acme.b64encode(numbers.y.to_bytes(32, 'big')),
+        }
+        self.kid = None
+        self.nonce = None
+
+    def url(self, name, *args):
+        return 'http://testserver' + reverse(name, args=args)
+
+    def post(self, url, payload=None, jwk=False, nonce=None):
+        if self.nonce is None:
+            self.nonce = self.client.head(self.url('acme_new_nonce'))['Replay-Nonce']
+        protected = {'alg': 'ES256', 'nonce': nonce or self.nonce, 'url': url}
+        if jwk or self.kid is None:
+            protected['jwk'] = self.jwk
+        else:
+            protected['kid'] = self.kid
+        protected = acme.b64encode(json.dumps(protected).encode())
+        payload = '' if payload is None else acme.b64encode(json.dumps(payload).encode())
+        r, s = decode_dss_signature(self.key.sign('{}.{}'.format(protected, payload).encode(),
+                                                  ec.ECDSA(hashes.SHA256())))
+        body = {
+            'protected': protected,
+            'payload': payload,
+            'signature': acme.b64encode(r.to_bytes(32, 'big') + s.to_bytes(32, 'big')),
+        }
+        response = self.client.post(url, json.dumps(body), content_type='application/jose+json')
+        self.nonce = response['Replay-Nonce']
+        return response
+
+    def new_account(self):
+        response = self.post(self.url('acme_new_account'), {'termsOfServiceAgreed': True}, jwk=True)
+        self.kid = response['Location']
+        return response
+
+    def new_order(self, *names):
+        return self.post(self.url('acme_new_order'), {'identifiers': [{'type': 'dns', 'value': n} for n in names]})
+
+    def authorize(self, order):
+        authorization = self.post(order['authorizations'][0]).json()
+        return self.post(authorization['challenges'][0]['url'], {})
+
+    def finalize(self, order, *names):
+        key = ec.generate_private_key(ec.SECP256R1())
+        csr = x509.CertificateSigningRequestBuilder().subject_name(x509.Name([])) \
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in names]), critical=False) \
+            .sign(key, hashes.SHA256())
+        return self.post(order['finalize'], {'csr': acme.b64encode(csr.public_bytes(serialization.Encoding.DER))})
+
+
+@override_settings(ACME_CHALLENGE='auto')
+class AcmeFlow(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.acme = AcmeClient(self.client)
+
+    def test_directory(self):
+        response = self.client.get(reverse('acme_directory'))
+
+        self.assertEqual(response.json()['newOrder'], self.acme.url('acme_new_order'))
+
+    def test_issue(self):
+        self.assertEqual(self.acme.new_account().status_code, 201)
+        self.assertEqual(self.acme.new_account().status_code, 200)
+
+        response = self.acme.new_order('test.example.com')
+        self.assertEqual(response.status_code, 201)
+        order = response.json()
+        self.assertEqual(order['status'], 'pending')
+
+        self.assertEqual(self.acme.authorize(order).json()['status'], 'valid')
+        self.assertEqual(self.acme.post(response['Location']).json()['status'], 'ready')
+
+        order = self.acme.finalize(order, 'test.example.com').json()
+        self.assertEqual(order['status'], 'valid')
+        chain = self.acme.post(order['certificate'])
+        self.assertEqual(chain['Content-Type'], 'application/pem-certificate-chain')
+
+        crt = x509.load_pem_x509_certificate(chain.content)
+        self.assertEqual(crt.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value, 'test.example.com')
+        site_crt = models.SiteCrt.objects.get(cn='test.example.com')
+        self.assertIsNone(site_crt.key)
+        self.assertEqual(site_crt.serial, format(crt.serial_number, 'X'))
+
+    def test_renewal_reuses_authorization(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+        first = self.acme.finalize(order, 'test.example.com').json()
+
+        order = self.acme.new_order('test.example.com').json()
+        self.assertEqual(order['status'], 'ready')
+        second = self.acme.finalize(order, 'test.example.com').json()
+
+        self.assertEqual(models.SiteCrt.objects.filter(cn='test.example.com').count(), 1)
+        self.assertNotEqual(self.acme.post(first['certificate']).content,
+                            self.acme.post(second['certificate']).content)
+
+    def test_keeps_keyed_crt(self):
+        site_crt = factories.SiteCrt.create(cn='test.example.com')
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+
+        response = self.acme.finalize(order, 'test.example.com')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['type'], 'urn:ietf:params:acme:error:rejectedIdentifier')
+        self.assertEqual(models.SiteCrt.objects.get().crt, site_crt.crt)
+        self.assertEqual(models.AcmeOrder.objects.get().status, models.AcmeOrder.INVALID)
+
+    def test_keeps_other_account_crt(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+        self.acme.finalize(order, 'test.example.com')
+        crt = models.SiteCrt.objects.get().crt
+
+        other = AcmeClient(self.client)
+        other.new_account()
+        order = other.new_order('test.example.com').json()
+        other.authorize(order)
+        response = other.finalize(order, 'test.example.com')
+
+        self.assertEqual(response.json()['type'], 'urn:ietf:params:acme:error:rejectedIdentifier')
+        self.assertEqual(models.SiteCrt.objects.get().crt, crt)
+
+    def test_bad_nonce(self):
+        self.acme.new_account()
+        nonce = self.acme.nonce
+        self.acme.new_order('test.example.com')
+        response = self.acme.post(self.acme.url('acme_new_order'), {'identifiers': []}, nonce=nonce)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['type'], 'urn:ietf:params:acme:error:badNonce')
+
+    def test_bad_signature(self):
+        self.acme.new_account()
+        other = AcmeClient(self.client)
+        other.kid = self.acme.kid
+        response = other.new_order('test.example.com')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'JWS signature is invalid')
+
+    def test_csr_names(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+        response = self.acme.finalize(order, 'other.example.com')
+
+        self.assertEqual(response.json()['type'], 'urn:ietf:params:acme:error:badCSR')
+        self.assertFalse(models.SiteCrt.objects.exists())
+
+    def test_other_account(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com')
+        other = AcmeClient(self.client)
+        other.new_account()
+
+        self.assertEqual(other.post(order['Location']).status_code, 404)
+
+    @override_settings(ACME_TRUSTED_NETWORKS=['10.0.0.0/8'])
+    def test_untrusted_network(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com')
+
+        self.assertEqual(self.acme.authorize(order.json()).json()['status'], 'invalid')
+        self.assertEqual(self.acme.post(order['Location']).json()['status'], 'invalid')
+
+    def test_revoke(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+        order = self.acme.finalize(order, 'test.example.com').json()
+        crt = x509.load_pem_x509_certificate(self.acme.post(order['certificate']).content)
+        der = acme.b64encode(crt.public_bytes(serialization.Encoding.DER))
+
+        response = self.acme.post(self.acme.url('acme_revoke_cert'), {'certificate': der, 'reason': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Revocation.objects.get().reason, models.Revocation.SUPERSEDED)
+
+        response = self.acme.post(self.acme.url('acme_revoke_cert'), {'certificate': der})
+        self.assertEqual(response.json()['type'], 'urn:ietf:params:acme:error:alreadyRevoked')
+
+
+    def test_revoke_forged_serial(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+        order = self.acme.finalize(order, 'test.example.com').json()
+        issued = x509.load_pem_x509_certificate(self.acme.post(order['certificate']).content)
+
+        attacker = AcmeClient(self.client)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'test.example.com')])
+        forged = x509.CertificateBuilder().subject_name(name).issuer_name(issued.issuer) \
+            .public_key(attacker.key.public_key()).serial_number(issued.serial_number) \
+            .not_valid_before(issued.not_valid_before).not_valid_after(issued.not_valid_after) \
+            .sign(attacker.key, hashes.SHA256())
+        response = attacker.post(attacker.url('acme_revoke_cert'),
+                                 {'certificate': acme.b64encode(forged.public_bytes(serialization.Encoding.DER))},
+                                 jwk=True)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(models.Revocation.objects.exists())
+
+    def test_finalize_failure(self):
+        self.acme.new_account()
+        order = self.acme.new_order('test.example.com').json()
+        self.acme.authorize(order)
+        with self.settings(CA_ISSUANCE_BACKEND='core.issuance.MissingBackend'), self.assertLogs('core.acme', 'ERROR'):
+            response = self.acme.finalize(order, 'test.example.com')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['type'], 'urn:ietf:params:acme:error:serverInternal')
+        self.assertEqual(models.AcmeOrder.objects.get().status, models.AcmeOrder.INVALID)
+
+
+class Http01(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.acme = AcmeClient(self.client)
+        self.acme.new_account()
+        self.responses = {}
+        responses = self.responses
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = responses.get(self.path, '').encode()
+                self.send_response(200 if body else 404)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_challenge(self):
+        with override_settings(ACME_HTTP01_PORT=self.server.server_port):
+            order = self.acme.new_order('localhost').json()
+            authorization = self.acme.post(order['authorizations'][0]).json()
+            token = authorization['challenges'][0]['token']
+            self.responses['/.well-known/acme-challenge/' + token] = '{}.{}'.format(
+                token, acme.thumbprint(self.acme.jwk))
+
+            self.assertEqual(self.acme.post(authorization['challenges'][0]['url'], {}).json()['status'], 'valid')
+
+    def test_wrong_key_authorization(self):
+        with override_settings(ACME_HTTP01_PORT=self.server.server_port):
+            order = self.acme.new_order('localhost').json()
+            authorization = self.acme.post(order['authorizations'][0]).json()
+            self.responses['/.well-known/acme-challenge/' + authorization['challenges'][0]['token']] = 'wrong'
+
+            challenge = self.acme.post(authorization['challenges'][0]['url'], {}).json()
+            self.assertEqual(challenge['status'], 'invalid')
+            self.assertIn('Unexpected key authorization', challenge['error']['detail'])
@@ -0,0 +1,99 @@
+import datetime
+
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core.tests.test_rest import make_csr
+from core.utils import Ca
+from core import bundles
+from core import models
+from core import root_cache
+
+
+class Download(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        self.client.force_login(user=self.user)
+        factories.RootCrt.create()
+        self.site_crt = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+
+    def url(self, output):
+        return reverse('rest_site_crt_download', kwargs={'pk': self.site_crt.pk, 'output': output})
+
+    def test_fullchain(self):
+        response = self.client.get(self.url('fullchain.pem'))
+
+        self.assertEqual(response['Content-Type'], 'application/pem-certificate-chain')
+        self.assertTrue(response.content.startswith(self.site_crt.crt.strip().encode()))
+        self.assertTrue(response.content.strip().endswith(root_cache.get().crt.strip().encode()))
+
+    def test_der(self):
+        response = self.client.get(self.url('crt.der'), HTTP_ACCEPT='application/pkix-cert')
+        crt = x509.load_der_x509_certificate(response.content)
+
+        self.assertEqual(format(crt.serial_number, 'X'), models.SiteCrt.objects.get(pk=self.site_crt.pk).serial)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url('crt.der'))
+        cached = self.client.get(self.url('crt.der'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get(self.url('crt.pem'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_without_metadata(self):
+        models.SiteCrt.objects.update(fingerprint=None)
+        response = self.client.get(self.url('crt.pem'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url('crt.pem'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertIsNone(models.SiteCrt.objects.get().fingerprint)
+
+    def test_recreated(self):
+        response = self.client.get(self.url('crt.pem'))
+        Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=20),
+                               pk=self.site_crt.pk)
+        recreated = self.client.get(self.url('crt.pem'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(recreated.status_code, 200)
+        self.assertEqual(recreated.content.decode(), models.SiteCrt.objects.get(pk=self.site_crt.pk).crt)
+
+    def test_discarded_on_update(self):
+        self.client.get(self.url('crt.pem'))
+        self.assertIn(self.site_crt.pk, bundles._cached)
+
+        self.site_crt.save()
+        self.assertNotIn(self.site_crt.pk, bundles._cached)
+
+    def test_ui(self):
+        response = self.client.get(reverse('certificates_download_fullchain', kwargs={'pk': self.site_crt.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=test.example.com.fullchain.pem')
+        self.assertEqual(self.client.get(reverse('certificates_download_der', kwargs={'pk': 0})).status_code, 404)
+
+    def test_pkcs12(self):
+        url = reverse('rest_site_crt_pkcs12', kwargs={'pk': self.site_crt.pk})
+        response = self.client.post(url, {'passphrase': 'secret'})
+        key, crt, cas = pkcs12.load_key_and_certificates(response.content, b'secret')
+
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertEqual(crt.subject, x509.load_pem_x509_certificate(self.site_crt.crt.encode()).subject)
+        self.assertEqual(cas[0].subject, root_cache.get().certificate.subject)
+        self.assertEqual(self.client.post(url, {'passphrase': ''}).status_code, 400)
+
+    def test_pkcs12_without_key(self):
+        obj = Ca().sign_csr(make_csr('csr.example.com')[0], datetime.date.today() + datetime.timedelta(days=10))
+        response = self.client.post(reverse('certificates_download_pkcs12', kwargs={'pk': obj.pk}),
+                                    {'passphrase': 'secret'})
+
+        self.assertContains(response, 'its key is kept by the client')
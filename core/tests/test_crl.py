@@ -0,0 +1,147 @@
+import datetime
+import io
+
+from cryptography import x509
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core.issuance import CaError
+from core.utils import Ca
+from core import crl
+from core import models
+from core import root_cache
+
+
+class CrlTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        validity_period = datetime.date.today() + datetime.timedelta(days=10)
+        self.crts = [Ca().generate_site_crt('{}.example.com'.format(i), validity_period) for i in range(3)]
+        self.crts = [models.SiteCrt.objects.get(pk=obj.pk) for obj in self.crts]
+
+    @staticmethod
+    def load(obj):
+        return x509.load_der_x509_crl(bytes(obj.der))
+
+    @staticmethod
+    def serials(crl_obj):
+        return sorted(format(revoked.serial_number, 'X') for revoked in crl_obj)
+
+
+class Publish(CrlTestMixin, TestCase):
+
+    def test_full_and_delta(self):
+        crl.revoke(self.crts[0], models.Revocation.KEY_COMPROMISE)
+        base = crl.latest(self.crts[0].issuer_hash)
+        full = self.load(base)
+
+        self.assertEqual(self.serials(full), [self.crts[0].serial])
+        self.assertEqual(full[0].extensions.get_extension_for_class(x509.CRLReason).value.reason,
+                         x509.ReasonFlags.key_compromise)
+        self.assertTrue(full.is_signature_valid(root_cache.get().certificate.public_key()))
+
+        crl.revoke(self.crts[1])
+        delta = self.load(crl.latest(self.crts[0].issuer_hash, delta=True))
+
+        self.assertEqual(self.serials(delta), [self.crts[1].serial])
+        self.assertEqual(delta.extensions.get_extension_for_class(x509.DeltaCRLIndicator).value.crl_number,
+                         base.number)
+        self.assertEqual(crl.latest(self.crts[0].issuer_hash).number, base.number)
+
+    @override_settings(CA_PUBLIC_URL='http://ca.example.com')
+    def test_freshest_crl(self):
+        crl.revoke(self.crts[0])
+        full = self.load(crl.latest(self.crts[0].issuer_hash))
+        delta = self.load(crl.latest(self.crts[0].issuer_hash, delta=True))
+
+        points = full.extensions.get_extension_for_class(x509.FreshestCRL).value
+        self.assertEqual([name.value for point in points for name in point.full_name],
+                         ['http://ca.example.com/crl/delta.der'])
+        with self.assertRaises(x509.ExtensionNotFound):
+            delta.extensions.get_extension_for_class(x509.FreshestCRL)
+
+    def test_unchanged(self):
+        crl.revoke(self.crts[0])
+
+        self.assertEqual(crl.publish(), [])
+
+    def test_removed_revocation(self):
+        crl.revoke(self.crts[0])
+        crl.revoke(self.crts[1])
+        models.Revocation.objects.filter(serial=self.crts[0].serial).delete()
+        signed = crl.publish()
+
+        self.assertFalse(signed[0].is_delta())
+        self.assertEqual(self.serials(self.load(signed[0])), [self.crts[1].serial])
+
+    def test_already_revoked(self):
+        crl.revoke(self.crts[0])
+
+        with self.assertRaises(CaError):
+            crl.revoke(self.crts[0])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('publish_crl', stdout=out)
+        call_command('publish_crl', stdout=out)
+
+        self.assertEqual(models.Crl.objects.count(), 2)
+        self.assertIn('CRL 1, 0 revocations', out.getvalue())
+
+
+class CrlView(CrlTestMixin, TestCase):
+
+    def test_not_published(self):
+        response = self.client.get(reverse('crl', kwargs={'encoding': 'der'}))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_der_and_pem(self):
+        crl.revoke(self.crts[0])
+        response = self.client.get(reverse('crl', kwargs={'encoding': 'der'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pkix-crl')
+        self.assertEqual(self.serials(x509.load_der_x509_crl(response.content)), [self.crts[0].serial])
+
+        response = self.client.get(reverse('crl_delta', kwargs={'encoding': 'pem'}))
+        self.assertIsNotNone(x509.load_pem_x509_crl(response.content).extensions.get_extension_for_class(
+            x509.DeltaCRLIndicator))
+
+    def test_not_modified(self):
+        crl.publish()
+        response = self.client.get(reverse('crl', kwargs={'encoding': 'der'}))
+        signed = models.Crl.objects.count()
+
+        for _ in range(5):
+            cached = self.client.get(reverse('crl', kwargs={'encoding': 'der'}), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+        self.assertEqual(models.Crl.objects.count(), signed)
+
+    def test_revoke_view(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('certificates_revoke', kwargs={'pk': self.crts[0].pk}),
+                                    {'reason': models.Revocation.SUPERSEDED})
+
+        self.assertRedirects(response, reverse('certificates_view', kwargs={'pk': self.crts[0].pk}))
+        self.assertTrue(models.SiteCrt.objects.get(pk=self.crts[0].pk).is_revoked())
+
+    def test_revoke_api(self):
+        self.client.force_login(user=self.user)
+        url = reverse('rest_site_crt_revoke', kwargs={'pk': self.crts[0].pk})
+        response = self.client.post(url, {'reason': models.Revocation.KEY_COMPROMISE})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['serial'], self.crts[0].serial)
+        self.assertEqual(self.client.post(url).status_code, 409)
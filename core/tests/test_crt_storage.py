@@ -0,0 +1,91 @@
+import datetime
+
+from cryptography import x509
+
+from django.core import serializers
+from django.db import connection
+from django.test import override_settings
+
+from core.tests import TestCase
+from core.tests import factories
+from core.utils import Ca
+from core import crt_metadata
+from core import models
+
+
+class StoredCrtTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.site_crt = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+
+    def raw(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT crt FROM core_sitecrt WHERE id = %s', [self.site_crt.pk])
+            return bytes(cursor.fetchone()[0])
+
+
+class CertificateField(StoredCrtTestMixin, TestCase):
+
+    def test_stored_as_pem(self):
+        self.assertEqual(self.raw().decode(), self.site_crt.crt)
+        self.assertEqual(models.SiteCrt.objects.get().crt, self.site_crt.crt)
+        self.assertEqual(self.site_crt.crt_der, crt_metadata.pem_to_der(self.site_crt.crt))
+
+    @override_settings(CRT_STORAGE_FORMAT='der')
+    def test_read_either_format(self):
+        self.site_crt.crt = self.site_crt.crt
+        self.site_crt.save()
+        self.assertFalse(self.raw().startswith(b'-----BEGIN'))
+
+        obj = models.SiteCrt.objects.get()
+        self.assertEqual(obj.crt, self.site_crt.crt)
+        with self.settings(CRT_STORAGE_FORMAT='pem'):
+            obj.crt = obj.crt
+            obj.save()
+        self.assertEqual(self.raw().decode(), self.site_crt.crt)
+
+    def test_multiple_certificates(self):
+        self.site_crt.crt = self.site_crt.crt + models.RootCrt.objects.get().crt
+        with self.assertRaises(ValueError):
+            self.site_crt.save()
+
+    def test_invalid(self):
+        self.site_crt.crt = 'not a certificate'
+        with self.assertRaises(ValueError):
+            self.site_crt.save()
+
+    def test_serialization(self):
+        data = serializers.serialize('json', models.SiteCrt.objects.all(), fields=['crt'])
+
+        self.assertIn('BEGIN CERTIFICATE', data)
+        obj = next(serializers.deserialize('json', data)).object
+        self.assertEqual(obj.crt, self.site_crt.crt)
+
+
+@override_settings(CRT_STORAGE_FORMAT='der')
+class DerStorage(StoredCrtTestMixin, TestCase):
+
+    def test_stored_as_der(self):
+        der = self.raw()
+
+        self.assertEqual(x509.load_der_x509_certificate(der),
+                         x509.load_pem_x509_certificate(self.site_crt.crt.encode()))
+        self.assertEqual(crt_metadata.der_to_pem(der), self.site_crt.crt)
+
+    def test_lazy_pem(self):
+        obj = models.SiteCrt.objects.get()
+
+        self.assertEqual(obj.__dict__['crt'], self.raw())
+        self.assertEqual(obj.crt_der, self.raw())
+        self.assertEqual(obj.crt, self.site_crt.crt)
+        self.assertEqual(obj.crt_der, self.raw())
+
+    def test_unread_saved_as_is(self):
+        obj = models.SiteCrt.objects.get()
+        obj.cn = 'other.example.com'
+        obj.save()
+
+        self.assertEqual(self.raw(), obj.crt_der)
+        self.assertIsInstance(obj.__dict__['crt'], bytes)
@@ -0,0 +1,77 @@
+import datetime
+import io
+
+from swutils.encrypt import encrypt as legacy_encrypt
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+
+from core.tests import TestCase
+from core.tests import factories
+from core.utils import Ca
+from core import encryption
+from core import models
+
+
+def raw(site_crt, field='key'):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT {} FROM core_sitecrt WHERE id = %s'.format(field), [site_crt.pk])
+        return cursor.fetchone()[0]
+
+
+def write_legacy(site_crt):
+    legacy = legacy_encrypt(site_crt.key, settings.SECRET_KEY.encode('utf-8'))
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE core_sitecrt SET key = %s WHERE id = %s', [legacy, site_crt.pk])
+
+
+class EncryptedTextField(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.site_crt = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_authenticated(self):
+        value = raw(self.site_crt)
+        self.assertTrue(value.startswith(encryption.PREFIX))
+        self.assertNotEqual(encryption.encrypt(self.site_crt.key), value)
+
+        tampered = value[:-8] + ('A' if value[-8] != 'A' else 'B') + value[-7:]
+        with self.assertRaises(ValueError):
+            encryption.decrypt(tampered)
+
+    def test_lazy(self):
+        obj = models.SiteCrt.objects.get()
+
+        self.assertIsInstance(obj.__dict__['key'], encryption.Ciphertext)
+        self.assertEqual(obj.key, self.site_crt.key)
+        self.assertEqual(obj.__dict__['key'], self.site_crt.key)
+
+    def test_unread_saved_as_is(self):
+        value = raw(self.site_crt)
+        obj = models.SiteCrt.objects.get()
+        obj.cn = 'other.example.com'
+        obj.save()
+
+        self.assertEqual(raw(self.site_crt), value)
+
+    def test_legacy(self):
+        write_legacy(self.site_crt)
+
+        self.assertEqual(models.SiteCrt.objects.get().key, self.site_crt.key)
+
+    def test_reencrypt_command(self):
+        write_legacy(self.site_crt)
+        out = io.StringIO()
+        call_command('reencrypt_fields', stdout=out)
+
+        self.assertEqual(out.getvalue(), 'SiteCrt.key: 1 rows\n')
+        self.assertTrue(raw(self.site_crt).startswith(encryption.PREFIX))
+        self.assertEqual(models.SiteCrt.objects.get().key, self.site_crt.key)
+
+        out = io.StringIO()
+        call_command('reencrypt_fields', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
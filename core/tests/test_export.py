@@ -0,0 +1,65 @@
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+
+
+class Export(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        self.first = factories.SiteCrt.create(cn='a.example.com')
+        factories.SiteCrt.create(cn='b.example.com')
+
+    def get(self, **params):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('rest_site_crt_export'), params)
+        return b''.join(response.streaming_content)
+
+    def test_tar(self):
+        archive = tarfile.open(fileobj=io.BytesIO(self.get(keys=1, root=1)), mode='r:gz')
+
+        self.assertEqual(sorted(archive.getnames()), [
+            'a.example.com/a.example.com.crt', 'a.example.com/a.example.com.key',
+            'b.example.com/b.example.com.crt', 'b.example.com/b.example.com.key', 'rootCA.crt',
+        ])
+        self.assertEqual(archive.extractfile('rootCA.crt').read(), factories.root_crt_all_fields)
+
+    def test_zip_ids(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.get(archive='zip', id=self.first.pk)))
+
+        self.assertEqual(archive.namelist(), ['a.example.com/a.example.com.crt'])
+        self.assertEqual(archive.read('a.example.com/a.example.com.crt'), factories.site_crt_all_fields)
+
+    def test_hostile_cn(self):
+        hostile = factories.SiteCrt.create(cn='../../etc/passwd')
+        dots = factories.SiteCrt.create(cn='..')
+        archive = zipfile.ZipFile(io.BytesIO(self.get(archive='zip', id=[hostile.pk, dots.pk])))
+
+        self.assertEqual(archive.namelist(), [
+            'pk-{0}/pk-{0}.crt'.format(hostile.pk), 'pk-{0}/pk-{0}.crt'.format(dots.pk)])
+
+    def test_bad_format(self):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('rest_site_crt_export'), {'archive': 'rar'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'crts.zip')
+        call_command('export_crts', path, format='zip', cn='b.example')
+
+        self.assertEqual(zipfile.ZipFile(path).namelist(), ['b.example.com/b.example.com.crt'])
@@ -1,8 +1,8 @@
-from django.test import TestCase
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from core.tests import TestCase
 from core.tests import factories
 
 root_crt_without_required_subj = b"""-----BEGIN CERTIFICATE-----
@@ -115,6 +115,7 @@ nd9JKxdGrDkWBPgnzxE4m9mU
 class RootCrtForm(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd'
@@ -143,6 +144,7 @@ class RootCrtForm(TestCase):
 class CertificatesCreateForm(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd'
@@ -161,6 +163,7 @@ class CertificatesCreateForm(TestCase):
 class CertificatesUploadExistingForm(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd'
@@ -0,0 +1,126 @@
+import io
+import os
+import tarfile
+import tempfile
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core import importer
+from core import models
+from core import pagination
+from core import root_cache
+from core.issuance import CryptographyBackend
+from core.utils import Ca
+
+
+class Import(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        backend = CryptographyBackend()
+        key = backend.generate_key()
+        crt = backend.create_site_crt(key, Ca.generate_subj_site_crt('a.example.com'), ['DNS:a.example.com'], 10,
+                                      root_cache.get())
+        orphan = backend.create_site_crt(backend.generate_key(), Ca.generate_subj_site_crt('b.example.com'),
+                                         ['DNS:b.example.com'], 10, root_cache.get())
+        self.files = {
+            'site/127.0.0.1.crt': factories.site_crt_all_fields,
+            'site/127.0.0.1.key': factories.site_key_all_fields,
+            'a.pem': crt.encode(),
+            'keys/a.key': key.encode(),
+            'b.crt': orphan.encode(),
+            'broken.crt': b'-----BEGIN CERTIFICATE-----\nbroken\n-----END CERTIFICATE-----\n',
+            'README': b'not a certificate',
+        }
+        self.directory = tempfile.mkdtemp()
+        for name, content in self.files.items():
+            os.makedirs(os.path.dirname(os.path.join(self.directory, name)), exist_ok=True)
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(content)
+
+    @override_settings(IMPORT_WORKERS=2)
+    def test_command(self):
+        factories.SiteCrt.create(cn='127.0.0.1')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_crts', self.directory, stdout=out, stderr=err)
+
+        self.assertEqual(sorted(models.SiteCrt.objects.values_list('cn', flat=True)), ['127.0.0.1', 'a.example.com'])
+        obj = models.SiteCrt.objects.get(cn='a.example.com')
+        self.assertEqual(obj.key, self.files['keys/a.key'].decode())
+        self.assertIsNotNone(obj.fingerprint)
+        self.assertIn('Imported 1 certificates, 4 errors', out.getvalue())
+        self.assertIn('b.crt: No private key matches the certificate', err.getvalue())
+        self.assertIn('already exists', err.getvalue())
+        self.assertIn('broken.crt', err.getvalue())
+        self.assertIn('README: No certificate or key found', err.getvalue())
+
+    @override_settings(IMPORT_WORKERS=0)
+    def test_combined_file(self):
+        backend = CryptographyBackend()
+        key = backend.generate_key()
+        crt = backend.create_site_crt(key, Ca.generate_subj_site_crt('c.example.com'), ['DNS:c.example.com'], 10,
+                                      root_cache.get())
+        rsa1024 = rsa.generate_private_key(public_exponent=65537, key_size=1024).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+        weak = backend.create_site_crt(rsa1024, Ca.generate_subj_site_crt('d.example.com'), ['DNS:d.example.com'], 10,
+                                       root_cache.get())
+        directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, 'c.pem'), 'w') as f:
+            f.write('c.example.com\n' + crt + key)
+        with open(os.path.join(directory, 'd.pem'), 'w') as f:
+            f.write(weak + rsa1024)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_crts', directory, stdout=out, stderr=err)
+
+        self.assertEqual(models.SiteCrt.objects.get().key, key)
+        self.assertIn('Imported 1 certificates, 1 errors', out.getvalue())
+        self.assertIn('d.pem: Unsupported key algorithm', err.getvalue())
+
+    def test_concurrent_insert(self):
+        backend = CryptographyBackend()
+        site_crts = []
+        for cn in ('c.example.com', 'd.example.com'):
+            crt = backend.create_site_crt(backend.generate_key(), Ca.generate_subj_site_crt(cn), ['DNS:' + cn], 10,
+                                          root_cache.get())
+            site_crts.append((cn + '.crt', models.SiteCrt(crt=crt, cn=cn, **models.SiteCrt.crt_metadata(crt))))
+        factories.SiteCrt.create(cn='c.example.com')
+        result = importer.ImportResult()
+        importer._insert(site_crts, result)
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([name for name, _ in result.errors], ['c.example.com.crt'])
+        self.assertTrue(models.SiteCrt.objects.filter(cn='d.example.com').exists())
+
+    @override_settings(IMPORT_WORKERS=0, CERTIFICATES_COUNT_CACHE_TIMEOUT=60)
+    def test_count_invalidated(self):
+        self.assertEqual(pagination.cached_count(models.SiteCrt.objects.all(), 'all'), 0)
+        call_command('import_crts', self.directory, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(pagination.cached_count(models.SiteCrt.objects.all(), 'all'), 2)
+
+    @override_settings(IMPORT_WORKERS=0)
+    def test_api(self):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            tar.add(self.directory, arcname='crts')
+        archive.seek(0)
+        archive.name = 'crts.tar.gz'
+
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_import'), {'archive': archive})
+
+        self.assertEqual(response.json()['imported'], 2)
+        self.assertEqual(len(response.json()['errors']), 3)
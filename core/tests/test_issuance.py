@@ -0,0 +1,325 @@
+import datetime
+import io
+import ipaddress
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import dsa, padding, rsa, ec, ed25519
+from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from core.tests import TestCase
+from core.tests import factories
+from core.issuance import CryptographyBackend, OpensslBackend, CaError, load_csr
+from core.crt_metadata import KEY_ALGORITHMS
+from core.utils import Ca
+from core import models
+from core import root_cache
+from core import benchmarks
+from core.tests.test_rest import make_csr
+
+
+class CryptographyBackendTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        obj = factories.RootCrt.create()
+        self.root = root_cache.RootCa(obj.key, obj.crt, obj)
+        self.backend = CryptographyBackend()
+        self.subj = Ca.generate_subj_site_crt('test.example.com')
+        self.alt_names = ['DNS:test.example.com']
+
+    def test_site_crt_signed_by_root(self):
+        crt = self.backend.create_site_crt(self.backend.generate_key(), self.subj, self.alt_names, 10, self.root)
+        crt = x509.load_pem_x509_certificate(crt.encode())
+        root_crt = x509.load_pem_x509_certificate(self.root.crt.encode())
+
+        self.assertEqual(crt.issuer, root_crt.subject)
+        root_crt.public_key().verify(crt.signature, crt.tbs_certificate_bytes, padding.PKCS1v15(),
+                                     crt.signature_hash_algorithm)
+
+    def test_site_crt_extensions(self):
+        crt = self.backend.create_site_crt(self.backend.generate_key(), self.subj, self.alt_names, 10, self.root)
+        crt = x509.load_pem_x509_certificate(crt.encode())
+
+        self.assertEqual(crt.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value, 'test.example.com')
+        self.assertFalse(crt.extensions.get_extension_for_class(x509.BasicConstraints).value.ca)
+        key_usage = crt.extensions.get_extension_for_class(x509.KeyUsage).value
+        self.assertTrue(key_usage.digital_signature and key_usage.content_commitment)
+        self.assertTrue(key_usage.key_encipherment and key_usage.data_encipherment)
+        self.assertEqual(list(crt.extensions.get_extension_for_class(x509.ExtendedKeyUsage).value),
+                         [ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH])
+        san = crt.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        self.assertEqual(san.get_values_for_type(x509.DNSName), ['test.example.com'])
+        aki = crt.extensions.get_extension_for_class(x509.AuthorityKeyIdentifier).value
+        self.assertEqual(aki.authority_cert_serial_number,
+                         x509.load_pem_x509_certificate(self.root.crt.encode()).serial_number)
+
+    def test_site_crt_ip(self):
+        subj = Ca.generate_subj_site_crt('127.0.0.1')
+        crt = self.backend.create_site_crt(self.backend.generate_key(), subj, ['IP:127.0.0.1'], 10, self.root)
+        crt = x509.load_pem_x509_certificate(crt.encode())
+
+        san = crt.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        self.assertEqual(san.get_values_for_type(x509.IPAddress), [ipaddress.ip_address('127.0.0.1')])
+
+    def test_negative_validity_period(self):
+        with self.assertRaises(CaError):
+            self.backend.create_site_crt(self.backend.generate_key(), self.subj, self.alt_names, -1, self.root)
+
+    def test_root_crt(self):
+        key = self.backend.generate_key()
+        subj = Ca.generate_subj_root_crt({
+            'country': 'ru', 'state': 'moscow', 'location': 'moscow', 'organization': 'Soft-way',
+            'organizational_unit_name': '', 'common_name': 'ca', 'email': '',
+        })
+        crt = x509.load_pem_x509_certificate(self.backend.create_root_crt(key, subj, 10).encode())
+
+        self.assertEqual(crt.subject, crt.issuer)
+        self.assertTrue(crt.extensions.get_extension_for_class(x509.BasicConstraints).value.ca)
+        key = serialization.load_pem_private_key(key.encode(), password=None)
+        self.assertEqual(crt.public_key().public_numbers(), key.public_key().public_numbers())
+
+
+class OpensslBackendTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        obj = factories.RootCrt.create()
+        self.root = root_cache.RootCa(obj.key, obj.crt, obj)
+
+    def test_same_extensions(self):
+        subj = Ca.generate_subj_site_crt('test.example.com')
+        openssl = OpensslBackend()
+        native = CryptographyBackend()
+        crt_openssl = x509.load_pem_x509_certificate(
+            openssl.create_site_crt(openssl.generate_key(), subj, ['DNS:test.example.com'], 10, self.root).encode())
+        crt_native = x509.load_pem_x509_certificate(
+            native.create_site_crt(native.generate_key(), subj, ['DNS:test.example.com'], 10, self.root).encode())
+
+        for ext in (x509.BasicConstraints, x509.KeyUsage, x509.ExtendedKeyUsage, x509.SubjectAlternativeName):
+            self.assertEqual(crt_openssl.extensions.get_extension_for_class(ext).value,
+                             crt_native.extensions.get_extension_for_class(ext).value)
+        self.assertEqual(crt_openssl.subject, crt_native.subject)
+
+    @override_settings(CA_PUBLIC_URL='http://ca.example.com/')
+    def test_crl_distribution_points(self):
+        subj = Ca.generate_subj_site_crt('test.example.com')
+        for backend in (OpensslBackend(), CryptographyBackend()):
+            crt = x509.load_pem_x509_certificate(
+                backend.create_site_crt(backend.generate_key(), subj, ['DNS:test.example.com'], 10, self.root).encode())
+            points = crt.extensions.get_extension_for_class(x509.CRLDistributionPoints).value
+
+            self.assertEqual([name.value for point in points for name in point.full_name],
+                             ['http://ca.example.com/crl/root.der'])
+
+    def test_no_public_url(self):
+        backend = CryptographyBackend()
+        crt = x509.load_pem_x509_certificate(backend.create_site_crt(
+            backend.generate_key(), Ca.generate_subj_site_crt('test.example.com'), ['DNS:test.example.com'], 10,
+            self.root).encode())
+
+        with self.assertRaises(x509.ExtensionNotFound):
+            crt.extensions.get_extension_for_class(x509.CRLDistributionPoints)
+
+
+class CaBackendSetting(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+
+    @override_settings(CA_ISSUANCE_BACKEND='core.issuance.OpensslBackend')
+    def test_openssl_backend(self):
+        ca = Ca()
+        self.assertIsInstance(ca.backend, OpensslBackend)
+
+    def test_generate_site_crt(self):
+        obj = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+        self.assertEqual(models.SiteCrt.objects.get().cn, 'test.example.com')
+        self.assertIn('BEGIN CERTIFICATE', obj.crt)
+
+
+class CrtMetadata(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+
+    def test_generate_site_crt(self):
+        obj = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+        crt = x509.load_pem_x509_certificate(obj.crt.encode())
+        obj = models.SiteCrt.objects.get()
+
+        self.assertEqual(obj.serial, format(crt.serial_number, 'X'))
+        self.assertEqual(obj.subject['CN'], 'test.example.com')
+        self.assertEqual(obj.not_after.replace(tzinfo=None), crt.not_valid_after)
+        self.assertEqual(obj.fingerprint, crt.fingerprint(hashes.SHA256()).hex())
+        self.assertEqual((obj.key_type, obj.key_size), ('RSA', 2048))
+        self.assertEqual(obj.san, ['DNS:test.example.com'])
+
+    def test_backfill(self):
+        factories.SiteCrt.create()
+        call_command('backfill_crt_metadata', stdout=io.StringIO())
+
+        self.assertEqual(models.SiteCrt.objects.filter(fingerprint__isnull=True).count(), 0)
+        self.assertEqual(models.RootCrt.objects.get().subject['O'], 'Soft-way')
+
+
+class CheckCrtAndKey(TestCase):
+
+    def test_key_types(self):
+        for private_key in (rsa.generate_private_key(public_exponent=65537, key_size=2048),
+                            ec.generate_private_key(ec.SECP256R1()), ed25519.Ed25519PrivateKey.generate()):
+            crt, key = benchmarks.self_signed(private_key)
+            self.assertTrue(Ca.check_crt_and_key(crt, key))
+
+    def test_different_key(self):
+        crt, _ = benchmarks.self_signed(ec.generate_private_key(ec.SECP256R1()))
+        _, key = benchmarks.self_signed(ec.generate_private_key(ec.SECP256R1()))
+        self.assertFalse(Ca.check_crt_and_key(crt, key))
+
+    def test_invalid_key(self):
+        crt, _ = benchmarks.self_signed(ed25519.Ed25519PrivateKey.generate())
+        with self.assertRaises(CaError):
+            Ca.check_crt_and_key(crt, 'not a key')
+
+    def test_same_as_openssl(self):
+        obj = factories.RootCrt.create()
+        other = factories.SiteCrt.build()
+        openssl = OpensslBackend()
+        self.assertEqual(openssl.check_crt_and_key(obj.crt, obj.key), Ca.check_crt_and_key(obj.crt, obj.key))
+        self.assertEqual(openssl.check_crt_and_key(obj.crt, other.key), Ca.check_crt_and_key(obj.crt, other.key))
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark', 'check_crt_and_key', iterations=1, stdout=out)
+        self.assertIn('native, ed25519', out.getvalue())
+
+
+class SignCsr(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        obj = factories.RootCrt.create()
+        self.root = root_cache.RootCa(obj.key, obj.crt, obj)
+
+    def test_backends(self):
+        csr, key = make_csr('csr.example.com')
+        subj = Ca.generate_subj_site_crt('csr.example.com')
+        for backend in (CryptographyBackend(), OpensslBackend()):
+            crt = x509.load_pem_x509_certificate(
+                backend.sign_csr(csr, subj, ['DNS:csr.example.com'], 10, self.root).encode())
+
+            self.assertEqual(crt.public_key().public_numbers(), key.public_key().public_numbers())
+            self.assertEqual(crt.issuer, self.root.certificate.subject)
+            san = crt.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+            self.assertEqual(san.get_values_for_type(x509.DNSName), ['csr.example.com'])
+
+    def test_subject_not_copied(self):
+        key = ec.generate_private_key(ec.SECP256R1())
+        csr = x509.CertificateSigningRequestBuilder().subject_name(x509.Name([
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'Evil Corp'),
+            x509.NameAttribute(NameOID.COMMON_NAME, 'csr.example.com'),
+        ])).sign(key, hashes.SHA256()).public_bytes(serialization.Encoding.PEM)
+        native = CryptographyBackend()
+        expected = x509.load_pem_x509_certificate(native.create_site_crt(
+            native.generate_key(), Ca.generate_subj_site_crt('csr.example.com'), ['DNS:csr.example.com'], 10,
+            self.root).encode()).subject
+        for backend in ('core.issuance.CryptographyBackend', 'core.issuance.OpensslBackend'):
+            with self.settings(CA_ISSUANCE_BACKEND=backend):
+                crt = x509.load_pem_x509_certificate(
+                    Ca().sign_csr(csr, datetime.date.today() + datetime.timedelta(days=10)).crt.encode())
+            models.SiteCrt.objects.all().delete()
+
+            self.assertEqual(crt.subject, expected)
+
+    def test_cn_without_subject(self):
+        key = ec.generate_private_key(ec.SECP256R1())
+        csr = x509.CertificateSigningRequestBuilder().subject_name(x509.Name([])) \
+            .sign(key, hashes.SHA256()).public_bytes(serialization.Encoding.PEM)
+        validity_period = datetime.date.today() + datetime.timedelta(days=10)
+        for backend in ('core.issuance.CryptographyBackend', 'core.issuance.OpensslBackend'):
+            with self.settings(CA_ISSUANCE_BACKEND=backend):
+                crt = x509.load_pem_x509_certificate(
+                    Ca().sign_csr(csr, validity_period, cn='acme.example.com').crt.encode())
+                with self.assertRaises(CaError):
+                    Ca().sign_csr(csr, validity_period)
+            models.SiteCrt.objects.all().delete()
+
+            self.assertEqual(crt.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value, 'acme.example.com')
+
+    def test_unsupported_key(self):
+        for key in (rsa.generate_private_key(public_exponent=65537, key_size=1024),
+                    dsa.generate_private_key(key_size=2048)):
+            csr = x509.CertificateSigningRequestBuilder().subject_name(x509.Name([
+                x509.NameAttribute(NameOID.COMMON_NAME, 'csr.example.com')])).sign(key, hashes.SHA256())
+            with self.assertRaisesMessage(CaError, 'Unsupported key algorithm'):
+                load_csr(csr.public_bytes(serialization.Encoding.PEM))
+
+    def test_tampered_signature(self):
+        csr, _ = make_csr('csr.example.com')
+        der = x509.load_pem_x509_csr(csr.encode()).public_bytes(serialization.Encoding.DER)
+        tampered = x509.load_der_x509_csr(der.replace(b'csr.example.com', b'bad.example.com'))
+        with self.assertRaises(CaError):
+            CryptographyBackend().sign_csr(tampered.public_bytes(serialization.Encoding.PEM),
+                                           Ca.generate_subj_site_crt('csr.example.com'), ['DNS:csr.example.com'],
+                                           10, self.root)
+
+
+class KeyAlgorithms(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        obj = factories.RootCrt.create()
+        self.root = root_cache.RootCa(obj.key, obj.crt, obj)
+        self.subj = Ca.generate_subj_site_crt('test.example.com')
+        self.alt_names = ['DNS:test.example.com']
+
+    def test_cryptography_backend(self):
+        backend = CryptographyBackend()
+        for algorithm in ('rsa3072', 'ec256', 'ec384', 'ed25519'):
+            crt = backend.create_site_crt(backend.generate_key(algorithm), self.subj, self.alt_names, 10, self.root)
+            metadata = models.SiteCrt.crt_metadata(crt)
+
+            self.assertEqual((metadata['key_type'], metadata['key_size']), KEY_ALGORITHMS[algorithm])
+
+    def test_openssl_backend(self):
+        backend = OpensslBackend()
+        for algorithm in ('ec256', 'ed25519'):
+            key = backend.generate_key(algorithm)
+            crt = backend.create_site_crt(key, self.subj, self.alt_names, 10, self.root)
+            metadata = models.SiteCrt.crt_metadata(crt)
+
+            self.assertEqual((metadata['key_type'], metadata['key_size']), KEY_ALGORITHMS[algorithm])
+            self.assertTrue(Ca.check_crt_and_key(crt, key))
+
+    def test_ed25519_root(self):
+        backend = CryptographyBackend()
+        key = backend.generate_key('ed25519')
+        root_crt = backend.create_root_crt(key, {'CN': 'ca', 'O': 'Soft-way'}, 10)
+        crt = backend.create_site_crt(backend.generate_key('ec256'), self.subj, self.alt_names, 10,
+                                      root_cache.RootCa(key, root_crt))
+
+        root_crt = x509.load_pem_x509_certificate(root_crt.encode())
+        crt = x509.load_pem_x509_certificate(crt.encode())
+        root_crt.public_key().verify(crt.signature, crt.tbs_certificate_bytes)
+
+    def test_unsupported(self):
+        with self.assertRaises(CaError):
+            CryptographyBackend().generate_key('rsa1024')
+
+    def test_generate_site_crt(self):
+        validity_period = datetime.date.today() + datetime.timedelta(days=10)
+        obj = Ca().generate_site_crt('test.example.com', validity_period, algorithm='ec256')
+        self.assertEqual(models.SiteCrt.objects.get(pk=obj.pk).key_algorithm, 'ec256')
+
+        Ca().generate_site_crt('test.example.com', validity_period, pk=obj.pk)
+        self.assertEqual(models.SiteCrt.objects.get(pk=obj.pk).key_algorithm, 'ec256')
+
+    @override_settings(DEFAULT_KEY_ALGORITHM='ed25519')
+    def test_default_setting(self):
+        obj = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+        self.assertEqual(models.SiteCrt.objects.get(pk=obj.pk).key_algorithm, 'ed25519')
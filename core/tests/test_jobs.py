@@ -0,0 +1,111 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tests import TestCase
+from core.tests import factories
+from core import jobs
+from core import models
+
+
+@override_settings(CA_ASYNC_ISSUANCE=True)
+class IssuanceJobs(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        self.validity_period = str(datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_create_view(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('certificates_create'),
+                                    {'cn': 'test.example.com', 'validity_period': self.validity_period})
+        job = models.IssuanceJob.objects.get()
+
+        self.assertRedirects(response, reverse('job_view', kwargs={'pk': job.pk}))
+        self.assertFalse(models.SiteCrt.objects.exists())
+
+        call_command('run_issuance_worker', once=True, concurrency=1)
+        job.refresh_from_db()
+
+        self.assertEqual(job.status, models.IssuanceJob.DONE)
+        self.assertEqual(job.site_crt.cn, 'test.example.com')
+        response = self.client.get(reverse('job_view', kwargs={'pk': job.pk}))
+        self.assertEqual(response.context['result_url'], reverse('certificates_view', kwargs={'pk': job.site_crt.pk}))
+
+    def test_recreate_view(self):
+        site_crt = factories.SiteCrt.create()
+        self.client.force_login(user=self.user)
+        self.client.post(reverse('certificates_recreate', kwargs={'pk': site_crt.pk}),
+                         {'validity_period': self.validity_period})
+        job = jobs.run(jobs.claim())
+
+        self.assertEqual(job.status, models.IssuanceJob.DONE)
+        self.assertEqual(models.SiteCrt.objects.get().date_end.date(), datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_failed(self):
+        job = jobs.enqueue(models.IssuanceJob.SITE_CRT, cn='test.example.com', validity_period='2017-01-01')
+        jobs.run(jobs.claim())
+        job.refresh_from_db()
+
+        self.assertEqual(job.status, models.IssuanceJob.FAILED)
+        self.assertTrue(job.error)
+
+    def test_claim_once(self):
+        jobs.enqueue(models.IssuanceJob.SITE_CRT, cn='test.example.com', validity_period=self.validity_period)
+
+        self.assertIsNotNone(jobs.claim())
+        self.assertIsNone(jobs.claim())
+
+    @override_settings(ISSUANCE_JOB_TIMEOUT=60, ISSUANCE_JOB_ATTEMPTS=2)
+    def test_stale(self):
+        job = jobs.enqueue(models.IssuanceJob.SITE_CRT, cn='test.example.com', validity_period=self.validity_period)
+        jobs.claim()
+        self.assertIsNone(jobs.claim())
+
+        started = timezone.now() - datetime.timedelta(seconds=120)
+        models.IssuanceJob.objects.filter(pk=job.pk).update(date_heartbeat=started)
+        claimed = jobs.claim()
+        self.assertEqual((claimed.pk, claimed.attempts), (job.pk, 2))
+
+        models.IssuanceJob.objects.filter(pk=job.pk).update(date_heartbeat=started)
+        self.assertIsNone(jobs.claim())
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.IssuanceJob.FAILED)
+        self.assertTrue(job.error)
+
+    @override_settings(ISSUANCE_JOB_TIMEOUT=60)
+    def test_heartbeat(self):
+        job = jobs.enqueue(models.IssuanceJob.SITE_CRT, cn='test.example.com', validity_period=self.validity_period)
+        job = jobs.claim()
+        started = timezone.now() - datetime.timedelta(seconds=120)
+        models.IssuanceJob.objects.filter(pk=job.pk).update(date_started=started, date_heartbeat=started)
+
+        self.assertTrue(jobs.beat(job))
+        self.assertIsNone(jobs.claim())
+
+        models.IssuanceJob.objects.filter(pk=job.pk).update(date_heartbeat=started)
+        jobs.claim()
+        self.assertFalse(jobs.beat(job))
+
+    def test_api(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_create'),
+                                    {'cn': 'test.example.com', 'validity_period': self.validity_period})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], models.IssuanceJob.PENDING)
+
+        jobs.run(jobs.claim())
+        response = self.client.get(reverse('rest_job_view', kwargs={'pk': response.json()['id']}))
+
+        self.assertEqual(response.json()['status'], models.IssuanceJob.DONE)
+        self.assertEqual(response.json()['site_crt'], models.SiteCrt.objects.get().pk)
@@ -0,0 +1,68 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+
+from core.tests import TestCase
+from core import key_pool
+from core import models
+from core.issuance import CryptographyBackend
+
+
+class KeyPool(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = CryptographyBackend()
+
+    def test_refill(self):
+        self.assertEqual(key_pool.refill(self.backend, size=3), 3)
+        self.assertEqual(key_pool.refill(self.backend, size=3), 0)
+        self.assertEqual(key_pool.depth(), 3)
+        self.assertEqual(models.KeyPoolStats.objects.get().refilled, 3)
+
+    def test_take(self):
+        key_pool.refill(self.backend, size=1)
+        pooled = models.PooledKey.objects.get().key
+
+        self.assertEqual(key_pool.take(self.backend), pooled)
+        self.assertEqual(key_pool.depth(), 0)
+        self.assertEqual(models.KeyPoolStats.objects.get().taken, 1)
+
+    def test_take_dry(self):
+        key = key_pool.take(self.backend)
+
+        self.assertIn('PRIVATE KEY', key)
+        self.assertEqual(models.KeyPoolStats.objects.get().misses, 1)
+
+    def test_take_many(self):
+        key_pool.refill(self.backend, 'ec256', size=2)
+        pooled = [obj.key for obj in models.PooledKey.objects.order_by('pk')]
+
+        with self.assertNumQueries(6):
+            keys = key_pool.take_many('ec256', 3)
+        self.assertEqual(keys, pooled + [None])
+        stats = models.KeyPoolStats.objects.get()
+        self.assertEqual((stats.taken, stats.misses), (2, 1))
+
+    def test_algorithms(self):
+        key_pool.refill(self.backend, 'ec256', size=1)
+
+        self.assertEqual(key_pool.depth('rsa2048'), 0)
+        self.assertIsNone(key_pool.take(self.backend, 'rsa2048', generate=False))
+        pooled = models.PooledKey.objects.get(algorithm='ec256').key
+        self.assertEqual(key_pool.take(self.backend, 'ec256'), pooled)
+
+    def test_encrypted_at_rest(self):
+        key_pool.refill(self.backend, size=1)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT key FROM core_pooledkey')
+            raw = cursor.fetchone()[0]
+
+        self.assertNotIn('PRIVATE KEY', str(raw))
+
+    @override_settings(KEY_POOL_SIZE={'rsa2048': 2})
+    def test_command(self):
+        call_command('refill_key_pool')
+
+        self.assertEqual(key_pool.depth(), 2)
+        self.assertEqual(key_pool.stats()[0]['depth'], 2)
@@ -0,0 +1,180 @@
+import base64
+import datetime
+import io
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding
+from cryptography.x509 import ocsp
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core.benchmarks import self_signed
+from core.issuance import CryptographyBackend
+from core.utils import Ca
+from core import crl
+from core import models
+from core import ocsp as ocsp_responses
+from core import root_cache
+
+
+class OcspTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.site_crt = Ca().generate_site_crt('test.example.com', datetime.date.today() + datetime.timedelta(days=10))
+        self.site_crt = models.SiteCrt.objects.get(pk=self.site_crt.pk)
+
+    def request_der(self, algorithm=hashes.SHA1(), crt=None):
+        crt = x509.load_pem_x509_certificate((crt or self.site_crt.crt).encode())
+        return ocsp.OCSPRequestBuilder().add_certificate(crt, root_cache.get().certificate, algorithm) \
+            .build().public_bytes(serialization.Encoding.DER)
+
+
+class Responder(OcspTestMixin, TestCase):
+
+    def test_good(self):
+        der, _ = ocsp_responses.respond(self.request_der())
+        response = ocsp.load_der_ocsp_response(der)
+
+        self.assertEqual(response.response_status, ocsp.OCSPResponseStatus.SUCCESSFUL)
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.GOOD)
+        self.assertEqual(format(response.serial_number, 'X'), self.site_crt.serial)
+        root_cache.get().certificate.public_key().verify(
+            response.signature, response.tbs_response_bytes, padding.PKCS1v15(), response.signature_hash_algorithm)
+
+    def test_cached(self):
+        ocsp_responses.respond(self.request_der())
+        signed = models.OcspResponse.objects.get()
+
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                der, _ = ocsp_responses.respond(self.request_der())
+        self.assertEqual(der, bytes(signed.der))
+
+    def test_sha256(self):
+        der, _ = ocsp_responses.respond(self.request_der(hashes.SHA256()))
+
+        self.assertEqual(ocsp.load_der_ocsp_response(der).hash_algorithm.name, 'sha256')
+
+    def test_revoked(self):
+        ocsp_responses.respond(self.request_der())
+        crl.revoke(self.site_crt, models.Revocation.KEY_COMPROMISE)
+        response = ocsp.load_der_ocsp_response(ocsp_responses.respond(self.request_der())[0])
+
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+        self.assertEqual(response.revocation_reason, x509.ReasonFlags.key_compromise)
+
+    @override_settings(OCSP_CACHE_TIMEOUT=0)
+    def test_revoked_by_other_process(self):
+        ocsp_responses.respond(self.request_der())
+        models.Revocation.objects.create(serial=self.site_crt.serial, issuer_hash=self.site_crt.issuer_hash)
+        ocsp_responses.sign(self.site_crt)
+        response = ocsp.load_der_ocsp_response(ocsp_responses.respond(self.request_der())[0])
+
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.REVOKED)
+
+    def test_unknown_issuer(self):
+        crt = x509.load_pem_x509_certificate(self_signed(ec.generate_private_key(ec.SECP256R1()))[0].encode())
+        der, _ = ocsp_responses.respond(ocsp.OCSPRequestBuilder().add_certificate(crt, crt, hashes.SHA1())
+                                        .build().public_bytes(serialization.Encoding.DER))
+
+        self.assertEqual(ocsp.load_der_ocsp_response(der).response_status, ocsp.OCSPResponseStatus.UNAUTHORIZED)
+        self.assertEqual(models.OcspResponse.objects.count(), 0)
+
+    def test_unknown_serial(self):
+        backend = CryptographyBackend()
+        crt = backend.create_site_crt(backend.generate_key(), Ca.generate_subj_site_crt('other.example.com'),
+                                      ['DNS:other.example.com'], 10, root_cache.get())
+        der, cached = ocsp_responses.respond(self.request_der(crt=crt))
+        response = ocsp.load_der_ocsp_response(der)
+
+        self.assertIsNone(cached)
+        self.assertEqual(response.certificate_status, ocsp.OCSPCertStatus.UNKNOWN)
+        self.assertEqual(response.serial_number, x509.load_pem_x509_certificate(crt.encode()).serial_number)
+        self.assertEqual(response.issuer_key_hash,
+                         ocsp.load_der_ocsp_request(self.request_der(crt=crt)).issuer_key_hash)
+        root_cache.get().certificate.public_key().verify(
+            response.signature, response.tbs_response_bytes, padding.PKCS1v15(), response.signature_hash_algorithm)
+        self.assertEqual(models.OcspResponse.objects.count(), 0)
+
+    @override_settings(OCSP_SIGN_RATE=0)
+    def test_sign_rate(self):
+        der, _ = ocsp_responses.respond(self.request_der())
+        self.assertEqual(ocsp.load_der_ocsp_response(der).response_status, ocsp.OCSPResponseStatus.TRY_LATER)
+
+        ocsp_responses.refresh()
+        der, _ = ocsp_responses.respond(self.request_der())
+        self.assertEqual(ocsp.load_der_ocsp_response(der).certificate_status, ocsp.OCSPCertStatus.GOOD)
+
+    @override_settings(OCSP_SIGN_RATE=1)
+    def test_sign_rate_kept_on_invalidate(self):
+        other = Ca().generate_site_crt('other.example.com', datetime.date.today() + datetime.timedelta(days=10))
+        ocsp_responses.respond(self.request_der())
+        ocsp_responses.invalidate()
+        der, _ = ocsp_responses.respond(self.request_der(crt=other.crt))
+
+        self.assertEqual(ocsp.load_der_ocsp_response(der).response_status, ocsp.OCSPResponseStatus.TRY_LATER)
+
+    def test_update_discards_own_response(self):
+        other = Ca().generate_site_crt('other.example.com', datetime.date.today() + datetime.timedelta(days=10))
+        ocsp_responses.respond(self.request_der())
+        ocsp_responses.respond(self.request_der(crt=other.crt))
+        self.site_crt.save()
+
+        issuer = root_cache.get().subject_hash
+        self.assertNotIn((issuer, self.site_crt.serial, 'sha1'), ocsp_responses._responses)
+        self.assertIn((issuer, other.serial, 'sha1'), ocsp_responses._responses)
+
+    def test_malformed(self):
+        der, _ = ocsp_responses.respond(b'not a request')
+
+        self.assertEqual(ocsp.load_der_ocsp_response(der).response_status,
+                         ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+
+    def test_refresh(self):
+        self.assertEqual(ocsp_responses.refresh(), 1)
+        self.assertEqual(ocsp_responses.refresh(), 0)
+
+        models.OcspResponse.objects.update(next_update=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        out = io.StringIO()
+        call_command('refresh_ocsp', stdout=out)
+        self.assertIn('signed 1 OCSP responses', out.getvalue())
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark', 'ocsp', iterations=2, stdout=out)
+
+        self.assertIn('respond, cached', out.getvalue())
+
+
+class ResponderView(OcspTestMixin, TestCase):
+
+    def test_post(self):
+        response = self.client.post(reverse('ocsp'), self.request_der(), content_type='application/ocsp-request')
+
+        self.assertEqual(response['Content-Type'], 'application/ocsp-response')
+        self.assertEqual(ocsp.load_der_ocsp_response(response.content).certificate_status,
+                         ocsp.OCSPCertStatus.GOOD)
+
+    def test_get(self):
+        encoded = base64.b64encode(self.request_der()).decode()
+        response = self.client.get(reverse('ocsp_get', kwargs={'encoded': encoded}))
+
+        self.assertEqual(ocsp.load_der_ocsp_response(response.content).certificate_status,
+                         ocsp.OCSPCertStatus.GOOD)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertTrue(response.has_header('Expires'))
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_get_malformed(self):
+        response = self.client.get(reverse('ocsp_get', kwargs={'encoded': 'not-base64!'}))
+
+        self.assertEqual(ocsp.load_der_ocsp_response(response.content).response_status,
+                         ocsp.OCSPResponseStatus.MALFORMED_REQUEST)
+
@@ -0,0 +1,80 @@
+import datetime
+import io
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from core.tests import TestCase
+from core.tests import factories
+from core.utils import Ca
+from core import bundles
+from core import crl
+from core import models
+from core import renewal
+from core.tests.test_rest import make_csr
+
+
+@override_settings(RENEWAL_WINDOW=30, RENEWAL_SPREAD=0, RENEWAL_VALIDITY_PERIOD=365)
+class Renewal(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.expiring = self.generate('expiring.example.com', days=10)
+        self.valid = self.generate('valid.example.com', days=100)
+
+    @staticmethod
+    def generate(cn, days):
+        obj = Ca().generate_site_crt(cn, datetime.date.today() + datetime.timedelta(days=days))
+        return models.SiteCrt.objects.get(pk=obj.pk)
+
+    def test_due(self):
+        self.assertEqual(renewal.due(10), [self.expiring])
+
+    def test_spread(self):
+        with override_settings(RENEWAL_SPREAD=60 * 24 * 60 * 60):
+            offset = renewal.offset(self.expiring.pk)
+            self.assertEqual(offset, renewal.offset(self.expiring.pk))
+            due = self.expiring.date_end - datetime.timedelta(days=30) + offset
+            self.assertEqual(renewal.due(10, now=due - datetime.timedelta(seconds=1)), [])
+            self.assertEqual(renewal.due(10, now=due), [self.expiring])
+
+    def test_renew(self):
+        old_key, old_serial = self.expiring.key, self.expiring.serial
+        renewals = renewal.renew(renewal.due(10))
+        obj = models.SiteCrt.objects.get(pk=self.expiring.pk)
+
+        self.assertEqual(renewals[0].status, models.Renewal.DONE)
+        self.assertEqual(renewals[0].old_serial, old_serial)
+        self.assertEqual(renewals[0].new_serial, obj.serial)
+        self.assertNotEqual(obj.key, old_key)
+        self.assertGreater(obj.date_end, timezone.now() + datetime.timedelta(days=300))
+        self.assertEqual(renewal.due(10), [])
+
+    def test_renew_drops_cached_bundle(self):
+        bundles.get(self.expiring.pk)
+        bundles.get(self.valid.pk)
+        renewal.renew(renewal.due(10))
+
+        self.assertNotIn(self.expiring.pk, bundles._cached)
+        self.assertIn(self.valid.pk, bundles._cached)
+
+    def test_excluded(self):
+        crl.revoke(self.expiring)
+        csr_crt = Ca().sign_csr(make_csr('csr.example.com')[0], datetime.date.today() + datetime.timedelta(days=10))
+        models.Renewal.objects.create(site_crt=self.generate('failed.example.com', days=10),
+                                      status=models.Renewal.FAILED, old_date_end=timezone.now())
+
+        self.assertIsNone(csr_crt.key)
+        self.assertEqual(renewal.due(10), [])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('renew_crts', dry_run=True, stdout=out)
+        self.assertIn('expiring.example.com', out.getvalue())
+        self.assertFalse(models.Renewal.objects.exists())
+
+        call_command('renew_crts', rate=6000, stdout=out)
+        self.assertIn('renewed 1, failed 0', out.getvalue())
+        self.assertEqual(models.Renewal.objects.get().site_crt, self.expiring)
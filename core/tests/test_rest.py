@@ -0,0 +1,267 @@
+import datetime
+import io
+import json
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tests import TestCase
+from core.tests import factories
+from core import models
+
+
+def make_csr(cn):
+    key = ec.generate_private_key(ec.SECP256R1())
+    csr = x509.CertificateSigningRequestBuilder() \
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])) \
+        .sign(key, hashes.SHA256())
+    return csr.public_bytes(serialization.Encoding.PEM).decode(), key
+
+
+class SiteCrtCreate(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        self.validity_period = str(datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_key_algorithm(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_create'), {
+            'cn': 'ec.example.com', 'validity_period': self.validity_period, 'key_algorithm': 'ec384'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.SiteCrt.objects.get().key_algorithm, 'ec384')
+
+    def test_unsupported_key_algorithm(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_create'), {
+            'cn': 'ec.example.com', 'validity_period': self.validity_period, 'key_algorithm': 'dsa'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('key_algorithm', response.json())
+
+
+class SiteCrtSignCsr(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        self.validity_period = str(datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_sign(self):
+        csr, key = make_csr('csr.example.com')
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_sign_csr'),
+                                    {'csr': csr, 'validity_period': self.validity_period})
+
+        self.assertEqual(response.status_code, 201)
+        obj = models.SiteCrt.objects.get(cn='csr.example.com')
+        self.assertIsNone(obj.key)
+        self.assertEqual(response.json()['crt'], obj.crt)
+        crt = x509.load_pem_x509_certificate(obj.crt.encode())
+        self.assertEqual(crt.public_key().public_numbers(), key.public_key().public_numbers())
+        self.assertEqual(obj.san, ['DNS:csr.example.com'])
+
+    def test_invalid(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_sign_csr'),
+                                    {'csr': 'not a csr', 'validity_period': self.validity_period})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('csr', response.json())
+
+    def test_underscore(self):
+        csr, _ = make_csr('bad_name.example.com')
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_sign_csr'),
+                                    {'csr': csr, 'validity_period': self.validity_period})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['csr'], ['Illegal character "_"'])
+
+    def test_weak_key(self):
+        csr = x509.CertificateSigningRequestBuilder() \
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'csr.example.com')])) \
+            .sign(rsa.generate_private_key(public_exponent=65537, key_size=1024), hashes.SHA256())
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_sign_csr'), {
+            'csr': csr.public_bytes(serialization.Encoding.PEM).decode(), 'validity_period': self.validity_period})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.SiteCrt.objects.exists())
+
+    def test_not_unique(self):
+        factories.SiteCrt.create()
+        csr, _ = make_csr(models.SiteCrt.objects.get().cn)
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_sign_csr'),
+                                    {'csr': csr, 'validity_period': self.validity_period})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SiteCrtBulkCreate(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        factories.SiteCrt.create()
+        self.validity_period = str(datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_auth(self):
+        response = self.client.post(reverse('rest_site_crt_bulk_create'), [], content_type='application/json')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_no_root_crt(self):
+        models.RootCrt.objects.all().delete()
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_bulk_create'),
+                                    [{'cn': 'a.example.com', 'validity_period': self.validity_period}],
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['detail'], 'Root certificate is not configured')
+
+    def test_not_list(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_bulk_create'), {'cn': 'a.example.com'},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BULK_ISSUANCE_WORKERS=2)
+    def test_partial_success(self):
+        self.client.force_login(user=self.user)
+        data = [
+            {'cn': 'a.example.com', 'validity_period': self.validity_period},
+            {'cn': '127.0.0.1', 'validity_period': self.validity_period},
+            {'cn': 'a.example.com', 'validity_period': self.validity_period},
+            {'cn': 'b.example.com'},
+            {'cn': '10.0.0.1', 'validity_period': self.validity_period},
+        ]
+        response = self.client.post(reverse('rest_site_crt_bulk_create'), data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(results[0]['id'], models.SiteCrt.objects.get(cn='a.example.com').pk)
+        self.assertIn('cn', results[1]['errors'])
+        self.assertIn('cn', results[2]['errors'])
+        self.assertIn('validity_period', results[3]['errors'])
+        self.assertEqual(results[4]['id'], models.SiteCrt.objects.get(cn='10.0.0.1').pk)
+        self.assertEqual(models.SiteCrt.objects.count(), 3)
+
+    @override_settings(BULK_ISSUANCE_WORKERS=0)
+    def test_signing_error(self):
+        self.client.force_login(user=self.user)
+        data = [
+            {'cn': 'a.example.com', 'validity_period': '2017-01-01'},
+            {'cn': 'b.example.com', 'validity_period': self.validity_period},
+        ]
+        response = self.client.post(reverse('rest_site_crt_bulk_create'), data, content_type='application/json')
+
+        results = response.json()
+        self.assertIn('non_field_errors', results[0]['errors'])
+        self.assertTrue(models.SiteCrt.objects.filter(cn='b.example.com').exists())
+
+
+class SiteCrtList(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        for cn in ('a.example.com', 'b.example.com', 'c.example.com'):
+            factories.SiteCrt.create(cn=cn)
+
+    def test_cursor_pagination(self):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('rest_site_crt_list'), {'page_size': 2})
+
+        self.assertEqual([row['cn'] for row in response.json()['results']], ['a.example.com', 'b.example.com'])
+        self.assertIn('BEGIN CERTIFICATE', response.json()['results'][0]['crt'])
+
+        response = self.client.get(response.json()['next'])
+
+        self.assertEqual([row['cn'] for row in response.json()['results']], ['c.example.com'])
+        self.assertIsNone(response.json()['next'])
+
+    def test_meta(self):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('rest_site_crt_list'), {'meta': '1'})
+        row = response.json()['results'][0]
+
+        self.assertNotIn('crt', row)
+        self.assertEqual(row['cn'], 'a.example.com')
+
+    def test_key_not_loaded(self):
+        self.client.force_login(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('rest_site_crt_list'))
+
+        selects = [q['sql'] for q in queries if 'FROM "core_sitecrt"' in q['sql']]
+        self.assertTrue(selects)
+        self.assertFalse(any('"core_sitecrt"."key"' in sql for sql in selects))
+
+
+class SiteCrtExpiring(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        now = timezone.now()
+        factories.SiteCrt.create(cn='expired.example.com')
+        factories.SiteCrt.create(cn='later.example.com', date_end=now + datetime.timedelta(days=5))
+        factories.SiteCrt.create(cn='soon.example.com', date_end=now + datetime.timedelta(days=1))
+        factories.SiteCrt.create(cn='far.example.com', date_end=now + datetime.timedelta(days=30))
+
+    def get(self, **params):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('rest_site_crt_expiring'), params)
+        return [json.loads(line)['cn'] for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_window(self):
+        self.assertEqual(self.get(days=7), ['soon.example.com', 'later.example.com'])
+
+    def test_expired(self):
+        self.assertEqual(self.get(days=7, expired=1), ['expired.example.com', 'soon.example.com', 'later.example.com'])
+
+    def test_limit(self):
+        self.assertEqual(self.get(days=7, limit=1), ['soon.example.com'])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('expiring_crts', days=7, stdout=out)
+
+        self.assertEqual([line.split('\t')[1] for line in out.getvalue().splitlines()],
+                         ['soon.example.com', 'later.example.com'])
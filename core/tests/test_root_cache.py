@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core import models
+from core import root_cache
+
+
+class RootCache(TestCase):
+
+    def test_not_exists(self):
+        with self.assertRaises(models.RootCrt.DoesNotExist):
+            root_cache.get()
+
+    def test_cached(self):
+        factories.RootCrt.create()
+        root = root_cache.get()
+
+        with self.assertNumQueries(0):
+            self.assertIs(root_cache.get(), root)
+        self.assertEqual(root.certificate.serial_number, 0)
+
+    def test_invalidate_on_save(self):
+        obj = factories.RootCrt.create()
+        root_cache.get()
+        obj.organization = 'other'
+        obj.save()
+
+        self.assertEqual(root_cache.get().obj.organization, 'other')
+
+    def test_invalidate_on_delete(self):
+        factories.RootCrt.create()
+        root_cache.get()
+        models.RootCrt.objects.all().delete()
+
+        with self.assertRaises(models.RootCrt.DoesNotExist):
+            root_cache.get()
+
+    def test_exists(self):
+        self.assertFalse(root_cache.exists())
+        with self.assertNumQueries(0):
+            self.assertFalse(root_cache.exists())
+
+        factories.RootCrt.create()
+        self.assertTrue(root_cache.exists())
+        with self.assertNumQueries(0):
+            self.assertTrue(root_cache.exists())
+
+        models.RootCrt.objects.all().delete()
+        self.assertFalse(root_cache.exists())
+
+
+class RootCrtMiddleware(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        self.client.force_login(user=self.user)
+
+    def test_redirect_before_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('certificates_create'), {'cn': 'test.example.com'})
+
+        self.assertRedirects(response, reverse('root_crt'), fetch_redirect_response=False)
+        self.assertFalse([q for q in queries if 'core_sitecrt' in q['sql']])
+
+    def test_no_root_queries(self):
+        factories.RootCrt.create()
+        self.client.get(reverse('certificates_search'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('certificates_search'))
+        self.assertFalse([q for q in queries if 'core_rootcrt' in q['sql']])
@@ -0,0 +1,128 @@
+import datetime
+import ipaddress
+
+from cryptography import x509
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from core.tests import TestCase
+from core.tests import factories
+from core.tests.test_acme import AcmeClient
+from core.utils import Ca
+from core import models
+
+
+def san(site_crt):
+    crt = x509.load_pem_x509_certificate(site_crt.crt.encode())
+    return crt.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+
+
+class AltNames(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        self.validity_period = datetime.date.today() + datetime.timedelta(days=10)
+
+    def test_rest(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_create'), {
+            'cn': 'test.example.com', 'validity_period': str(self.validity_period),
+            'alt_names': ['www.example.com', '*.test.example.com', '10.0.0.1']})
+
+        self.assertEqual(response.status_code, 201)
+        site_crt = models.SiteCrt.objects.get()
+        self.assertEqual(san(site_crt).get_values_for_type(x509.DNSName),
+                         ['test.example.com', 'www.example.com', '*.test.example.com'])
+        self.assertEqual(san(site_crt).get_values_for_type(x509.IPAddress), [ipaddress.ip_address('10.0.0.1')])
+        self.assertEqual(set(site_crt.alt_names.values_list('name', flat=True)), {
+            'CN:test.example.com', 'DNS:test.example.com', 'DNS:www.example.com', 'DNS:*.test.example.com',
+            'IP:10.0.0.1'})
+
+    def test_invalid(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('rest_site_crt_create'), {
+            'cn': 'test.example.com', 'validity_period': str(self.validity_period), 'alt_names': ['bad name']})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('alt_names', response.json())
+        self.assertFalse(models.SiteCrt.objects.exists())
+
+    def test_form(self):
+        self.client.force_login(user=self.user)
+        self.client.post(reverse('certificates_create'), {
+            'cn': 'test.example.com', 'validity_period': self.validity_period, 'alt_names': 'a.example.com\n127.0.0.1'})
+
+        self.assertEqual(set(models.SiteCrt.objects.get().alt_names.values_list('name', flat=True)), {
+            'CN:test.example.com', 'DNS:test.example.com', 'DNS:a.example.com', 'IP:127.0.0.1'})
+
+    def test_recreation_keeps_names(self):
+        obj = Ca().generate_site_crt('test.example.com', self.validity_period, alt_names=['a.example.com'])
+        Ca().generate_site_crt('test.example.com', self.validity_period, pk=obj.pk)
+
+        self.assertEqual(san(models.SiteCrt.objects.get(pk=obj.pk)).get_values_for_type(x509.DNSName),
+                         ['test.example.com', 'a.example.com'])
+        self.assertEqual(models.SubjectAltName.objects.filter(name__startswith='DNS:').count(), 2)
+
+
+class Lookup(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+        validity_period = datetime.date.today() + datetime.timedelta(days=10)
+        self.wildcard = Ca().generate_site_crt('example.com', validity_period, alt_names=['*.example.com'])
+        self.exact = Ca().generate_site_crt('www.example.com', validity_period)
+        self.client.force_login(user=self.user)
+
+    def lookup(self, **params):
+        return self.client.get(reverse('rest_site_crt_lookup'), params).json()
+
+    def test_wildcard(self):
+        rows = self.lookup(host='WWW.example.com')
+
+        self.assertEqual({row['id']: row['matched'] for row in rows}, {
+            self.wildcard.pk: 'DNS:*.example.com', self.exact.pk: 'DNS:www.example.com'})
+        self.assertEqual(self.lookup(host='a.b.example.com'), [])
+
+    def test_valid(self):
+        exact = models.SiteCrt.objects.get(pk=self.exact.pk)
+        models.Revocation.objects.create(serial=exact.serial, reason=models.Revocation.SUPERSEDED)
+
+        self.assertEqual(len(self.lookup(host='www.example.com')), 2)
+        self.assertEqual([row['id'] for row in self.lookup(host='www.example.com', valid=1)], [self.wildcard.pk])
+
+    def test_bad_host(self):
+        response = self.client.get(reverse('rest_site_crt_lookup'), {'host': 'bad host'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class AcmeOrder(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        factories.RootCrt.create()
+        self.acme = AcmeClient(self.client)
+        self.acme.new_account()
+
+    def test_several_identifiers(self):
+        with self.settings(ACME_CHALLENGE='auto'):
+            order = self.acme.new_order('a.example.com', 'b.example.com').json()
+            self.assertEqual(len(order['authorizations']), 2)
+            for authorization in order['authorizations']:
+                challenge = self.acme.post(authorization).json()['challenges'][0]
+                self.acme.post(challenge['url'], {})
+            order = self.acme.finalize(order, 'b.example.com', 'a.example.com').json()
+
+        self.assertEqual(order['status'], 'valid')
+        self.assertEqual(set(models.SiteCrt.objects.get().san), {'DNS:a.example.com', 'DNS:b.example.com'})
@@ -1,17 +1,27 @@
+import datetime
+
 from OpenSSL import crypto
+from cryptography.hazmat.primitives.asymmetric import ec
 
-from django.test import TestCase
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from core.tests import TestCase
 from core.tests import factories
+from core.tests.test_rest import make_csr
+from core.benchmarks import self_signed
+from core.utils import Ca
 from core import models
 
 
 class RootCrtExists(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -35,6 +45,7 @@ class RootCrtExists(TestCase):
 class ChoiceRootCrtView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -64,6 +75,7 @@ class ChoiceRootCrtView(TestCase):
 class RootCrtUploadExistingView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -109,6 +121,7 @@ class RootCrtUploadExistingView(TestCase):
 class RootCrtView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -138,8 +151,8 @@ class RootCrtView(TestCase):
 
         self.assertEqual(response.context['breadcrumbs'][0], ('Home', reverse('index')))
         self.assertEqual(response.context['breadcrumbs'][1], ('View root certificate', ''))
-        self.assertEqual(response.context['cert'], cert)
-        self.assertEqual(str(response.context['crt_validity_period']), '2018-05-29 10:26:55')
+        self.assertEqual(response.context['cert'], {key.decode(): value.decode() for key, value in cert.get_components()})
+        self.assertEqual(str(response.context['crt_validity_period']), '2018-05-29 10:26:55+00:00')
 
     def test_initial_form(self):
         self.client.force_login(user=self.user)
@@ -161,6 +174,7 @@ class RootCrtView(TestCase):
 class RootCrtDeleteView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -211,6 +225,7 @@ class RootCrtDeleteView(TestCase):
 class RootCrtGenerateNewView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -262,6 +277,7 @@ class RootCrtGenerateNewView(TestCase):
 class CertificatesSearch(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -299,10 +315,96 @@ class CertificatesSearch(TestCase):
 
         self.assertEqual(len(response.context['object_list']), 1)
 
+    def test_search_names(self):
+        validity_period = datetime.date.today() + datetime.timedelta(days=10)
+        Ca().generate_site_crt('www.example.com', validity_period, alt_names=['api.example.org'])
+        Ca().generate_site_crt('example.com', validity_period)
+        Ca().generate_site_crt('www.example.net', validity_period)
+        self.client.force_login(user=self.user)
+
+        def search(query):
+            response = self.client.get(reverse('certificates_search'), {'cn': query, 'sort': 'cn'})
+            return [obj.cn for obj in response.context['object_list']]
+
+        self.assertEqual(search('WWW.'), ['www.example.com', 'www.example.net'])
+        self.assertEqual(search('api.example'), ['www.example.com'])
+        self.assertEqual(search('*.example.com'), ['www.example.com'])
+        self.assertEqual(search('.example.org'), ['www.example.com'])
+        self.assertEqual(search('example.com'), ['example.com', 'www.example.com'])
+        self.assertEqual(search('example*'), ['example.com'])
+        self.assertEqual(search('dns'), [])
+
+    def page(self, **params):
+        response = self.client.get(reverse('certificates_search'), params)
+        return [obj.cn for obj in response.context['object_list']], response
+
+    @override_settings(CERTIFICATES_PAGE_SIZE=2)
+    def test_pagination(self):
+        for i in range(5):
+            factories.SiteCrt.create(cn='127.0.0.{}'.format(i))
+        self.client.force_login(user=self.user)
+
+        cns, response = self.page(sort='cn')
+        self.assertEqual(cns, ['127.0.0.0', '127.0.0.1'])
+        self.assertIsNone(response.context['previous_url'])
+        self.assertEqual(response.context['count'], 5)
+        obj = response.context['object_list'][0]
+        self.assertTrue({'key', 'crt'} <= obj.get_deferred_fields())
+        self.assertTrue(obj.has_key)
+
+        cns, response = self.page(sort='cn', cursor=response.context['page_obj'].next_cursor)
+        self.assertEqual(cns, ['127.0.0.2', '127.0.0.3'])
+        cns, response = self.page(sort='cn', cursor=response.context['page_obj'].next_cursor)
+        self.assertEqual(cns, ['127.0.0.4'])
+        self.assertIsNone(response.context['next_url'])
+        cns, response = self.page(sort='cn', cursor=response.context['page_obj'].previous_cursor)
+        self.assertEqual(cns, ['127.0.0.2', '127.0.0.3'])
+        self.assertIn('cursor=', response.context['previous_url'])
+
+    @override_settings(CERTIFICATES_PAGE_SIZE=2)
+    def test_pagination_descending_ties(self):
+        for i in range(3):
+            factories.SiteCrt.create(cn='127.0.0.{}'.format(i))
+        self.client.force_login(user=self.user)
+
+        first, response = self.page(sort='-date_end')
+        second, response = self.page(sort='-date_end', cursor=response.context['page_obj'].next_cursor)
+
+        self.assertEqual(sorted(first + second), ['127.0.0.0', '127.0.0.1', '127.0.0.2'])
+        self.assertEqual(first, ['127.0.0.2', '127.0.0.1'])
+
+    @override_settings(CERTIFICATES_MAX_PAGE_SIZE=2)
+    def test_page_size_limit(self):
+        for i in range(3):
+            factories.SiteCrt.create(cn='127.0.0.{}'.format(i))
+        self.client.force_login(user=self.user)
+
+        self.assertEqual(len(self.page(sort='cn', page_size=1000)[0]), 2)
+        self.assertEqual(len(self.page(sort='cn', page_size=1)[0]), 1)
+
+    def test_invalid_cursor(self):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('certificates_search'), {'sort': 'cn', 'cursor': 'bad'})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_count_cached(self):
+        factories.SiteCrt.create()
+        self.client.force_login(user=self.user)
+        self.page(sort='cn')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.page(sort='-cn')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+        factories.SiteCrt.create(cn='127.0.0.2')
+        self.assertEqual(self.page(sort='cn')[1].context['count'], 2)
+
 
 class CertificatesCreateView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -343,9 +445,48 @@ class CertificatesCreateView(TestCase):
         self.assertEqual(response.context['breadcrumbs'][1], ('Create new certificate', ''))
 
 
+class CertificatesSignCsrView(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username='Serega',
+            password='passwd',
+        )
+        factories.RootCrt.create()
+
+    def test_smoke(self):
+        self.client.force_login(user=self.user)
+        response = self.client.get(reverse('certificates_sign_csr'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'core/certificate/sign_csr.html')
+
+    def test_sign(self):
+        csr, _ = make_csr('csr.example.com')
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('certificates_sign_csr'), {
+            'csr': csr, 'validity_period': datetime.date.today() + datetime.timedelta(days=10)})
+        obj = models.SiteCrt.objects.get()
+
+        self.assertRedirects(response, reverse('certificates_view', kwargs={'pk': obj.pk}))
+        self.assertIsNone(obj.key)
+        response = self.client.get(reverse('certificates_download_key', kwargs={'pk': obj.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_csr(self):
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('certificates_sign_csr'), {
+            'csr': 'not a csr', 'validity_period': datetime.date.today() + datetime.timedelta(days=10)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['csr'])
+
+
 class CertificatesUploadExistingView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -395,10 +536,26 @@ class CertificatesUploadExistingView(TestCase):
 
         self.assertEqual(models.SiteCrt.objects.all().count(), 1)
 
+    def test_form_valid_ec(self):
+        crt, key = self_signed(ec.generate_private_key(ec.SECP384R1()))
+        self.client.force_login(user=self.user)
+        self.client.post(reverse('certificates_upload_existing'), {'crt_text': crt, 'key_text': key})
+
+        self.assertEqual(models.SiteCrt.objects.get().key_algorithm, 'ec384')
+
+    def test_unsupported_key_algorithm(self):
+        crt, key = self_signed(ec.generate_private_key(ec.SECP521R1()))
+        self.client.force_login(user=self.user)
+        response = self.client.post(reverse('certificates_upload_existing'), {'crt_text': crt, 'key_text': key})
+
+        self.assertEqual(models.SiteCrt.objects.count(), 0)
+        self.assertIn('Unsupported key algorithm', str(response.context['form'].errors))
+
 
 class CertificatesView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -429,8 +586,17 @@ class CertificatesView(TestCase):
 
         self.assertEqual(response.context['breadcrumbs'][0], ('Home', reverse('index')))
         self.assertEqual(response.context['breadcrumbs'][1], ('View %s' % cert.CN, ''))
-        self.assertEqual(response.context['cert'], cert)
-        self.assertEqual(str(response.context['crt_validity_period']), '2019-05-29 13:08:33')
+        self.assertEqual(response.context['cert'], {key.decode(): value.decode() for key, value in cert.get_components()})
+        self.assertEqual(str(response.context['crt_validity_period']), '2019-05-29 13:08:33+00:00')
+
+    def test_read_only(self):
+        models.SiteCrt.objects.update(fingerprint=None)
+        self.client.force_login(user=self.user)
+
+        response = self.client.get(reverse('certificates_view', kwargs={'pk': '1'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(models.SiteCrt.objects.get().fingerprint)
 
     def test_initial_form(self):
         self.client.force_login(user=self.user)
@@ -451,6 +617,7 @@ class CertificatesView(TestCase):
 class CertificatesDeleteView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -510,6 +677,7 @@ class CertificatesDeleteView(TestCase):
 class CertificatesRecreateView(TestCase):
 
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create(
             username='Serega',
             password='passwd',
@@ -4,17 +4,29 @@ from core.views import general
 from core.views import certificates
 from core.views import root_crt
 from core.views import rest
+from core.views import jobs
+from core.views import crl
+from core.views import ocsp
+from core.views import acme
 
 urlpatterns = [
     url(r'^$', general.Index.as_view(), name='index'),
     url(r'^certificates/$', certificates.Search.as_view(), name='certificates_search'),
     url(r'^certificates/create/$', certificates.Create.as_view(), name='certificates_create'),
+    url(r'^certificates/sign_csr/$', certificates.SignCsr.as_view(), name='certificates_sign_csr'),
     url(r'^certificates/upload_existing/$', certificates.UploadExisting.as_view(), name='certificates_upload_existing'),
     url(r'^certificates/(?P<pk>[0-9]+)/$', certificates.View.as_view(), name='certificates_view'),
     url(r'^certificates/(?P<pk>[0-9]+)/recreate/$', certificates.Recreate.as_view(), name='certificates_recreate'),
+    url(r'^certificates/(?P<pk>[0-9]+)/revoke/$', certificates.Revoke.as_view(), name='certificates_revoke'),
     url(r'^certificates/(?P<pk>[0-9]+)/delete/$', certificates.Delete.as_view(), name='certificates_delete'),
     url(r'^certificates/(?P<pk>[0-9]+)/download_crt/$', certificates.DownloadCrt.as_view(), name='certificates_download_crt'),
     url(r'^certificates/(?P<pk>[0-9]+)/download_key/$', certificates.DownloadKey.as_view(), name='certificates_download_key'),
+    url(r'^certificates/(?P<pk>[0-9]+)/download_fullchain/$', certificates.DownloadCrt.as_view(format='fullchain.pem'),
+        name='certificates_download_fullchain'),
+    url(r'^certificates/(?P<pk>[0-9]+)/download_der/$', certificates.DownloadCrt.as_view(format='crt.der'),
+        name='certificates_download_der'),
+    url(r'^certificates/(?P<pk>[0-9]+)/download_pkcs12/$', certificates.DownloadPkcs12.as_view(),
+        name='certificates_download_pkcs12'),
 
     url(r'^root_crt/$', root_crt.CrtChoice.as_view(), name='root_crt'),
     url(r'^root_crt/already_exists/$', root_crt.Exists.as_view(), name='root_crt_exists'),
@@ -25,6 +37,37 @@ urlpatterns = [
     url(r'^root_crt/delete/$', root_crt.Delete.as_view(), name='root_crt_delete'),
     url(r'^root_crt/download_crt/$', root_crt.DownloadRootCrt.as_view(), name='root_crt_download'),
 
+    url(r'^crl/root\.(?P<encoding>der|pem)$', crl.Crl.as_view(), name='crl'),
+    url(r'^crl/delta\.(?P<encoding>der|pem)$', crl.Crl.as_view(delta=True), name='crl_delta'),
+    url(r'^ocsp/$', ocsp.Responder.as_view(), name='ocsp'),
+    url(r'^ocsp/(?P<encoded>.+)$', ocsp.Responder.as_view(), name='ocsp_get'),
+
+    url(r'^acme/directory$', acme.Directory.as_view(), name='acme_directory'),
+    url(r'^acme/new-nonce$', acme.NewNonce.as_view(), name='acme_new_nonce'),
+    url(r'^acme/new-account$', acme.NewAccount.as_view(), name='acme_new_account'),
+    url(r'^acme/new-order$', acme.NewOrder.as_view(), name='acme_new_order'),
+    url(r'^acme/revoke-cert$', acme.RevokeCert.as_view(), name='acme_revoke_cert'),
+    url(r'^acme/acct/(?P<pk>[0-9]+)$', acme.Account.as_view(), name='acme_account'),
+    url(r'^acme/acct/(?P<pk>[0-9]+)/orders$', acme.AccountOrders.as_view(), name='acme_account_orders'),
+    url(r'^acme/order/(?P<pk>[0-9]+)$', acme.Order.as_view(), name='acme_order'),
+    url(r'^acme/order/(?P<pk>[0-9]+)/finalize$', acme.Finalize.as_view(), name='acme_finalize'),
+    url(r'^acme/order/(?P<pk>[0-9]+)/cert$', acme.Certificate.as_view(), name='acme_certificate'),
+    url(r'^acme/authz/(?P<pk>[0-9]+)$', acme.Authorization.as_view(), name='acme_authorization'),
+    url(r'^acme/chall/(?P<pk>[0-9]+)$', acme.Challenge.as_view(), name='acme_challenge'),
+
+    url(r'^jobs/(?P<pk>[0-9]+)/$', jobs.View.as_view(), name='job_view'),
+
     url(r'^api/site_crt/create/$', rest.SiteCrtCreate.as_view(), name='rest_site_crt_create'),
+    url(r'^api/site_crt/sign_csr/$', rest.SiteCrtSignCsr.as_view(), name='rest_site_crt_sign_csr'),
+    url(r'^api/site_crt/bulk_create/$', rest.SiteCrtBulkCreate.as_view(), name='rest_site_crt_bulk_create'),
+    url(r'^api/site_crt/lookup/$', rest.SiteCrtLookup.as_view(), name='rest_site_crt_lookup'),
+    url(r'^api/site_crt/expiring/$', rest.SiteCrtExpiring.as_view(), name='rest_site_crt_expiring'),
+    url(r'^api/site_crt/export/$', rest.SiteCrtExport.as_view(), name='rest_site_crt_export'),
+    url(r'^api/site_crt/import/$', rest.SiteCrtImport.as_view(), name='rest_site_crt_import'),
+    url(r'^api/site_crt/(?P<pk>[0-9]+)/(?P<output>crt\.pem|fullchain\.pem|crt\.der)$', rest.SiteCrtDownload.as_view(),
+        name='rest_site_crt_download'),
+    url(r'^api/site_crt/(?P<pk>[0-9]+)/bundle\.p12$', rest.SiteCrtPkcs12.as_view(), name='rest_site_crt_pkcs12'),
+    url(r'^api/site_crt/(?P<pk>[0-9]+)/revoke/$', rest.SiteCrtRevoke.as_view(), name='rest_site_crt_revoke'),
     url(r'^api/site_crt/$', rest.SiteCrtList.as_view(), name='rest_site_crt_list'),
+    url(r'^api/jobs/(?P<pk>[0-9]+)/$', rest.IssuanceJobView.as_view(), name='rest_job_view'),
 ]
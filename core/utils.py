@@ -1,70 +1,154 @@
+import collections
 import datetime
-import os
-import subprocess
-import re
-import shutil
-import tempfile
 
-from django.utils import timezone
+from OpenSSL import crypto
+
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
 from core import models
-
-
-class CaError(Exception):
-    """Error create certificate"""
+from core import key_pool
+from core import root_cache
+from core import issuance
+from core import crt_metadata
+from core.issuance import CaError, get_backend
 
 
 class Ca:
-    def generate_root_crt(self, data, recreation=False):
-        directory = tempfile.mkdtemp()
+    def __init__(self):
+        self.backend = get_backend()
 
-        if not os.path.exists(os.path.join(directory, settings.ROOT_CRT_PATH)):
-            os.mkdir(os.path.join(directory, settings.ROOT_CRT_PATH))
-
-        self.path_root_key = os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.key')
-        self.path_root_crt = os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.crt')
-
-        self._create_pkey(self.path_root_key)
+    def generate_root_crt(self, data, recreation=False):
+        algorithm = data.get('key_algorithm')
+        if recreation and not algorithm:
+            algorithm = root_cache.get().obj.key_algorithm
+        key = self.backend.generate_key(algorithm or settings.DEFAULT_KEY_ALGORITHM)
         validity_period = self.calculate_validity_period(data['validity_period'])
         if recreation:
-            self._create_root_crt(self.generate_subj_recreation_root_crt(), validity_period)
-            self._recreation_model_root_crt(directory)
-            self._delete_files(self.path_root_crt)
+            crt = self.backend.create_root_crt(key, self.generate_subj_recreation_root_crt(), validity_period)
+            self._recreation_model_root_crt(key, crt)
         else:
-            self._create_root_crt(self.generate_subj_root_crt(data), validity_period)
-            obj = self._create_model_root_crt(data, directory)
-            self._delete_files(self.path_root_crt)
-            return obj
-
-    def generate_site_crt(self, cn, validity_period, pk=None, alt_name='DNS'):
-        directory = tempfile.mkdtemp()
-
-        if not os.path.exists(os.path.join(directory, cn)):
-            os.mkdir(os.path.join(directory, cn))
-
-        self._create_root_files(directory)
-
-        path = os.path.join(directory + '/' + cn + '/' + cn)
-        self.path_root_key = os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.key')
-        self.path_root_crt = os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.crt')
-
-        self._create_pkey(path + '.key')
-        self._create_config_crt(self.generate_subj_site_crt(cn), directory)
-        self._create_extfile_crt(cn, alt_name, directory)
-        self._create_req_crt(path)
-        self._create_site_crt(path, self.calculate_validity_period(validity_period))
+            crt = self.backend.create_root_crt(key, self.generate_subj_root_crt(data), validity_period)
+            return self._create_model_root_crt(data, key, crt)
+
+    def generate_site_crt(self, cn, validity_period, pk=None, alt_names=None, algorithm=None):
+        """Issue a site certificate for cn and the host names and IP addresses in alt_names
+
+        On recreation (pk) the key algorithm and alternative names of the current certificate are kept unless given.
+        """
+        validity_period = self.calculate_validity_period(validity_period)
+        if pk and (not algorithm or alt_names is None):
+            current = models.SiteCrt.objects.only('key_type', 'key_size', 'san').get(pk=pk)
+            algorithm = algorithm or current.key_algorithm
+            alt_names = current.san if alt_names is None else alt_names
+        alt_names = self.subject_alt_names(cn, alt_names)
+        key = key_pool.take(self.backend, algorithm)
+        crt = self.backend.create_site_crt(key, self.generate_subj_site_crt(cn), alt_names, validity_period,
+                                           root_cache.get())
         if pk:
-            obj = self._recreation_model_site_crt(cn, pk, self.calculate_validity_period(validity_period), directory)
-        else:
-            obj = self._create_model_site_crt(cn, self.calculate_validity_period(validity_period), directory)
-        self._delete_files(path)
-        return obj
+            return self._recreation_model_site_crt(pk, key, crt)
+        return self._create_model_site_crt(cn, key, crt)
+
+    def sign_csr(self, csr, validity_period, cn=None, pk=None, alt_names=None):
+        """Sign a client generated certificate signing request, the SiteCrt is stored without a key
+
+        cn and alt_names are taken from the request unless given, the subject is the one of site certificates
+        for cn and not copied from the request. With pk that SiteCrt gets the new certificate instead.
+        """
+        request = issuance.load_csr(csr)
+        cn = cn or issuance.csr_common_name(request)
+        if alt_names is None:
+            alt_names = crt_metadata.subject_alt_names(request)
+        crt = self.backend.sign_csr(csr, self.generate_subj_site_crt(cn), self.subject_alt_names(cn, alt_names),
+                                    self.calculate_validity_period(validity_period), root_cache.get())
+        if pk:
+            self._recreation_model_site_crt(pk, None, crt)
+            return models.SiteCrt.objects.get(pk=pk)
+        return self._create_model_site_crt(cn, None, crt)
+
+    def generate_site_crts(self, items):
+        """Issue site certificates for a list of {'cn', 'validity_period', 'key_algorithm', 'alt_names'} in parallel
+
+        Returns a list of (SiteCrt, None) or (None, error message) in the order of items,
+        the created certificates are inserted in one transaction.
+        """
+        root = root_cache.get()
+        tasks = self._site_crt_tasks([(item['cn'], item.get('key_algorithm'),
+                                       self.calculate_validity_period(item['validity_period']), item.get('alt_names'))
+                                      for item in items])
+
+        results = []
+        objects = []
+        for item, (signed, error) in zip(items, issuance.sign_site_crts(tasks, root)):
+            if error:
+                results.append((None, error))
+                continue
+            key, crt = signed
+            obj = models.SiteCrt(key=key, crt=crt, cn=item['cn'], **models.SiteCrt.crt_metadata(crt))
+            objects.append(obj)
+            results.append((obj, None))
+
+        with transaction.atomic():
+            models.SiteCrt.objects.bulk_create(objects, batch_size=500)
+            models.site_crts_saved.send(sender=models.SiteCrt, site_crts=objects, created=True)
+        return results
+
+    def renew_site_crts(self, site_crts, validity_period):
+        """Issue new keys and certificates for existing SiteCrt rows in parallel, validity_period in days
+
+        Each certificate keeps its key algorithm and alternative names. Returns a list of (SiteCrt, None) or (None, error message)
+        in the order of site_crts, the renewed rows are updated in one transaction.
+        """
+        root = root_cache.get()
+        tasks = self._site_crt_tasks([(obj.cn, obj.key_algorithm, validity_period, obj.san) for obj in site_crts])
+
+        results = []
+        objects = []
+        for obj, (signed, error) in zip(site_crts, issuance.sign_site_crts(tasks, root)):
+            if error:
+                results.append((None, error))
+                continue
+            obj.key, obj.crt = signed
+            obj.date_start = timezone.now()
+            obj.set_crt_metadata()
+            objects.append(obj)
+            results.append((obj, None))
+
+        with transaction.atomic():
+            models.SiteCrt.objects.bulk_update(
+                objects, ['key', 'crt', 'date_start'] + models.SiteCrt.METADATA_FIELDS, batch_size=500)
+            models.site_crts_saved.send(sender=models.SiteCrt, site_crts=objects, created=False)
+        return results
+
+    def _site_crt_tasks(self, items):
+        """sign_site_crts tasks of (cn, algorithm, validity_period, alt_names), pooled keys are taken per algorithm"""
+        items = [(cn, algorithm or settings.DEFAULT_KEY_ALGORITHM, validity_period, alt_names)
+                 for cn, algorithm, validity_period, alt_names in items]
+        counts = collections.Counter(algorithm for _, algorithm, _, _ in items)
+        keys = {algorithm: iter(key_pool.take_many(algorithm, count)) for algorithm, count in counts.items()}
+        return [(next(keys[algorithm]), algorithm, self.generate_subj_site_crt(cn),
+                 self.subject_alt_names(cn, alt_names), validity_period)
+                for cn, algorithm, validity_period, alt_names in items]
 
     @staticmethod
-    def get_type_alt_names(cn):
-        ip_regexp = r"^(([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$"
-        return re.search(ip_regexp, cn)
+    def subject_alt_names(cn, alt_names=None):
+        """Normalized "DNS:name" and "IP:address" list of cn followed by alt_names, raise CaError on an invalid name"""
+        try:
+            names = [crt_metadata.alt_name(cn)]
+        except ValueError:
+            # common names were never validated, they are still issued as they are
+            names = ['DNS:' + cn]
+        for value in alt_names or []:
+            try:
+                name = crt_metadata.alt_name(value)
+            except ValueError as e:
+                raise CaError(str(e))
+            if name not in names:
+                names.append(name)
+        if len(names) > settings.SITE_CRT_MAX_ALT_NAMES:
+            raise CaError('No more than {} alternative names per certificate'.format(settings.SITE_CRT_MAX_ALT_NAMES))
+        return names
 
     @staticmethod
     def calculate_validity_period(date):
@@ -87,7 +171,7 @@ class Ca:
 
     @staticmethod
     def generate_subj_recreation_root_crt():
-        root = models.RootCrt.objects.get()
+        root = root_cache.get().obj
         options = {
             'C': root.country,
             'ST': root.state,
@@ -100,7 +184,7 @@ class Ca:
 
     @staticmethod
     def generate_subj_site_crt(cn):
-        root = models.RootCrt.objects.get()
+        root = root_cache.get().obj
         options = {
             'C': root.country,
             'ST': root.state,
@@ -112,163 +196,50 @@ class Ca:
         }
         return options
 
-    def _create_root_files(self, directory):
-        obj = models.RootCrt.objects.get()
-        os.mkdir(os.path.join(directory, settings.ROOT_CRT_PATH))
-        with open(os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.key'), 'w+') as f:
-            f.write(obj.key)
-        with open(os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.crt'), 'w+') as f:
-            f.write(obj.crt)
-
-    def _delete_files(self, path):
-        path_dir = os.path.dirname(os.path.dirname(path))
-        shutil.rmtree(path_dir)
-
-    def _eror_processing(self, p, path):
-        if p.returncode:
-            self._delete_files(path)
-            raise CaError('Command:\n' + p.args + '\n' + 'Output:\n' + p.stderr)
-
-    def _create_pkey(self, path):
-        command_generate_key = 'openssl genrsa -out {path} 2048'.format(path=path)
-        p = subprocess.run(command_generate_key, shell=True, stderr=subprocess.PIPE, universal_newlines=True)
-
-        self._eror_processing(p, path)
-
-    def _create_root_crt(self, data, validity_period):
-        command_generate_root_crt = 'openssl req -x509 -new -key {path_key} -days {validity_period} -out {path_crt}'.format(
-            path_key=self.path_root_key, path_crt=self.path_root_crt, validity_period=validity_period)
-
-        command_subj_root_crt = ' -subj "'
-        for key, value in data.items():
-            if value not in ['', None] and key != 'validity_period':
-                command_subj_root_crt += '/{key}={value}'.format(key=key, value=value)
-        command_subj_root_crt += '"'
-
-        p = subprocess.run(command_generate_root_crt + command_subj_root_crt, shell=True, stderr=subprocess.PIPE,
-                           universal_newlines=True)
-
-        self._eror_processing(p, self.path_root_crt)
-
-    def _create_extfile_crt(self, cn, alt_name, directory):
-        ext = ['authorityKeyIdentifier=keyid,issuer\n', 'basicConstraints=CA:FALSE\n',
-               'keyUsage = digitalSignature, nonRepudiation, keyEncipherment, dataEncipherment\n',
-               'extendedKeyUsage = serverAuth, clientAuth\n',
-               'subjectAltName = @alt_names\n', '\n', '[alt_names]\n', '{alt_name}.1 = {cn}\n'.format(alt_name=alt_name,
-                                                                                                      cn=cn)]
-        with open(os.path.join(directory, cn, cn + '.ext'), 'wb') as f:
-            for x in ext:
-                f.write(x.encode())
-
-    def _create_config_crt(self, data, directory):
-        config = ['[req]\n', 'default_bits = 2048\n', 'prompt = no\n', 'default_md = sha256\n',
-                  'distinguished_name = dn\n', '\n', '[dn]\n']
-        for key, value in data.items():
-            if value not in ['', None] and key != 'validity_period':
-                config.append('{key}={value}\n'.format(key=key, value=value))
-
-        with open(os.path.join(directory, data['CN'], data['CN'] + '.cnf'), 'wb') as f:
-            for x in config:
-                f.write(x.encode())
-
-    def _create_req_crt(self, path):
-        command_generate_req = '/bin/bash -c "openssl req -new -key {path_key} -out {path_csr} -config <( cat {path_config} )"'.format(
-            path_key=path + '.key', path_csr=path + '.csr', path_config=path + '.cnf')
-
-        p = subprocess.run(command_generate_req, shell=True, stderr=subprocess.PIPE, universal_newlines=True)
-
-        self._eror_processing(p, path)
-
-    def _create_site_crt(self, path, validity_period):
-        command_generate_crt = 'openssl x509 -req -in {path_csr} -CA {path_root_crt} -CAkey {path_root_key}' \
-                               ' -CAcreateserial -out {path_crt} -days {validity_period} -extfile {path_ext}'.format(
-            path_csr=path + '.csr', path_root_crt=self.path_root_crt, path_root_key=self.path_root_key, path_crt=path + '.crt',
-            validity_period=validity_period, path_ext=path + '.ext')
-
-        p = subprocess.run(command_generate_crt, shell=True, stderr=subprocess.PIPE, universal_newlines=True)
-
-        self._eror_processing(p, path)
-
-    def check_crt_and_key(self, crt, key):
-        directory = tempfile.mkdtemp()
-        path = os.path.join(directory, 'check')
-
-        if not os.path.exists(path):
-            os.mkdir(path)
-
-        if isinstance(crt, bytes):
-            crt = crt.decode()
-
-        if isinstance(key, bytes):
-            key = key.decode()
-
-        with open(os.path.join(path, 'crt.crt'), 'w+') as f:
-            f.write(crt)
-        with open(os.path.join(path, 'key.key'), 'w+') as f:
-            f.write(key)
-
-        p_crt = subprocess.run('openssl x509 -noout -modulus -in {}'.format(os.path.join(path, 'crt.crt')), shell=True,
-                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-
-        self._eror_processing(p_crt, os.path.join(path, 'crt.crt'))
-
-        p_key = subprocess.run('openssl rsa -noout -modulus -in {}'.format(os.path.join(path, 'key.key')), shell=True,
-                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-
-        self._eror_processing(p_key, os.path.join(path, 'key.key'))
-
-        return (p_crt.stdout == p_key.stdout)
-
-    def _create_model_root_crt(self, data, directory):
-        key = open(os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.key'))
-        crt = open(os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.crt'))
-        root_crt = models.RootCrt.objects.create(
-            key=key.read(),
-            crt=crt.read(),
+    @staticmethod
+    def check_crt_and_key(crt, key):
+        try:
+            return crt_metadata.crt_matches_key(crt, key)
+        except crypto.Error as e:
+            raise CaError(str(e) or 'Invalid certificate or key')
+
+    def _create_model_root_crt(self, data, key, crt):
+        return models.RootCrt.objects.create(
+            key=key,
+            crt=crt,
             country=data['country'],
             state=data['state'],
             location=data['location'],
             organization=data['organization'],
             organizational_unit_name=data['organizational_unit_name'],
-            email=data['email']
+            email=data['email'],
+            **models.RootCrt.crt_metadata(crt)
         )
-        key.close()
-        crt.close()
-        return root_crt
 
-    def _recreation_model_root_crt(self, directory):
-        key = open(os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.key'))
-        crt = open(os.path.join(directory, settings.ROOT_CRT_PATH, 'rootCA.crt'))
-        root_crt = models.RootCrt.objects.all().update(
-            key=key.read(),
-            crt=crt.read()
-        )
-        key.close()
-        crt.close()
+    def _recreation_model_root_crt(self, key, crt):
+        root_crt = models.RootCrt.objects.get()
+        root_crt.key = key
+        root_crt.crt = crt
+        root_crt.set_crt_metadata()
+        root_crt.save()
         return root_crt
 
-    def _create_model_site_crt(self, cn, validity_period, directory):
-        key = open(os.path.join(directory, cn, cn + '.key'))
-        crt = open(os.path.join(directory, cn, cn + '.crt'))
-        site_crt = models.SiteCrt.objects.create(
-            key=key.read(),
-            crt=crt.read(),
+    def _create_model_site_crt(self, cn, key, crt):
+        return models.SiteCrt.objects.create(
+            key=key,
+            crt=crt,
             cn=cn,
-            date_end=timezone.now() + datetime.timedelta(days=validity_period),
+            **models.SiteCrt.crt_metadata(crt)
         )
-        key.close()
-        crt.close()
-        return site_crt
 
-    def _recreation_model_site_crt(self, cn, pk, validity_period, directory):
-        key = open(os.path.join(directory, cn, cn + '.key'))
-        crt = open(os.path.join(directory, cn, cn + '.crt'))
-        site_crt = models.SiteCrt.objects.filter(pk=pk).update(
-            key=key.read(),
-            crt=crt.read(),
-            date_start=timezone.now(),
-            date_end=timezone.now() + datetime.timedelta(days=validity_period)
-        )
-        key.close()
-        crt.close()
-        return site_crt
+    def _recreation_model_site_crt(self, pk, key, crt):
+        with transaction.atomic():
+            updated = models.SiteCrt.objects.filter(pk=pk).update(
+                key=key,
+                crt=crt,
+                date_start=timezone.now(),
+                **models.SiteCrt.crt_metadata(crt)
+            )
+            models.site_crts_saved.send(sender=models.SiteCrt, created=False,
+                                        site_crts=models.SiteCrt.objects.filter(pk=pk).only('pk', 'cn', 'san'))
+        return updated
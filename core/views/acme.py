@@ -0,0 +1,208 @@
+import json
+
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from core import acme
+from core import models
+
+
+def render(request, data, status=200, location=None, content_type=None):
+    if content_type:
+        response = HttpResponse(data, status=status, content_type=content_type)
+    else:
+        response = JsonResponse(data, status=status)
+    response['Replay-Nonce'] = acme.new_nonce()
+    response['Link'] = '<{}>;rel="index"'.format(request.build_absolute_uri(reverse('acme_directory')))
+    response['Cache-Control'] = 'no-store'
+    if location:
+        response['Location'] = location
+    return response
+
+
+def problem(request, error):
+    return render(request, json.dumps({
+        'type': 'urn:ietf:params:acme:error:{}'.format(error.type),
+        'detail': error.detail,
+        'status': error.status,
+    }), status=error.status, content_type='application/problem+json')
+
+
+def url(request, name, *args):
+    return request.build_absolute_uri(reverse(name, args=args))
+
+
+class Directory(View):
+
+    def get(self, request):
+        return JsonResponse({
+            'newNonce': url(request, 'acme_new_nonce'),
+            'newAccount': url(request, 'acme_new_account'),
+            'newOrder': url(request, 'acme_new_order'),
+            'revokeCert': url(request, 'acme_revoke_cert'),
+            'meta': {'externalAccountRequired': False},
+        })
+
+
+class NewNonce(View):
+
+    def head(self, request):
+        return render(request, b'', content_type='application/octet-stream')
+
+    def get(self, request):
+        return render(request, b'', status=204, content_type='application/octet-stream')
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AcmeView(View):
+    """POST endpoint taking a JWS; handle() returns the response or raises AcmeError"""
+    account_required = True
+
+    def post(self, request, **kwargs):
+        try:
+            jws = acme.parse(request.body, request.build_absolute_uri())
+            if self.account_required and jws.account is None:
+                raise acme.AcmeError('malformed', 'Request must be signed with the account kid')
+            return self.handle(request, jws, **kwargs)
+        except acme.AcmeError as e:
+            return problem(request, e)
+        except Http404:
+            return problem(request, acme.AcmeError('malformed', 'Resource does not exist', 404))
+        except models.RootCrt.DoesNotExist:
+            return problem(request, acme.AcmeError('serverInternal', 'Root certificate is not configured', 500))
+
+    def handle(self, request, jws, **kwargs):
+        raise NotImplementedError
+
+    @staticmethod
+    def account_json(request, account):
+        return {
+            'status': account.status,
+            'contact': account.contact,
+            'orders': url(request, 'acme_account_orders', account.pk),
+        }
+
+    @staticmethod
+    def order_json(request, order):
+        data = {
+            'status': order.status,
+            'expires': order.expires.isoformat(),
+            'identifiers': order.identifiers,
+            'authorizations': [url(request, 'acme_authorization', pk)
+                               for pk in order.authorizations.values_list('pk', flat=True)],
+            'finalize': url(request, 'acme_finalize', order.pk),
+        }
+        if order.status == models.AcmeOrder.VALID:
+            data['certificate'] = url(request, 'acme_certificate', order.pk)
+        if order.error:
+            data['error'] = {'type': 'urn:ietf:params:acme:error:badCSR', 'detail': order.error}
+        return data
+
+    @staticmethod
+    def challenge_json(request, authorization):
+        challenge = {
+            'type': 'http-01',
+            'url': url(request, 'acme_challenge', authorization.pk),
+            'token': authorization.token,
+            'status': authorization.status,
+        }
+        if authorization.date_validated and authorization.status == models.AcmeAuthorization.VALID:
+            challenge['validated'] = authorization.date_validated.isoformat()
+        if authorization.error:
+            challenge['error'] = {'type': 'urn:ietf:params:acme:error:unauthorized', 'detail': authorization.error}
+        return challenge
+
+    @staticmethod
+    def owned(queryset, jws, pk):
+        return get_object_or_404(queryset, pk=pk, account=jws.account)
+
+
+class NewAccount(AcmeView):
+    account_required = False
+
+    def handle(self, request, jws):
+        account, created = acme.new_account(jws)
+        return render(request, self.account_json(request, account), status=201 if created else 200,
+                      location=url(request, 'acme_account', account.pk))
+
+
+class Account(AcmeView):
+
+    def handle(self, request, jws, pk):
+        if jws.account.pk != int(pk):
+            raise acme.AcmeError('unauthorized', 'Request is signed by another account', 403)
+        account = acme.update_account(jws.account, jws.payload)
+        return render(request, self.account_json(request, account))
+
+
+class AccountOrders(AcmeView):
+
+    def handle(self, request, jws, pk):
+        if jws.account.pk != int(pk):
+            raise acme.AcmeError('unauthorized', 'Request is signed by another account', 403)
+        pks = jws.account.orders.exclude(status=models.AcmeOrder.INVALID).values_list('pk', flat=True)
+        return render(request, {'orders': [url(request, 'acme_order', pk) for pk in pks]})
+
+
+class NewOrder(AcmeView):
+
+    def handle(self, request, jws):
+        order = acme.new_order(jws.account, jws.payload)
+        return render(request, self.order_json(request, order), status=201,
+                      location=url(request, 'acme_order', order.pk))
+
+
+class Order(AcmeView):
+
+    def handle(self, request, jws, pk):
+        order = acme.expire(self.owned(models.AcmeOrder.objects.all(), jws, pk))
+        return render(request, self.order_json(request, order))
+
+
+class Authorization(AcmeView):
+
+    def handle(self, request, jws, pk):
+        authorization = acme.expire(self.owned(models.AcmeAuthorization.objects.all(), jws, pk))
+        return render(request, {
+            'status': authorization.status,
+            'expires': authorization.expires.isoformat(),
+            'identifier': {'type': authorization.identifier_type, 'value': authorization.identifier},
+            'challenges': [self.challenge_json(request, authorization)],
+        })
+
+
+class Challenge(AcmeView):
+
+    def handle(self, request, jws, pk):
+        authorization = acme.expire(self.owned(models.AcmeAuthorization.objects.all(), jws, pk))
+        if jws.payload is not None:
+            authorization = acme.respond_challenge(authorization, jws.jwk, request.META.get('REMOTE_ADDR'))
+        response = render(request, self.challenge_json(request, authorization))
+        response['Link'] += ', <{}>;rel="up"'.format(url(request, 'acme_authorization', authorization.pk))
+        return response
+
+
+class Finalize(AcmeView):
+
+    def handle(self, request, jws, pk):
+        order = acme.finalize(self.owned(models.AcmeOrder.objects.all(), jws, pk), jws.payload)
+        return render(request, self.order_json(request, order), location=url(request, 'acme_order', order.pk))
+
+
+class Certificate(AcmeView):
+
+    def handle(self, request, jws, pk):
+        order = self.owned(models.AcmeOrder.objects.filter(status=models.AcmeOrder.VALID), jws, pk)
+        return render(request, order.crt, content_type='application/pem-certificate-chain')
+
+
+class RevokeCert(AcmeView):
+    account_required = False
+
+    def handle(self, request, jws):
+        acme.revoke(jws)
+        return render(request, b'', content_type='application/octet-stream')
@@ -1,12 +1,13 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from OpenSSL import crypto
 from djutils.views.generic import SortMixin
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.utils import timezone
 from django.conf import settings
 from django.contrib import messages
+from django.db.models import BooleanField, ExpressionWrapper, Q
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy, reverse
 from django.views.generic import FormView, DetailView, DeleteView, ListView
@@ -15,6 +16,12 @@ from django.views.generic.edit import FormMixin, ContextMixin
 from core.utils import Ca
 from core import forms
 from core import models
+from core import jobs
+from core import crl
+from core import bundles
+from core import pagination
+from core import search
+from core.issuance import CaError
 
 
 class BreadcrumbsMixin(ContextMixin):
@@ -28,25 +35,64 @@ class BreadcrumbsMixin(ContextMixin):
 
 
 class Search(BreadcrumbsMixin, SortMixin, FormMixin, ListView):
+    """Certificates list with keyset pagination: ?cursor= comes from the page links, ?page_size= is capped"""
     form_class = forms.CertificatesSearch
     model = models.SiteCrt
     template_name = 'core/certificate/search.html'
     sort_params = ['cn', 'date_start', 'date_end']
+    sort_qs = False
+    page_kwarg = 'cursor'
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['data'] = self.request.GET
         return kwargs
 
+    def get_paginate_by(self, queryset):
+        try:
+            page_size = int(self.request.GET.get('page_size', settings.CERTIFICATES_PAGE_SIZE))
+        except ValueError:
+            page_size = settings.CERTIFICATES_PAGE_SIZE
+        return max(1, min(page_size, settings.CERTIFICATES_MAX_PAGE_SIZE))
+
+    def get_ordering(self):
+        ordering = self.request.GET.get(self.get_sort_param_name(), '')
+        if ordering.lstrip('-') not in self.sort_params:
+            return self.get_default_sort_param()
+        return ordering
+
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().only('cn', 'date_start', 'date_end').annotate(
+            has_key=ExpressionWrapper(Q(key__isnull=False), output_field=BooleanField()))
+        self.query = ''
         form = self.form_class(self.request.GET)
         if form.is_valid():
-            cn = form.cleaned_data['cn']
-            if cn:
-                queryset = queryset.filter(cn__icontains=cn)
+            self.query = form.cleaned_data['cn'].strip().lower()
+            queryset = search.search(queryset, self.query)
         return queryset
 
+    def paginate_queryset(self, queryset, page_size):
+        self.count = pagination.cached_count(queryset, self.query)
+        try:
+            page = pagination.keyset_page(queryset, self.get_ordering(), self.request.GET.get(self.page_kwarg),
+                                          page_size)
+        except ValueError:
+            raise Http404('Invalid cursor')
+        return None, page, page.object_list, page.has_other_pages()
+
+    def cursor_url(self, cursor):
+        params = self.request.GET.copy()
+        params[self.page_kwarg] = cursor
+        return '?' + params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context['page_obj']
+        context['count'] = self.count
+        context['next_url'] = self.cursor_url(page.next_cursor) if page.has_next() else None
+        context['previous_url'] = self.cursor_url(page.previous_cursor) if page.has_previous() else None
+        return context
+
 
 class Create(BreadcrumbsMixin, FormView):
     form_class = forms.CertificatesCreate
@@ -66,10 +112,35 @@ class Create(BreadcrumbsMixin, FormView):
 
     def form_valid(self, form):
         ca = Ca()
-        if ca.get_type_alt_names(form.cleaned_data['cn']):
-            self.object = ca.generate_site_crt(form.cleaned_data['cn'], form.cleaned_data['validity_period'], alt_name='IP')
-        else:
-            self.object = ca.generate_site_crt(form.cleaned_data['cn'], form.cleaned_data['validity_period'])
+        if settings.CA_ASYNC_ISSUANCE:
+            job = jobs.enqueue(models.IssuanceJob.SITE_CRT, cn=form.cleaned_data['cn'],
+                               validity_period=form.cleaned_data['validity_period'],
+                               alt_names=form.cleaned_data['alt_names'], key_algorithm=form.cleaned_data['key_algorithm'])
+            return HttpResponseRedirect(reverse('job_view', kwargs={'pk': job.pk}))
+        self.object = ca.generate_site_crt(form.cleaned_data['cn'], form.cleaned_data['validity_period'],
+                                           alt_names=form.cleaned_data['alt_names'],
+                                           algorithm=form.cleaned_data['key_algorithm'])
+        return super().form_valid(form)
+
+
+class SignCsr(BreadcrumbsMixin, FormView):
+    form_class = forms.CertificatesSignCsr
+    template_name = 'core/certificate/sign_csr.html'
+
+    def get_success_url(self):
+        return reverse_lazy('certificates_view', kwargs={'pk': self.object.pk})
+
+    def get_breadcrumbs(self):
+        return (
+            ('Home', reverse('index')),
+            ('Sign a certificate request', '')
+        )
+
+    def get_initial(self):
+        return {'validity_period': timezone.now() + timedelta(days=settings.VALIDITY_PERIOD_CRT)}
+
+    def form_valid(self, form):
+        self.object = Ca().sign_csr(form.cleaned_data['csr'], form.cleaned_data['validity_period'])
         return super().form_valid(form)
 
 
@@ -88,7 +159,6 @@ class UploadExisting(BreadcrumbsMixin, FormView):
         )
 
     def form_valid(self, form):
-        current_tz = timezone.get_current_timezone()
         if form.cleaned_data['crt_file']:
             crt_file_data = form.cleaned_data['crt_file'].read().decode()
             cert = crypto.load_certificate(crypto.FILETYPE_PEM, crt_file_data)
@@ -96,7 +166,7 @@ class UploadExisting(BreadcrumbsMixin, FormView):
                 key=form.cleaned_data['key_file'].read().decode(),
                 crt=crt_file_data,
                 cn=cert.get_subject().CN,
-                date_end=current_tz.localize(datetime.strptime(cert.get_notAfter().decode(), '%Y%m%d%H%M%SZ'))
+                **models.SiteCrt.crt_metadata(crt_file_data)
             )
         elif form.cleaned_data['crt_text']:
             cert = crypto.load_certificate(crypto.FILETYPE_PEM, form.cleaned_data['crt_text'])
@@ -105,7 +175,7 @@ class UploadExisting(BreadcrumbsMixin, FormView):
                 key=form.cleaned_data['key_text'],
                 crt=form.cleaned_data['crt_text'],
                 cn=cn,
-                date_end=current_tz.localize(datetime.strptime(cert.get_notAfter().decode(), '%Y%m%d%H%M%SZ'))
+                **models.SiteCrt.crt_metadata(form.cleaned_data['crt_text'])
             )
         return super().form_valid(form)
 
@@ -131,10 +201,12 @@ class View(BreadcrumbsMixin, FormMixin, DetailView):
         return get_object_or_404(self.model, pk=self.kwargs['pk'])
 
     def get_context_data(self, **kwargs):
-        cert_data = self.object.crt.encode()
-        cert = crypto.load_certificate(crypto.FILETYPE_PEM, cert_data)
-        kwargs['cert'] = cert.get_subject()
-        kwargs['crt_validity_period'] = datetime.strptime(cert.get_notAfter().decode(), '%Y%m%d%H%M%SZ')
+        # parsed for display only, "manage.py backfill_crt_metadata" stores it
+        if not self.object.has_crt_metadata():
+            self.object.set_crt_metadata()
+        kwargs['cert'] = self.object.subject
+        kwargs['crt_validity_period'] = self.object.not_after
+        kwargs['revoked'] = self.object.is_revoked()
         return super().get_context_data(**kwargs)
 
 
@@ -154,6 +226,39 @@ class Delete(BreadcrumbsMixin, DeleteView):
         return get_object_or_404(self.model, pk=self.kwargs['pk'])
 
 
+class Revoke(BreadcrumbsMixin, FormView, DetailView):
+    model = models.SiteCrt
+    form_class = forms.RevokeCrt
+    template_name = 'core/certificate/revoke.html'
+
+    def get_breadcrumbs(self):
+        return (
+            ('Home', reverse('index')),
+            ('View %s' % self.object.cn, reverse('certificates_view', kwargs={'pk': self.kwargs['pk']})),
+            ('Revoke certificate', '')
+        )
+
+    def get_success_url(self):
+        return reverse_lazy('certificates_view', kwargs={'pk': self.kwargs['pk']})
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return super().get(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return super().post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        try:
+            crl.revoke(self.object, form.cleaned_data['reason'])
+        except CaError as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
+        messages.success(self.request, 'Certificate revoked')
+        return super().form_valid(form)
+
+
 class Recreate(BreadcrumbsMixin, FormView, DetailView):
     model = models.SiteCrt
     form_class = forms.RecreationCrt
@@ -178,6 +283,10 @@ class Recreate(BreadcrumbsMixin, FormView, DetailView):
 
     def form_valid(self, form):
         self.object = models.SiteCrt.objects.get(pk=self.kwargs['pk'])
+        if settings.CA_ASYNC_ISSUANCE:
+            job = jobs.enqueue(models.IssuanceJob.SITE_CRT_RECREATE, cn=self.object.cn, pk=self.object.pk,
+                               validity_period=form.cleaned_data['validity_period'])
+            return HttpResponseRedirect(reverse('job_view', kwargs={'pk': job.pk}))
         ca = Ca()
         ca.generate_site_crt(self.object.cn, form.cleaned_data['validity_period'], self.kwargs['pk'])
         messages.success(self.request, 'Recreation success')
@@ -185,19 +294,50 @@ class Recreate(BreadcrumbsMixin, FormView, DetailView):
 
 
 class DownloadCrt(View):
+    """Cached public download format of a certificate, crt.pem, fullchain.pem or crt.der"""
+    format = 'crt.pem'
 
-    def get(self, context, **response_kwargs):
-        pk = self.kwargs['pk']
-        obj = models.SiteCrt.objects.get(pk=pk)
-        res = HttpResponse(obj.crt, content_type='application/txt')
-        res['Content-Disposition'] = 'attachment; filename={}.crt'.format(obj.cn)
-        return res
+    def get(self, request, **kwargs):
+        try:
+            return bundles.response(request, self.kwargs['pk'], self.format)
+        except models.SiteCrt.DoesNotExist:
+            raise Http404('Certificate does not exist')
+
+
+class DownloadPkcs12(BreadcrumbsMixin, FormView, DetailView):
+    model = models.SiteCrt
+    form_class = forms.DownloadPkcs12
+    template_name = 'core/certificate/download_pkcs12.html'
+
+    def get_breadcrumbs(self):
+        return (
+            ('Home', reverse('index')),
+            ('View %s' % self.object.cn, reverse('certificates_view', kwargs={'pk': self.kwargs['pk']})),
+            ('Download PKCS#12', '')
+        )
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return super().get(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return super().post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        try:
+            return bundles.pkcs12_response(self.object, form.cleaned_data['passphrase'])
+        except CaError as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
 
 
 class DownloadKey(View):
     def get(self, context, **response_kwargs):
         pk = self.kwargs['pk']
         obj = models.SiteCrt.objects.get(pk=pk)
+        if not obj.key:
+            raise Http404('Certificate was issued from a signing request, its key is kept by the client')
         res = HttpResponse(obj.key, content_type='application/txt')
         res['Content-Disposition'] = 'attachment; filename={}.key'.format(obj.cn)
         return res
@@ -0,0 +1,34 @@
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.generic import View
+
+from core import crl
+from core import models
+
+
+class Crl(View):
+    """Published CRL in DER or PEM, answers conditional requests with 304 and never signs"""
+    delta = False
+    content_types = {'der': 'application/pkix-crl', 'pem': 'application/x-pem-file'}
+
+    def get(self, request, encoding):
+        try:
+            published = crl.get(self.delta)
+        except models.RootCrt.DoesNotExist:
+            published = None
+        if published is None:
+            raise Http404('CRL is not published yet')
+
+        etag = '{}-{}"'.format(published.etag[:-1], encoding)
+        last_modified = int(published.last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(getattr(published, encoding), content_type=self.content_types[encoding])
+            response['Content-Disposition'] = 'attachment; filename={}.crl'.format(
+                'delta' if self.delta else 'root')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Expires'] = http_date(published.next_update.timestamp())
+        patch_cache_control(response, public=True)
+        return response
@@ -0,0 +1,28 @@
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.generic import DetailView
+
+from core.views.certificates import BreadcrumbsMixin
+from core import models
+
+
+class View(BreadcrumbsMixin, DetailView):
+    model = models.IssuanceJob
+    template_name = 'core/job/view.html'
+
+    def get_breadcrumbs(self):
+        return (
+            ('Home', reverse('index')),
+            ('Job %s' % self.object.pk, '')
+        )
+
+    def get_object(self, queryset=None):
+        return get_object_or_404(self.model, pk=self.kwargs['pk'])
+
+    def get_context_data(self, **kwargs):
+        if self.object.status == models.IssuanceJob.DONE:
+            if self.object.site_crt_id:
+                kwargs['result_url'] = reverse('certificates_view', kwargs={'pk': self.object.site_crt_id})
+            elif self.object.kind in (models.IssuanceJob.ROOT_CRT, models.IssuanceJob.ROOT_CRT_RECREATE):
+                kwargs['result_url'] = reverse('root_crt_view')
+        return super().get_context_data(**kwargs)
@@ -0,0 +1,38 @@
+import base64
+import hashlib
+from urllib.parse import unquote
+
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from core import ocsp
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class Responder(View):
+    """OCSP responder for GET (base64 request in the path) and POST (DER request in the body)"""
+
+    def get(self, request, encoded=''):
+        try:
+            request_der = base64.b64decode(unquote(encoded), validate=True)
+        except ValueError:
+            return self.render(ocsp.MALFORMED_REQUEST, None)
+        response = self.render(*ocsp.respond(request_der))
+        if response.has_header('Expires'):
+            patch_cache_control(response, public=True, no_transform=True, must_revalidate=True)
+        return response
+
+    def post(self, request, encoded=None):
+        return self.render(*ocsp.respond(request.body))
+
+    @staticmethod
+    def render(der, cached):
+        response = HttpResponse(der, content_type='application/ocsp-response')
+        if cached is not None:
+            response['ETag'] = '"{}"'.format(hashlib.sha1(cached.der).hexdigest())
+            response['Expires'] = http_date(cached.next_update.timestamp())
+        return response
@@ -1,7 +1,29 @@
-from rest_framework import generics, authentication, permissions
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
 
+from rest_framework import generics, authentication, negotiation, permissions, status, views
+from rest_framework.response import Response
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+
+from core import bundles
+from core import crl
+from core import crt_metadata
+from core import export
+from core import importer
 from core import models
 from core import serializers
+from core.pagination import SiteCrtCursorPagination
+from core.utils import Ca
+from core.issuance import CaError
 
 
 class SiteCrtCreate(generics.CreateAPIView):
@@ -10,10 +32,272 @@ class SiteCrtCreate(generics.CreateAPIView):
     serializer_class = serializers.SiteCrtCreate
     queryset = models.SiteCrt.objects.all()
 
+    def create(self, request, *args, **kwargs):
+        if not settings.CA_ASYNC_ISSUANCE:
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.enqueue()
+        return Response(serializers.IssuanceJob(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class SiteCrtSignCsr(generics.GenericAPIView):
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    serializer_class = serializers.SiteCrtSignCsr
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            obj = serializer.save()
+        except CaError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            return Response({'detail': 'Common name was created concurrently'}, status=status.HTTP_409_CONFLICT)
+        return Response({'id': obj.pk, 'cn': obj.cn, 'crt': obj.crt}, status=status.HTTP_201_CREATED)
+
+
+class SiteCrtRevoke(generics.GenericAPIView):
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    serializer_class = serializers.Revocation
+    queryset = models.SiteCrt.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        site_crt = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            revocation = crl.revoke(site_crt, serializer.validated_data.get('reason', models.Revocation.UNSPECIFIED))
+        except CaError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(serializers.Revocation(revocation).data, status=status.HTTP_201_CREATED)
+
+
+class DownloadContentNegotiation(negotiation.DefaultContentNegotiation):
+    """Downloads are not rendered, so any Accept header is fine"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class SiteCrtDownload(views.APIView):
+    """Certificate as crt.pem, fullchain.pem or crt.der, with ETag and Last-Modified for conditional requests"""
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    content_negotiation_class = DownloadContentNegotiation
+
+    def get(self, request, pk, output):
+        try:
+            return bundles.response(request, pk, output)
+        except models.SiteCrt.DoesNotExist:
+            raise Http404
+
+
+class SiteCrtPkcs12(generics.GenericAPIView):
+    """PKCS#12 of the key, certificate and root encrypted with the posted passphrase"""
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    content_negotiation_class = DownloadContentNegotiation
+    serializer_class = serializers.Pkcs12
+    queryset = models.SiteCrt.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        site_crt = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            return bundles.pkcs12_response(site_crt, serializer.validated_data['passphrase'])
+        except CaError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+
+class SiteCrtBulkCreate(generics.GenericAPIView):
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    serializer_class = serializers.SiteCrtBulkItem
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of certificates'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > settings.BULK_ISSUANCE_MAX_ITEMS:
+            return Response({'detail': 'No more than {} certificates per request'.format(settings.BULK_ISSUANCE_MAX_ITEMS)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(request.data)
+        valid = []
+        for index, item in enumerate(request.data):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'cn': item.get('cn') if isinstance(item, dict) else None, 'errors': serializer.errors}
+
+        existing = set(models.SiteCrt.objects.filter(cn__in=[data['cn'] for _, data in valid])
+                       .values_list('cn', flat=True))
+        issue = []
+        for index, data in valid:
+            if data['cn'] in existing:
+                results[index] = {'cn': data['cn'], 'errors': {'cn': ['Common name {} not unique'.format(data['cn'])]}}
+            else:
+                existing.add(data['cn'])
+                issue.append((index, data))
+
+        try:
+            issued = Ca().generate_site_crts([data for _, data in issue])
+        except IntegrityError:
+            return Response({'detail': 'Common names were created concurrently, retry the request'},
+                            status=status.HTTP_409_CONFLICT)
+        except models.RootCrt.DoesNotExist:
+            return Response({'detail': 'Root certificate is not configured'}, status=status.HTTP_409_CONFLICT)
+        except CaError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        ids = dict(models.SiteCrt.objects.filter(cn__in=[data['cn'] for _, data in issue]).values_list('cn', 'pk'))
+        for (index, data), (obj, error) in zip(issue, issued):
+            if error:
+                results[index] = {'cn': data['cn'], 'errors': {'non_field_errors': [error]}}
+            else:
+                results[index] = {'cn': data['cn'], 'id': ids.get(data['cn'])}
+        return Response(results)
+
 
 class SiteCrtList(generics.ListAPIView):
     authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
     permission_classes = (permissions.IsAuthenticated, )
     serializer_class = serializers.SiteCrt
-    queryset = models.SiteCrt.objects.all()
+    queryset = models.SiteCrt.objects.defer('key')
     filter_fields = ('cn', )
+    pagination_class = SiteCrtCursorPagination
+
+    def is_meta(self):
+        return self.request.query_params.get('meta') in ('1', 'true')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_meta():
+            queryset = queryset.defer('key', 'crt')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.is_meta():
+            return serializers.SiteCrtMeta
+        return super().get_serializer_class()
+
+
+class SiteCrtExpiring(views.APIView):
+    """Certificates expiring within ?days= (default 7), soonest first, as one JSON object per line
+
+    ?expired=1 also returns certificates that already expired, ?limit= bounds the response.
+    """
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    fields = ('id', 'cn', 'date_end', 'serial', 'fingerprint')
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = int(request.query_params.get('days', 7))
+            limit = min(int(request.query_params.get('limit', settings.EXPIRING_LIMIT)), settings.EXPIRING_LIMIT)
+        except ValueError:
+            return Response({'detail': 'days and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        include_expired = request.query_params.get('expired') in ('1', 'true')
+
+        rows = models.SiteCrt.objects.expiring(days, include_expired).values(*self.fields)[:limit]
+        lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows.iterator())
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+class SiteCrtLookup(views.APIView):
+    """Certificates whose alternative names cover ?host=, a host name or IP address, newest notAfter first
+
+    A host name is also matched by the wildcard of its parent domain. ?valid=1 leaves out expired
+    and revoked certificates. Answered from the SubjectAltName index alone.
+    """
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get(self, request, *args, **kwargs):
+        try:
+            names = crt_metadata.lookup_names(request.query_params.get('host', ''))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = models.SubjectAltName.objects.filter(name__in=names)
+        if request.query_params.get('valid') in ('1', 'true'):
+            rows = rows.filter(site_crt__not_after__gt=timezone.now()) \
+                .exclude(site_crt__serial__in=models.Revocation.objects.values('serial'))
+        rows = rows.order_by('-site_crt__not_after').values(
+            'name', 'site_crt_id', 'site_crt__cn', 'site_crt__serial', 'site_crt__not_after')[:settings.LOOKUP_LIMIT]
+        return Response([{
+            'id': row['site_crt_id'],
+            'cn': row['site_crt__cn'],
+            'serial': row['site_crt__serial'],
+            'not_after': row['site_crt__not_after'],
+            'matched': row['name'],
+        } for row in rows])
+
+
+class SiteCrtExport(views.APIView):
+    """Stream an archive of certificates selected by ?id= (repeatable) and ?cn=
+
+    ?archive=tar.gz or zip, ?keys=1 adds private keys, ?root=1 adds the root certificate.
+    """
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get(self, request, *args, **kwargs):
+        archive_format = request.query_params.get('archive', 'tar.gz')
+        if archive_format not in export.FORMATS:
+            return Response({'detail': 'archive must be one of {}'.format(', '.join(export.FORMATS))},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(pk) for pk in request.query_params.getlist('id')]
+        except ValueError:
+            return Response({'detail': 'id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = export.filter_queryset(ids, request.query_params.get('cn'))
+        res = StreamingHttpResponse(export.stream(
+            queryset, archive_format,
+            include_keys=request.query_params.get('keys') in ('1', 'true'),
+            include_root=request.query_params.get('root') in ('1', 'true'),
+        ), content_type=export.FORMATS[archive_format])
+        res['Content-Disposition'] = 'attachment; filename=certificates.{}'.format(archive_format)
+        return res
+
+
+class SiteCrtImport(views.APIView):
+    """Import certificates with their keys from an uploaded tar or zip archive in the "archive" field"""
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('archive')
+        if not upload:
+            return Response({'detail': 'Upload a tar or zip archive in the "archive" field'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'archive')
+            with open(path, 'wb') as f:
+                for chunk in upload.chunks():
+                    f.write(chunk)
+            try:
+                result = importer.import_files(importer.read_files(path))
+            except (tarfile.TarError, zipfile.BadZipFile) as e:
+                return Response({'detail': 'Invalid archive: {}'.format(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            shutil.rmtree(directory)
+
+        return Response({
+            'imported': result.imported,
+            'errors': [{'file': name, 'error': error} for name, error in result.errors],
+        })
+
+
+class IssuanceJobView(generics.RetrieveAPIView):
+    authentication_classes = (authentication.TokenAuthentication, authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAuthenticated, )
+    serializer_class = serializers.IssuanceJob
+    queryset = models.IssuanceJob.objects.all()
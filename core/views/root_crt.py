@@ -1,11 +1,11 @@
-from datetime import datetime
-
 from OpenSSL import crypto
 
+from django.conf import settings
 from django.contrib import messages
 from django.http import HttpResponse
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from django.urls import reverse_lazy, reverse
 from django.views.generic import TemplateView, FormView, DetailView, DeleteView
 from django.views.generic.edit import FormMixin, ContextMixin
@@ -13,6 +13,8 @@ from django.views.generic.edit import FormMixin, ContextMixin
 from core.utils import Ca
 from core import forms
 from core import models
+from core import jobs
+from core import root_cache
 
 
 class BreadcrumbsMixin(ContextMixin):
@@ -66,6 +68,7 @@ class UploadExisting(BreadcrumbsMixin, ExistsMixin, FormView):
             obj.organizational_unit_name = cert.OU
         if cert.emailAddress:
             obj.email = cert.emailAddress
+        obj.set_crt_metadata()
 
         obj.save()
 
@@ -92,10 +95,11 @@ class View(BreadcrumbsMixin, FormMixin, DetailView):
         return get_object_or_404(self.model)
 
     def get_context_data(self, **kwargs):
-        cert_data = self.object.crt.encode()
-        cert = crypto.load_certificate(crypto.FILETYPE_PEM, cert_data)
-        kwargs['cert'] = cert.get_subject()
-        kwargs['crt_validity_period'] = datetime.strptime(cert.get_notAfter().decode(), '%Y%m%d%H%M%SZ')
+        # parsed for display only, "manage.py backfill_crt_metadata" stores it
+        if not self.object.has_crt_metadata():
+            self.object.set_crt_metadata()
+        kwargs['cert'] = self.object.subject
+        kwargs['crt_validity_period'] = self.object.not_after
         return super().get_context_data(**kwargs)
 
 
@@ -127,6 +131,9 @@ class GenerateNew(BreadcrumbsMixin, ExistsMixin, FormView):
         )
 
     def form_valid(self, form):
+        if settings.CA_ASYNC_ISSUANCE:
+            job = jobs.enqueue(models.IssuanceJob.ROOT_CRT, **form.cleaned_data)
+            return HttpResponseRedirect(reverse('job_view', kwargs={'pk': job.pk}))
         ca = Ca()
         ca.generate_root_crt(form.cleaned_data)
         return super(GenerateNew, self).form_valid(form)
@@ -149,6 +156,9 @@ class Recreate(BreadcrumbsMixin, FormView, DetailView):
         return get_object_or_404(self.model)
 
     def form_valid(self, form):
+        if settings.CA_ASYNC_ISSUANCE:
+            job = jobs.enqueue(models.IssuanceJob.ROOT_CRT_RECREATE, **form.cleaned_data)
+            return HttpResponseRedirect(reverse('job_view', kwargs={'pk': job.pk}))
         ca = Ca()
         ca.generate_root_crt(form.cleaned_data, recreation=True)
         messages.success(self.request, 'Recreation success')
@@ -158,6 +168,11 @@ class Recreate(BreadcrumbsMixin, FormView, DetailView):
 class DownloadRootCrt(View):
 
     def get(self, request, *args, **kwargs):
-        res = HttpResponse(models.RootCrt.objects.get().crt, content_type='text/plain')
-        res['Content-Disposition'] = 'attachment; filename=rootCA.crt'
+        root = root_cache.get()
+        etag = '"{}"'.format(root.fingerprint[:16])
+        res = get_conditional_response(request, etag=etag)
+        if res is None:
+            res = HttpResponse(root.crt, content_type='text/plain')
+            res['Content-Disposition'] = 'attachment; filename=rootCA.crt'
+        res['ETag'] = etag
         return res
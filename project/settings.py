@@ -149,6 +149,9 @@ LOGIN_EXEMPT_URLS = (
     r'/api-token-auth/',
     r'/api/.*',
     r'/root_crt/download_crt/',
+    r'/crl/',
+    r'/acme/',
+    r'/ocsp/',
 )
 
 BRAND_NAME = 'Your company name'
@@ -160,7 +163,107 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 ROOT_CRT_PATH = 'root'
 
-ROOT_CRT_INTERFACE = [r'/root_crt/', r'/root_crt_upload_existing/', r'/generate_new/']
+# 'core.issuance.OpensslBackend' issues through the openssl command line tool
+CA_ISSUANCE_BACKEND = 'core.issuance.CryptographyBackend'
+
+# key algorithm of new certificates when none is chosen: rsa2048, rsa3072, rsa4096, ec256, ec384 or ed25519
+DEFAULT_KEY_ALGORITHM = 'rsa2048'
+
+# number of pre-generated private keys kept per algorithm, refilled by "manage.py refill_key_pool --loop"
+KEY_POOL_SIZE = {'rsa2048': 20}
+KEY_POOL_REFILL_INTERVAL = 5
+
+# processes signing certificates of api/site_crt/bulk_create/, None for one per CPU, 0 signs in the web process
+BULK_ISSUANCE_WORKERS = None
+BULK_ISSUANCE_MAX_ITEMS = 1000
+
+# processes parsing files of "manage.py import_crts" and api/site_crt/import/, None for one per CPU
+IMPORT_WORKERS = None
+
+# run issuance from the web and api through IssuanceJob, executed by "manage.py run_issuance_worker"
+CA_ASYNC_ISSUANCE = False
+ISSUANCE_WORKER_CONCURRENCY = 2
+ISSUANCE_WORKER_INTERVAL = 1
+# seconds without a heartbeat after which a running job whose worker died is claimed again, failed after
+# ISSUANCE_JOB_ATTEMPTS claims; workers refresh the heartbeat of their jobs every ISSUANCE_JOB_HEARTBEAT seconds
+ISSUANCE_JOB_TIMEOUT = 600
+ISSUANCE_JOB_ATTEMPTS = 3
+ISSUANCE_JOB_HEARTBEAT = 60
+
+# upper bound of rows returned by api/site_crt/expiring/
+EXPIRING_LIMIT = 10000
+
+# seconds a process keeps the decrypted root certificate before reading it again, None keeps it until
+# RootCrt is saved or deleted in this process
+ROOT_CRT_CACHE_TIMEOUT = 60
+
+# base URL relying parties reach this server at, e.g. "http://ca.example.com"; when set, site certificates
+# name the full CRL as their distribution point and full CRLs name the delta CRL as freshest CRL
+CA_PUBLIC_URL = None
+
+# format certificates are written in, 'pem' text or 'der' binary; rows are read back in either, so it can be
+# changed on a populated database
+CRT_STORAGE_FORMAT = 'pem'
+
+# seconds a signed CRL stays valid (nextUpdate), delta CRLs are valid for CRL_DELTA_NEXT_UPDATE seconds,
+# both are signed again by "manage.py publish_crl --loop" half way through
+CRL_NEXT_UPDATE = 7 * 24 * 60 * 60
+CRL_DELTA_NEXT_UPDATE = 24 * 60 * 60
+# revocations a delta CRL may list before the next full CRL is signed
+CRL_DELTA_MAX_ENTRIES = 1000
+# seconds a process serves a published CRL before checking for a newer one
+CRL_CACHE_TIMEOUT = 10
+CRL_PUBLISH_INTERVAL = 60
+
+# seconds a pre-signed OCSP response stays valid (nextUpdate), "manage.py refresh_ocsp --loop" signs it again
+# when less than OCSP_REFRESH_BEFORE seconds are left
+OCSP_NEXT_UPDATE = 24 * 60 * 60
+OCSP_REFRESH_BEFORE = 6 * 60 * 60
+OCSP_REFRESH_INTERVAL = 60
+# signatures per second a process makes for requests without a pre-signed response (new certificates, unknown
+# serials), further such requests get tryLater until the next second
+OCSP_SIGN_RATE = 20
+# responses a process keeps in memory, and seconds between its checks for revocations made by other processes
+OCSP_CACHE_SIZE = 100000
+OCSP_CACHE_TIMEOUT = 1
+
+# "manage.py renew_crts" renews a certificate RENEWAL_WINDOW days before date_end, delayed by a stable
+# per certificate offset below RENEWAL_SPREAD seconds, for RENEWAL_VALIDITY_PERIOD days
+RENEWAL_WINDOW = 30
+RENEWAL_SPREAD = 7 * 24 * 60 * 60
+RENEWAL_VALIDITY_PERIOD = VALIDITY_PERIOD_CRT
+RENEWAL_BATCH_SIZE = 100
+# most certificates renewed per minute, failed renewals are retried after RENEWAL_RETRY_DELAY seconds
+RENEWAL_RATE = 600
+RENEWAL_RETRY_DELAY = 60 * 60
+RENEWAL_INTERVAL = 5 * 60
+
+# ACME server at /acme/directory. ACME_CHALLENGE = 'http-01' fetches the key authorization from the identifier
+# on ACME_HTTP01_PORT, 'auto' approves clients from ACME_TRUSTED_NETWORKS without a fetch
+ACME_CHALLENGE = 'http-01'
+ACME_TRUSTED_NETWORKS = ['127.0.0.0/8', '::1/128']
+ACME_HTTP01_PORT = 80
+ACME_HTTP01_TIMEOUT = 5
+ACME_NONCE_TIMEOUT = 60 * 60
+ACME_ORDER_TIMEOUT = 7 * 24 * 60 * 60
+ACME_AUTHORIZATION_TIMEOUT = 30 * 24 * 60 * 60
+# days
+ACME_VALIDITY_PERIOD = 90
+
+# alternative names of a site certificate, its common name included
+SITE_CRT_MAX_ALT_NAMES = 100
+# most certificates returned by /api/site_crt/lookup/
+LOOKUP_LIMIT = 100
+# certificates per page of the certificates list, by default and at most with ?page_size=
+CERTIFICATES_PAGE_SIZE = 50
+CERTIFICATES_MAX_PAGE_SIZE = 500
+# seconds a process keeps the number of certificates matching a search, creating or deleting one resets it
+CERTIFICATES_COUNT_CACHE_TIMEOUT = 60
+
+# most site certificates whose public download formats are kept in memory per process
+BUNDLE_CACHE_SIZE = 10000
+
+ROOT_CRT_INTERFACE = [r'/root_crt/', r'/root_crt_upload_existing/', r'/generate_new/', r'/jobs/']
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',),